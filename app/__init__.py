@@ -1,30 +1,53 @@
 from flask import Flask
-from config import Config
+from config import config
 from jinja2 import StrictUndefined
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-import sqlalchemy as sa
-import sqlalchemy.orm as so
-from flask_migrate import Migrate
+import os
 
-app = Flask(__name__)
-app.jinja_env.undefined = StrictUndefined
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-login = LoginManager(app)
-login.login_view = 'login'
-migrate = Migrate(app, db)
+db = SQLAlchemy()
+login = LoginManager()
+login.login_view = 'auth.login'
 
-from app import views, models
-from app.debug_utils import reset_db
 
-@app.cli.command("seed-db")
-def seed_db_command():
-    """Seed the database with test data."""
-    print("Seeding database...")
-    reset_db()
-    print("Database seeded successfully!")
+def create_app(config_name=None):
+    """Build the app for a config profile (default APP_CONFIG, else development)
 
-@app.shell_context_processor
-def make_shell_context():
-    return dict(db=db, sa=sa, so=so, reset_db=reset_db)
+    Only the web app itself is set up here. The CLI commands, Flask-Migrate and the
+    development seeding tools are added by register_cli in app/cli.py, which run.py calls
+    and wsgi.py doesn't, so production workers never import them.
+    """
+    app = Flask(__name__)
+    app.jinja_env.undefined = StrictUndefined
+    app.config.from_object(config[config_name or os.environ.get('APP_CONFIG', 'development')])
+    db.init_app(app)
+    login.init_app(app, add_context_processor=False)
+
+    from app.sqlite_pragmas import apply_sqlite_pragmas
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+
+    from app import models
+    from app.principal import init_principal
+    from app.views import register_configured_blueprints
+    from app.metrics import init_metrics
+    from app.query_budget import init_query_debug
+    from app.passwords import init_passwords
+    from app.last_login import init_last_login
+    from app.alert_rules import init_alert_rules
+    from app.alert_stream import init_alert_stream
+    from app.slot_index import init_slot_index
+    from app.conditional_get import init_conditional_get
+    from app.fragment_cache import init_fragment_cache
+    init_principal(app)
+    register_configured_blueprints(app)
+    init_metrics(app, db)
+    init_query_debug(app)
+    init_passwords(app)
+    init_last_login(app, db)
+    init_alert_rules(app)
+    init_alert_stream(app)
+    init_slot_index(app)
+    init_conditional_get(app)
+    init_fragment_cache(app)
+    return app
@@ -0,0 +1,132 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import AlertState, WellbeingLog
+
+# Registered rules by name. Each one is called with the new log, the student's AlertState
+# (with the log already folded in) and its configured parameters. It returns a short
+# reason when it fires, or None.
+RULES = {}
+
+
+def rule(name):
+    """Register an alert rule under the name used in the ALERT_RULES setting"""
+    def register(fn):
+        RULES[name] = fn
+        return fn
+    return register
+
+
+@rule('low_mood')
+def low_mood(log, state, threshold=3):
+    if log.mood <= threshold:
+        return f'mood {log.mood} is {threshold} or below'
+
+
+@rule('consecutive_decline')
+def consecutive_decline(log, state, count=3):
+    if state.decline_streak >= count:
+        return f'mood fell {state.decline_streak} times in a row'
+
+
+@rule('rolling_average')
+def rolling_average(log, state, below=4, min_logs=3):
+    average, logs = state.window_average()
+    if logs >= min_logs and average < below:
+        return f'{AlertState.WINDOW_DAYS}-day average mood {average:.1f} is below {below}'
+
+
+@rule('baseline_drop')
+def baseline_drop(log, state, points=3, min_logs=5):
+    if state.previous_count >= min_logs and state.previous_baseline - log.mood >= points:
+        return f'mood {log.mood} is {state.previous_baseline - log.mood:.1f} below their usual {state.previous_baseline:.1f}'
+
+
+class AlertRuleEngine:
+    """Runs the configured rules against each wellbeing log as it is inserted
+
+    Every check reads and writes one AlertState row, so it costs the same however
+    long the student's history is.
+    """
+
+    def __init__(self):
+        self.configure([('low_mood', {})], 0.2)
+
+    def configure(self, rules, baseline_alpha):
+        unknown = [name for name, _ in rules if name not in RULES]
+        if unknown:
+            raise ValueError(f"Unknown alert rules: {', '.join(unknown)}")
+        self.rules = [(RULES[name], params) for name, params in rules]
+        self.baseline_alpha = baseline_alpha
+
+    def evaluate(self, connection, log):
+        """Update the student's state with log and set its alert flag and reason"""
+        if log.date_logged is None:
+            log.date_logged = datetime.utcnow()
+        state = AlertState.load(connection, log.user_id)
+        reasons = self.check(log, state)
+        # a flag set explicitly by the caller is kept
+        log.alert_flag = bool(log.alert_flag) or bool(reasons)
+        if reasons:
+            log.alert_reason = '; '.join(reasons)[:255]
+        state.save(connection)
+        return reasons
+
+    def check(self, log, state):
+        """Fold log into state and return the reasons the rules fire for it"""
+        state.observe(log.mood, log.date_logged.date(), self.baseline_alpha)
+        return [reason for reason in (fn(log, state, **params) for fn, params in self.rules) if reason]
+
+    def rebuild(self, user_id=None, students_per_chunk=1000):
+        """Replay the logs through the rules, oldest first, recomputing each flag and AlertState
+
+        For backfilling after bulk loads that bypass the ORM, like MoodRollup.rebuild. The
+        logs are read a chunk of students at a time and the results written back with
+        executemany. Flags set by a caller rather than a rule are not kept. The caller commits.
+        """
+        connection = db.session.connection()
+        logs = WellbeingLog.__table__
+        states = AlertState.__table__
+        students = sa.select(logs.c.user_id).distinct().order_by(logs.c.user_id)
+        delete = sa.delete(states)
+        if user_id is not None:
+            students = students.where(logs.c.user_id == user_id)
+            delete = delete.where(states.c.user_id == user_id)
+        connection.execute(delete)
+        user_ids = connection.execute(students).scalars().all()
+
+        update = sa.update(logs).where(logs.c.id == sa.bindparam('b_id')) \
+            .values(alert_flag=sa.bindparam('b_flag'), alert_reason=sa.bindparam('b_reason'))
+        for start in range(0, len(user_ids), students_per_chunk):
+            chunk = user_ids[start:start + students_per_chunk]
+            rows = connection.execute(
+                sa.select(logs.c.id, logs.c.user_id, logs.c.mood, logs.c.date_logged)
+                .where(logs.c.user_id.in_(chunk))
+                .order_by(logs.c.user_id, logs.c.date_logged, logs.c.id)
+            ).all()
+            replayed = {}
+            updates = []
+            for log in rows:
+                state = replayed.get(log.user_id)
+                if state is None:
+                    state = replayed[log.user_id] = AlertState(user_id=log.user_id, log_count=0, decline_streak=0)
+                reasons = self.check(log, state)
+                updates.append(dict(b_id=log.id, b_flag=bool(reasons), b_reason='; '.join(reasons)[:255] or None))
+            if updates:
+                connection.execute(update, updates)
+                AlertState.save_all(connection, replayed.values())
+
+
+alert_rules = AlertRuleEngine()
+
+
+@sa.event.listens_for(WellbeingLog, 'before_insert')
+def evaluate_alert_rules(mapper, connection, log):
+    alert_rules.evaluate(connection, log)
+
+
+def init_alert_rules(app):
+    """Set up the alert rule engine from the ALERT_RULES settings"""
+    alert_rules.configure(app.config['ALERT_RULES'], app.config['ALERT_BASELINE_ALPHA'])
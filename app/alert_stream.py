@@ -0,0 +1,131 @@
+import json
+import queue
+import threading
+from bisect import insort
+from collections import deque
+
+
+class AlertStreamFull(RuntimeError):
+    """Raised when the stream already has as many subscribers as it allows"""
+
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+
+class AlertBroker:
+    """In-process fan-out of new alerts to the staff watching the alerts page
+
+    Each subscriber has its own bounded queue, so publishing never waits on a slow
+    client. If a queue is full, that subscriber is closed and its stream ends. The
+    browser's EventSource then reconnects with Last-Event-ID and catches up from the
+    backlog of recent events. The broker lives in one process, so with several worker
+    processes each sees only the alerts created in it.
+    """
+
+    def __init__(self, queue_size=100, backlog=500, max_subscribers=100):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.configure(queue_size, backlog, max_subscribers)
+
+    def configure(self, queue_size, backlog, max_subscribers):
+        self.queue_size = queue_size
+        self.backlog = deque(maxlen=backlog)
+        # id of the newest event that has fallen out of the backlog
+        self.evicted_through = 0
+        self.max_subscribers = max_subscribers
+
+    def publish(self, event_id, data, event='alert'):
+        """Send an event to every subscriber
+
+        Events are published after their transaction commits, on whichever request thread
+        made them, so ids can arrive out of order. The backlog is kept sorted by id, so a
+        client resuming after a later id than this one may see it again, but never misses it.
+        """
+        message = (event_id, event, json.dumps(data))
+        with self.lock:
+            if len(self.backlog) == self.backlog.maxlen:
+                if event_id < self.backlog[0][0]:
+                    # older than everything kept, so it falls straight out of the backlog
+                    self.evicted_through = max(self.evicted_through, event_id)
+                else:
+                    self.evicted_through = max(self.evicted_through, self.backlog.popleft()[0])
+            if event_id > self.evicted_through:
+                insort(self.backlog, message, key=lambda message: message[0])
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    self._close(subscriber)
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber, queueing any backlog events after last_event_id
+
+        If events after last_event_id have already left the backlog, a 'reload' event is
+        queued instead, telling the client to fetch the page again.
+        """
+        subscriber = Subscriber(self.queue_size)
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise AlertStreamFull('Too many alert stream subscribers')
+            if last_event_id is not None:
+                missed = [message for message in self.backlog if message[0] > last_event_id]
+                if last_event_id < self.evicted_through or len(missed) > self.queue_size:
+                    missed = [(self.backlog[-1][0], 'reload', '{}')]
+                for message in missed:
+                    subscriber.queue.put_nowait(message)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self._close(subscriber)
+
+    def _close(self, subscriber):
+        subscriber.closed = True
+        self.subscribers.discard(subscriber)
+
+    def stream(self, subscriber, heartbeat=15):
+        """Yield the subscriber's events in text/event-stream format until it is closed
+
+        A comment line is sent when nothing has happened for heartbeat seconds, so proxies
+        keep the connection open and a dead client is noticed on the next write.
+        """
+        try:
+            # ask the browser to reconnect quickly if the stream ends
+            yield 'retry: 3000\n\n'
+            while not subscriber.closed or not subscriber.queue.empty():
+                try:
+                    event_id, event, data = subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def alert_event(log):
+    """The data sent to the alert stream for a flagged log"""
+    return {
+        "id": log.id,
+        "user_id": log.user_id,
+        "date_logged": log.date_logged.strftime("%Y-%m-%d %H:%M"),
+        "mood": log.mood,
+        "symptoms": log.symptoms,
+        "reason": log.alert_reason,
+    }
+
+
+alert_broker = AlertBroker()
+
+
+def init_alert_stream(app):
+    """Size the alert broker from the ALERT_STREAM_* settings"""
+    alert_broker.configure(
+        app.config['ALERT_STREAM_QUEUE_SIZE'],
+        app.config['ALERT_STREAM_BACKLOG'],
+        app.config['ALERT_STREAM_MAX_SUBSCRIBERS'],
+    )
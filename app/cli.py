@@ -0,0 +1,148 @@
+import time
+
+import click
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db
+
+
+def register_cli(app):
+    """Add the flask CLI commands, Flask-Migrate's `flask db` and the shell context to the app"""
+    from flask_migrate import Migrate
+    Migrate(app, db)
+    for command in (seed_db_command, approve_referrals_command, import_csv_command, materialize_slots_command,
+                    jobs_group):
+        app.cli.add_command(command)
+    app.shell_context_processor(make_shell_context)
+
+
+@click.command("seed-db")
+@with_appcontext
+@click.option("--students", default=0, help="Number of synthetic students to add.")
+@click.option("--counsellors", default=0, help="Number of synthetic counsellors to add.")
+@click.option("--weeks", default=1, help="Weeks of appointment slots to create.")
+@click.option("--logs-per-student", default=0, help="Wellbeing logs to create for each synthetic student.")
+@click.option("--referrals", default=0, help="Synthetic students to put on the counselling waitlist.")
+@click.option("--seed", default=42, help="Random seed, so the same sizes always give the same data.")
+def seed_db_command(students, counsellors, weeks, logs_per_student, referrals, seed):
+    """Seed the database with test data, optionally scaled up for load testing."""
+    from app.debug_utils import reset_db, seed_synthetic
+    print("Seeding database...")
+    started = time.perf_counter()
+    reset_db()
+    if students or counsellors or weeks > 1:
+        print("  - Seeding synthetic load-test data...")
+        seed_synthetic(students=students, counsellors=counsellors, weeks=weeks,
+                       logs_per_student=logs_per_student, referrals=referrals, seed=seed)
+    print(f"Database seeded successfully in {time.perf_counter() - started:.1f}s!")
+
+
+@click.command("approve-referrals")
+@with_appcontext
+@click.option("--student-id", "student_ids", multiple=True, type=int, help="Approve this student's referral (repeatable).")
+@click.option("--referred-before", type=click.DateTime(formats=["%Y-%m-%d"]), help="Approve referrals made before this date.")
+@click.option("--top", type=int, help="Approve only the N highest-priority matching referrals.")
+def approve_referrals_command(student_ids, referred_before, top):
+    """Move waitlist referrals to approved referrals in one transaction."""
+    from app.models import ApprovedReferrals
+    if not (student_ids or referred_before or top):
+        raise click.UsageError("Give --student-id, --referred-before or --top.")
+    started = time.perf_counter()
+    result = ApprovedReferrals.approve_many(student_ids=list(student_ids) or None,
+                                            referred_before=referred_before, top=top)
+    print(f"Approved {result.approved} referrals ({result.already_approved} already approved) "
+          f"in {time.perf_counter() - started:.2f}s.")
+
+
+@click.command("import-csv")
+@with_appcontext
+@click.argument("kind", type=click.Choice(["students", "slots"]))
+@click.argument("path", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--batch-size", default=None, type=int, help="Rows per insert batch (default IMPORT_BATCH_SIZE).")
+def import_csv_command(kind, path, batch_size):
+    """Import students or counsellor slots from a CSV file, streaming it a batch at a time."""
+    from app.importer import import_csv, ImportFormatError
+    config = current_app.config
+    started = time.perf_counter()
+    try:
+        result = import_csv(kind, path, batch_size or config["IMPORT_BATCH_SIZE"], config["IMPORT_MAX_ERRORS"])
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    for line, message in result.errors:
+        print(f"  line {line}: {message}")
+    if result.error_count > len(result.errors):
+        print(f"  ...and {result.error_count - len(result.errors)} more errors")
+    print(f"Imported {result.inserted} of {result.rows} {kind} rows in {time.perf_counter() - started:.1f}s.")
+    if result.failed:
+        raise click.ClickException(result.failed)
+
+
+@click.command("materialize-slots")
+@with_appcontext
+@click.option("--weeks", default=None, type=int, help="Weeks ahead to fill (default SLOT_HORIZON_WEEKS).")
+@click.option("--every", default=0, type=int, help="Keep running, topping the slots up every this many seconds.")
+def materialize_slots_command(weeks, every):
+    """Create appointment slots from counsellor availability, skipping those that exist."""
+    from app.models import Appointment
+    while True:
+        started = time.perf_counter()
+        created = Appointment.materialize_slots(weeks or current_app.config["SLOT_HORIZON_WEEKS"],
+                                                slot_minutes=current_app.config["SLOT_MINUTES"])
+        print(f"Created {created} slots in {time.perf_counter() - started:.2f}s.")
+        if not every:
+            break
+        time.sleep(every)
+
+
+@click.group("jobs")
+def jobs_group():
+    """Run and queue background jobs."""
+
+
+@jobs_group.command("worker")
+@with_appcontext
+@click.option("--threads", default=None, type=int, help="Jobs to run at once (default JOB_WORKER_THREADS).")
+@click.option("--burst", is_flag=True, help="Exit once no jobs are due instead of waiting for more.")
+def jobs_worker_command(threads, burst):
+    """Run queued jobs, and schedule the recurring ones in JOB_SCHEDULE."""
+    import signal
+    from app.jobs import JobWorker, schedule_recurring
+    config = current_app.config
+    schedule_recurring(config["JOB_SCHEDULE"])
+    worker = JobWorker(current_app._get_current_object(), threads or config["JOB_WORKER_THREADS"],
+                       config["JOB_POLL_INTERVAL"], burst=burst)
+    # finish the running jobs on Ctrl+C or a service manager's SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    print(f"Worker started with {worker.threads} threads.")
+    try:
+        count = worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+        raise
+    print(f"Worker stopped after {count} jobs.")
+
+
+@jobs_group.command("enqueue")
+@with_appcontext
+@click.argument("name")
+@click.option("--args", "args", default="{}", help="Keyword arguments for the task, as a JSON object.")
+@click.option("--priority", default=0, help="Higher runs first.")
+@click.option("--delay", default=0, help="Seconds to wait before running it.")
+def jobs_enqueue_command(name, args, priority, delay):
+    """Queue a run of a task."""
+    import json
+    from app.jobs import enqueue
+    try:
+        job = enqueue(name, json.loads(args), priority=priority, delay=delay)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    print(f"Queued job {job.id} ({name}).")
+
+
+def make_shell_context():
+    from app.debug_utils import reset_db, seed_synthetic
+    return dict(db=db, sa=sa, so=so, reset_db=reset_db, seed_synthetic=seed_synthetic)
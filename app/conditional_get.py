@@ -0,0 +1,131 @@
+import hashlib
+import time
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import g, has_request_context, request, session
+from werkzeug.http import is_resource_modified
+
+from app.models import TableVersion
+from app.principal import get_principal
+
+# the tables whose changes are counted, set from CONDITIONAL_GET by init_conditional_get
+versioned_tables = set()
+
+
+def _tables_of(instances):
+    return {table.name for instance in instances for table in sa.inspect(instance).mapper.tables}
+
+
+def _changed(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+@sa.event.listens_for(so.Session, 'after_flush')
+def _note_flushed_tables(session, flush_context):
+    changed = _tables_of(session.new) | _tables_of(session.dirty) | _tables_of(session.deleted)
+    _changed(session).update(changed & versioned_tables)
+
+
+@sa.event.listens_for(so.Session, 'do_orm_execute')
+def _note_executed_tables(orm_execute_state):
+    """Note bulk INSERT/UPDATE/DELETE statements run through the session, which skip the flush"""
+    statement = orm_execute_state.statement
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    if statement.table.name not in versioned_tables:
+        return None
+    result = orm_execute_state.invoke_statement()
+    # ORM bulk inserts return no rowcount; count those as a change
+    if getattr(result, 'rowcount', None) != 0:
+        _changed(orm_execute_state.session).add(statement.table.name)
+    return result
+
+
+@sa.event.listens_for(so.Session, 'before_commit')
+def _bump_changed_tables(session):
+    """Count the transaction's changes with one statement, just before it commits"""
+    # the commit's own flush comes after this event, so run it now to see its changes
+    session.flush()
+    changed = session.info.pop('changed_tables', None)
+    if changed:
+        TableVersion.bump(session.connection(), changed)
+        if has_request_context():
+            g.pop('table_versions', None)
+
+
+@sa.event.listens_for(so.Session, 'after_rollback')
+def _forget_changed_tables(session):
+    session.info.pop('changed_tables', None)
+
+
+def current_versions(tables):
+    """Return {name: (version, modified_at)} for the tables, read at most once per request"""
+    if not has_request_context():
+        return TableVersion.read(tables)
+    known = g.setdefault('table_versions', {})
+    missing = [table for table in tables if table not in known]
+    if missing:
+        read = TableVersion.read(missing)
+        known.update((table, read.get(table)) for table in missing)
+    return {table: known[table] for table in tables if known[table] is not None}
+
+
+def page_etag(tables, principal, window):
+    """Return (ETag, Last-Modified) for the current page, from one primary key lookup
+
+    The ETag changes whenever one of the tables does, and also every window seconds so
+    that forms on a page are rendered again before their CSRF tokens expire.
+    """
+    versions = current_versions(tables)
+    key = repr((
+        sorted(versions.items()),
+        principal.id,
+        principal.role,
+        request.full_path,
+        int(time.time() // window),
+    ))
+    last_modified = max((modified_at for _, modified_at in versions.values()), default=None)
+    return hashlib.sha1(key.encode()).hexdigest(), last_modified
+
+
+def init_conditional_get(app):
+    """Answer repeat GETs of the CONDITIONAL_GET pages with 304 Not Modified when nothing has changed
+
+    The check runs before the view, so an unchanged page costs no list queries and no
+    rendering.
+    """
+    pages = app.config['CONDITIONAL_GET']
+    versioned_tables.clear()
+    versioned_tables.update(table for tables in pages.values() for table in tables)
+
+    @app.before_request
+    def check_not_modified():
+        tables = pages.get(request.endpoint)
+        if tables is None or request.method not in ('GET', 'HEAD'):
+            return None
+        principal = get_principal()
+        # a pending flash message has to be shown, so the page must be rendered
+        if principal is None or session.get('_flashes'):
+            return None
+        g.page_etag = page_etag(tables, principal, app.config['CONDITIONAL_GET_WINDOW'])
+        etag, last_modified = g.page_etag
+        if not is_resource_modified(request.environ, etag=etag):
+            response = app.response_class(status=304)
+            return _cache_headers(response, etag, last_modified)
+        return None
+
+    @app.after_request
+    def add_etag(response):
+        if response.status_code == 200 and 'page_etag' in g:
+            _cache_headers(response, *g.page_etag)
+        return response
+
+
+def _cache_headers(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # browsers may keep the page but must check it is still current before showing it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,7 +1,16 @@
 from app import db
-from app.models import User, Student, Counsellor, WellbeingStaff, Admin, WellbeingLog, CounsellorAvailability, Appointment
-from werkzeug.security import generate_password_hash
+from app.passwords import hasher
+from app.slot_index import slot_index
+from app.fragment_cache import fragment_cache
+from app.alert_rules import alert_rules
+from app.models import User, Student, Counsellor, WellbeingStaff, Admin, WellbeingLog, CounsellorAvailability, Appointment, \
+    CounsellingWaitlist, MoodRollup
 from datetime import datetime, timedelta, time
+from itertools import islice
+import random
+import sqlalchemy as sa
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
 
 def reset_db():
     """Reset the database and seed with test data
@@ -19,6 +28,8 @@ def reset_db():
     seed_users()
     print("  - Seeding appointments...")
     seed_appointments()
+    slot_index.invalidate()
+    fragment_cache.clear()
     print("  ✓ Database reset and seeded successfully!")
 
 def seed_users():
@@ -73,7 +84,7 @@ def seed_users():
 
     # Add availabilities for counsellor
     print("    Creating counsellor availabilities...")
-    for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']:
+    for day in WEEKDAYS:
         availability = CounsellorAvailability(
             counsellor_id=counsellor.id,
             day_of_week=day,
@@ -85,52 +96,112 @@ def seed_users():
     db.session.commit()
     print("    ✓ Counsellor availabilities created")
 
-def seed_appointments():
-    day_name_to_num = {
-        'Monday': 0, 'Tuesday': 1, 'Wednesday': 2,
-        'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6
-    }
-
-    today = datetime.today()
-
-    availabilities = CounsellorAvailability.query.all()
-
-    for availability in availabilities:
-        counsellor = availability.counsellor
-        day_of_week = availability.day_of_week
-        start_time = availability.start_time
-        end_time = availability.end_time
-
-
-        target_weekday = day_name_to_num[day_of_week]
-        days_ahead = (target_weekday - today.weekday() + 7) % 7
-        if days_ahead == 0:
-            days_ahead = 7
+def seed_appointments(weeks=1):
+    """Create 30-minute Available slots from every counsellor availability for the coming weeks"""
+    return Appointment.materialize_slots(weeks)
 
-        appointment_date = today + timedelta(days=days_ahead)
+def seed_synthetic(students=0, counsellors=0, weeks=1, logs_per_student=0, referrals=0, seed=42, batch_size=50000):
+    """Bulk-load a synthetic, production-sized dataset for load testing and profiling
 
-        start_datetime = datetime.combine(appointment_date.date(), start_time)
-        end_datetime = datetime.combine(appointment_date.date(), end_time)
-
-        current_start = start_datetime
-        while current_start + timedelta(minutes=30) <= end_datetime:
-            existing_appointment = Appointment.query.filter(
-                Appointment.counsellor_id == counsellor.id,
-                Appointment.start_time == current_start
-            ).first()
-
-            if not existing_appointment:
-                appointment = Appointment(
-                    student_id=None,
-                    counsellor_id=counsellor.id,
-                    day=day_of_week,
-                    start_time=current_start,
-                    end_time=current_start + timedelta(minutes=30),
-                    reason=None,
-                    status='Available'
-                )
-                db.session.add(appointment)
+    The same seed always produces the same data. Rows are written with set-based
+    executemany inserts in batches of batch_size, so a 100k-student, multi-million-log
+    database builds in seconds. The logs are then replayed through the alert rules to set
+    their flags and each student's AlertState, which costs about 75 microseconds a log.
+    Every synthetic account shares the password 'password123'.
+    Hashing it once avoids paying the slow password hash per user.
+    """
+    rng = random.Random(seed)
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # a large page cache keeps index maintenance in memory during the bulk load
+        db.session.execute(sa.text('PRAGMA cache_size = -262144'))
+    password_hash = hasher.hash('password123')
+    next_id = (db.session.scalar(sa.select(sa.func.max(User.id))) or 0) + 1
+
+    print(f"    Creating {counsellors} counsellors...")
+    counsellor_ids = list(range(next_id, next_id + counsellors))
+    next_id += counsellors
+    _insert_batches(User.__table__, (
+        dict(id=uid, username=f'load_counsellor{uid}', email=f'load_counsellor{uid}@example.com',
+             password_hash=password_hash, type='counsellor')
+        for uid in counsellor_ids
+    ), batch_size)
+    _insert_batches(Counsellor.__table__, (
+        dict(id=uid, specialization=rng.choice(['Anxiety and Depression', 'Stress', 'Grief', 'Relationships']))
+        for uid in counsellor_ids
+    ), batch_size)
+    _insert_batches(CounsellorAvailability.__table__, (
+        dict(counsellor_id=uid, day_of_week=day, start_time=time(9, 0), end_time=time(17, 0))
+        for uid in counsellor_ids for day in WEEKDAYS
+    ), batch_size)
+
+    print(f"    Creating {students} students...")
+    student_ids = list(range(next_id, next_id + students))
+    _insert_batches(User.__table__, (
+        dict(id=uid, username=f'load_student{uid}', email=f'load_student{uid}@example.com',
+             password_hash=password_hash, type='student')
+        for uid in student_ids
+    ), batch_size)
+    _insert_batches(Student.__table__, (
+        dict(id=uid, student_id=str(1000000 + uid), course=rng.choice(['Computer Science', 'History', 'Medicine', 'Law']),
+             year_of_study=rng.randint(1, 4))
+        for uid in student_ids
+    ), batch_size)
+
+    print(f"    Creating {weeks} weeks of slots...")
+    slot_count = seed_appointments(weeks=weeks)
+    print(f"    ✓ {slot_count} slots")
+
+    print(f"    Creating {logs_per_student} logs per student...")
+    now = datetime.utcnow()
+    if students and logs_per_student:
+        # building the indexes once afterwards is far cheaper than updating them row by row
+        connection = db.session.connection()
+        for index in WellbeingLog.__table__.indexes:
+            index.drop(connection)
+        _insert_synthetic_logs(student_ids[0], student_ids[-1], logs_per_student, seed, now)
+        for index in WellbeingLog.__table__.indexes:
+            index.create(connection)
+        # the bulk insert skipped the alert rules, so run them over the logs now, before
+        # the rollups count the alerts
+        alert_rules.rebuild()
+    MoodRollup.rebuild()
+
+    print(f"    Creating {referrals} referrals...")
+    _insert_batches(CounsellingWaitlist.__table__, (
+        dict(student_id=str(1000000 + uid), student_name=f'Load Student {uid}',
+             referral_info='Synthetic referral for load testing',
+             referral_date=now - timedelta(days=rng.randint(0, 60), minutes=rng.randint(0, 1440)))
+        for uid in student_ids[:referrals]
+    ), batch_size)
+    db.session.commit()
+    CounsellingWaitlist.refresh_priorities()
 
-            current_start += timedelta(minutes=30)
+def _insert_synthetic_logs(first_id, last_id, count, seed, now):
+    """Generate count logs per student in one INSERT ... SELECT, entirely inside SQLite
 
-    db.session.commit()
+    Mood is a per-student baseline plus noise, both hashed from the seed, the student and
+    the entry number, so the same seed always gives the same logs. Logs are spaced a day
+    apart ending at now. Dates are written in the same format SQLAlchemy uses, so they
+    sort and compare correctly against ORM-written rows.
+    """
+    entries = sa.select(sa.literal(1).label('n')).cte('entries', recursive=True)
+    entries = entries.union_all(sa.select(entries.c.n + 1).where(entries.c.n < count))
+
+    student = Student.__table__.c.id
+    baseline = 4 + (student * 2654435761 + seed) % 4
+    noise = (student * 1000003 + entries.c.n * 7919 + seed * 31) % 7 - 3
+    first_day = (now - timedelta(days=count)).strftime('%Y-%m-%d %H:%M:%S')
+    logged = sa.func.datetime(first_day, '+' + sa.cast(entries.c.n, sa.String) + ' days') + '.000000'
+
+    db.session.execute(sa.insert(WellbeingLog).from_select(
+        ['user_id', 'mood', 'symptoms', 'date_logged', 'alert_flag'],
+        sa.select(student, baseline + noise, sa.literal('Synthetic entry'), logged, sa.false())
+        .select_from(Student.__table__.join(entries, sa.true()))
+        .where(student.between(first_id, last_id)),
+    ))
+
+def _insert_batches(table, rows, batch_size):
+    """executemany the rows into table, batch_size at a time, without building them all in memory"""
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        db.session.execute(sa.insert(table), batch)
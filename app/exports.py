@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+
+from app.models import WellbeingLog, CounsellingWaitlist, ApprovedReferrals, Appointment
+
+
+@dataclass
+class Export:
+    """A table staff can download: the columns to select, who may see it and what to filter on"""
+    columns: list
+    roles: tuple
+    date_column: sa.Column
+    order_by: list
+    where: list = field(default_factory=list)
+    # narrows the rows to what the given principal may see, e.g. a counsellor's own appointments
+    scope: Optional[Callable] = None
+
+    def query(self, principal, start=None, end=None):
+        query = sa.select(*self.columns).where(*self.where).order_by(*self.order_by)
+        if self.scope is not None:
+            query = self.scope(query, principal)
+        if start is not None:
+            query = query.where(self.date_column >= start)
+        if end is not None:
+            query = query.where(self.date_column < end)
+        return query
+
+
+def _own_appointments(query, principal):
+    if principal.role == 'counsellor':
+        return query.where(Appointment.counsellor_id == principal.id)
+    return query
+
+
+log_columns = [WellbeingLog.id, WellbeingLog.user_id, WellbeingLog.date_logged, WellbeingLog.mood,
+               WellbeingLog.symptoms, WellbeingLog.alert_flag, WellbeingLog.alert_reason]
+
+EXPORTS = {
+    'wellbeing_logs': Export(
+        columns=log_columns,
+        roles=('counsellor', 'wellbeing_staff'),
+        date_column=WellbeingLog.date_logged,
+        order_by=[WellbeingLog.date_logged, WellbeingLog.id],
+    ),
+    'alerts': Export(
+        columns=log_columns,
+        roles=('counsellor', 'wellbeing_staff'),
+        date_column=WellbeingLog.date_logged,
+        order_by=[WellbeingLog.date_logged, WellbeingLog.id],
+        where=[WellbeingLog.alert_flag.is_(True)],
+    ),
+    'waitlist': Export(
+        columns=[CounsellingWaitlist.student_id, CounsellingWaitlist.student_name, CounsellingWaitlist.referral_info,
+                 CounsellingWaitlist.referral_date, CounsellingWaitlist.triage_days],
+        roles=('wellbeing_staff',),
+        date_column=CounsellingWaitlist.referral_date,
+        order_by=[CounsellingWaitlist.priority_key.desc(), CounsellingWaitlist.student_id],
+    ),
+    'approved_referrals': Export(
+        columns=[ApprovedReferrals.student_id, ApprovedReferrals.student_name, ApprovedReferrals.referral_info,
+                 ApprovedReferrals.referral_date, ApprovedReferrals.approved_date],
+        roles=('wellbeing_staff',),
+        date_column=ApprovedReferrals.approved_date,
+        order_by=[ApprovedReferrals.approved_date, ApprovedReferrals.student_id],
+    ),
+    'appointments': Export(
+        columns=[Appointment.id, Appointment.counsellor_id, Appointment.student_id, Appointment.start_time,
+                 Appointment.end_time, Appointment.status, Appointment.reason],
+        roles=('counsellor', 'wellbeing_staff'),
+        date_column=Appointment.start_time,
+        order_by=[Appointment.start_time, Appointment.id],
+        scope=_own_appointments,
+    ),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(session, query, fmt, batch_size=1000):
+    """Yield the query's rows as CSV or NDJSON text, one batch of rows per chunk
+
+    Rows are fetched from the cursor batch_size at a time and never all held in memory,
+    so exporting a table of any size uses the same memory.
+    """
+    result = session.execute(query.execution_options(yield_per=batch_size))
+    keys = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(keys)
+
+    for rows in result.partitions():
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow([_value(value) for value in row])
+            else:
+                buffer.write(json.dumps(dict(zip(keys, map(_value, row)))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from app.conditional_get import current_versions
+
+
+class MemoryBackend:
+    """Least-recently-used fragments in this process, up to max_bytes of HTML"""
+
+    def __init__(self, max_bytes):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            if len(html) > self.max_bytes:
+                return
+            self.entries[key] = html
+            self.size += len(html)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class SQLiteBackend:
+    """Fragments in a SQLite file, shared by every worker process on the machine
+
+    The oldest fragments are deleted once the file holds more than max_bytes of HTML.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS fragments '
+                               '(key TEXT PRIMARY KEY, html TEXT NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_fragments_stored_at ON fragments (stored_at)')
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute('SELECT html FROM fragments WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, html):
+        if len(html) > self.max_bytes:
+            return
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO fragments (key, html, size, stored_at) VALUES (?, ?, ?, ?)',
+                               (key, html, len(html), time.time()))
+            # walk back from the newest fragment, keeping those that fit in max_bytes
+            connection.execute(
+                'DELETE FROM fragments WHERE stored_at < (SELECT coalesce(min(stored_at), 0) FROM '
+                '(SELECT stored_at, sum(size) OVER (ORDER BY stored_at DESC) AS total FROM fragments) '
+                'WHERE total <= ?)',
+                (self.max_bytes,),
+            )
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM fragments')
+
+
+class FragmentCache:
+    """Rendered HTML fragments shared by everyone viewing the same data
+
+    A fragment is keyed on its name, the version of each table it is built from (see
+    TableVersion) and whatever else it varies on, such as the page number. Any write to
+    one of those tables changes the key, so the next viewer renders it again and the old
+    copy ages out of the backend. Fragments must not contain anything specific to the
+    viewer.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend(8 * 1024 * 1024)
+
+    def configure(self, backend):
+        self.backend = backend
+
+    def key(self, name, tables, vary):
+        versions = current_versions(tables)
+        return repr((name, sorted(versions.items()), vary))
+
+    def render(self, name, tables, render, *vary):
+        """Return the cached fragment, or call render() to make it and cache the result"""
+        key = self.key(name, tables, vary)
+        html = self.backend.get(key)
+        if html is None:
+            html = str(render())
+            self.backend.set(key, html)
+        return Markup(html)
+
+    def clear(self):
+        self.backend.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def init_fragment_cache(app):
+    """Choose the fragment cache backend from FRAGMENT_CACHE_BACKEND ('memory' or 'sqlite')"""
+    max_bytes = app.config['FRAGMENT_CACHE_MAX_BYTES']
+    if app.config['FRAGMENT_CACHE_BACKEND'] == 'sqlite':
+        fragment_cache.configure(SQLiteBackend(app.config['FRAGMENT_CACHE_PATH'], max_bytes))
+    else:
+        fragment_cache.configure(MemoryBackend(max_bytes))
@@ -0,0 +1,315 @@
+import csv
+import os
+import re
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import User, Student, Counsellor, Appointment
+from app.slot_index import CounsellorTimeline
+
+
+class ImportFormatError(ValueError):
+    """Raised when a file can't be imported at all, e.g. it is missing required columns"""
+
+
+class UploadsFull(Exception):
+    """Raised when UPLOAD_FOLDER holds as much upload data as it is allowed to"""
+
+
+@dataclass
+class ImportResult:
+    kind: str
+    rows: int = 0
+    inserted: int = 0
+    error_count: int = 0
+    # (line number, message) for the first max_errors rejected rows
+    errors: list = field(default_factory=list)
+    max_errors: int = 100
+    # why the file stopped being readable part way through, if it did
+    failed: str = None
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'error_count': self.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+            'failed': self.failed,
+        }
+
+
+def _required(row, name):
+    value = (row.get(name) or '').strip()
+    if not value:
+        raise ValueError(f'{name} is required')
+    return value
+
+
+class StudentImporter:
+    """Student accounts: username, email, student_id, and optionally course and year_of_study
+
+    Imported students have no password; they sign in once one is set for them.
+    """
+    required = ('username', 'email', 'student_id')
+
+    def validate(self, row):
+        values = {name: _required(row, name) for name in self.required}
+        if '@' not in values['email']:
+            raise ValueError(f"invalid email {values['email']!r}")
+        values['course'] = (row.get('course') or '').strip() or None
+        year = (row.get('year_of_study') or '').strip()
+        if year:
+            if not year.isdigit() or not 1 <= int(year) <= 7:
+                raise ValueError(f'year_of_study must be a number from 1 to 7, not {year!r}')
+            year = int(year)
+        values['year_of_study'] = year or None
+        return values
+
+    def insert(self, batch, result):
+        """Insert the valid rows of one batch, reporting those that clash with existing accounts"""
+        usernames = [values['username'] for _, values in batch]
+        emails = [values['email'] for _, values in batch]
+        taken = set()
+        for username, email in db.session.execute(
+                sa.select(User.username, User.email).where(sa.or_(User.username.in_(usernames), User.email.in_(emails)))):
+            taken.update((('username', username), ('email', email)))
+        taken.update(('student_id', student_id) for student_id in db.session.scalars(
+            sa.select(Student.student_id).where(Student.student_id.in_([values['student_id'] for _, values in batch]))))
+
+        rows = []
+        for line, values in batch:
+            clash = next((name for name in self.required if (name, values[name]) in taken), None)
+            if clash:
+                result.error(line, f'{clash} {values[clash]!r} already exists')
+                continue
+            taken.update((name, values[name]) for name in self.required)
+            rows.append(values)
+        if not rows:
+            return 0
+
+        # joined-table inheritance needs the users row's id for the students row. The
+        # database assigns them and one multi-row INSERT ... RETURNING hands them back, keyed
+        # by the unique username, so concurrent signups and imports can't pick the same ids
+        users = User.__table__
+        user_ids = dict(db.session.execute(
+            sa.insert(users).returning(users.c.username, users.c.id),
+            [dict(username=v['username'], email=v['email'], type='student') for v in rows],
+        ).all())
+        db.session.execute(sa.insert(Student.__table__), [
+            dict(id=user_ids[v['username']], student_id=v['student_id'], course=v['course'],
+                 year_of_study=v['year_of_study'])
+            for v in rows
+        ])
+        return len(rows)
+
+
+class SlotImporter:
+    """Counsellor timetable slots: counsellor (username or email), start, and end or duration in minutes"""
+    required = ('counsellor', 'start')
+
+    def __init__(self):
+        self.counsellors = {}
+
+    def validate(self, row):
+        values = {name: _required(row, name) for name in self.required}
+        try:
+            start = datetime.fromisoformat(values['start'])
+        except ValueError:
+            raise ValueError(f"start {values['start']!r} is not a date and time like 2025-01-31 09:30")
+        end = (row.get('end') or '').strip()
+        duration = (row.get('duration') or '').strip()
+        if end:
+            try:
+                end = datetime.fromisoformat(end)
+            except ValueError:
+                raise ValueError(f'end {end!r} is not a date and time like 2025-01-31 10:00')
+        else:
+            if duration and not duration.isdigit():
+                raise ValueError(f'duration must be a number of minutes, not {duration!r}')
+            end = start + timedelta(minutes=int(duration or 30))
+        if end <= start:
+            raise ValueError('end must be after start')
+        return dict(counsellor=values['counsellor'], start_time=start, end_time=end)
+
+    def insert(self, batch, result):
+        """Insert the valid slots of one batch, skipping unknown counsellors and slots that overlap another"""
+        names = {values['counsellor'] for _, values in batch} - self.counsellors.keys()
+        if names:
+            for counsellor_id, username, email in db.session.execute(
+                    sa.select(Counsellor.id, Counsellor.username, Counsellor.email)
+                    .where(sa.or_(Counsellor.username.in_(names), Counsellor.email.in_(names)))):
+                self.counsellors[username] = self.counsellors[email] = counsellor_id
+
+        timelines = self._timelines(batch)
+        rows = []
+        for line, values in batch:
+            counsellor_id = self.counsellors.get(values['counsellor'])
+            if counsellor_id is None:
+                result.error(line, f"no counsellor {values['counsellor']!r}")
+                continue
+            timeline = timelines.setdefault(counsellor_id, CounsellorTimeline())
+            clash = timeline.overlapping(values['start_time'], values['end_time'])
+            if clash:
+                result.error(line, f"{values['counsellor']} already has a slot from {clash.start_time:%Y-%m-%d %H:%M}"
+                                   f" to {clash.end_time:%H:%M}")
+                continue
+            row = dict(counsellor_id=counsellor_id, student_id=None, day=values['start_time'].strftime('%A'),
+                       start_time=values['start_time'], end_time=values['end_time'], reason=None, status='Available')
+            timeline.add(SimpleNamespace(**row))
+            rows.append((line, row))
+        if not rows:
+            return 0
+
+        # the same check again in the insert, for slots added by someone else since the read
+        inserted = db.session.execute(Appointment.insert_if_free(), [row for _, row in rows]).rowcount
+        if inserted < len(rows):
+            result.error(rows[0][0], f'{len(rows) - inserted} slots in the rows from here on overlapped slots '
+                                     f'added while the import was running')
+        return inserted
+
+    def _timelines(self, batch):
+        """The existing slots of the batch's counsellors within its time span, by counsellor"""
+        ids = {self.counsellors.get(values['counsellor']) for _, values in batch} - {None}
+        timelines = {}
+        if not ids:
+            return timelines
+        start = min(values['start_time'] for _, values in batch)
+        end = max(values['end_time'] for _, values in batch)
+        for slot in db.session.execute(
+                sa.select(Appointment.counsellor_id, Appointment.start_time, Appointment.end_time)
+                .where(Appointment.counsellor_id.in_(ids), Appointment.start_time < end, Appointment.end_time > start)):
+            timelines.setdefault(slot.counsellor_id, CounsellorTimeline()).add(slot)
+        return timelines
+
+
+IMPORTERS = {
+    'students': StudentImporter,
+    'slots': SlotImporter,
+}
+
+
+def import_csv(kind, lines, batch_size=1000, max_errors=100):
+    """Import CSV text from an iterable of lines (e.g. an open file), batch_size rows at a time
+
+    Rows are parsed and validated one at a time and each batch is committed as it fills,
+    so memory use doesn't depend on the size of the file. Bad rows are skipped and reported
+    by line number; the good rows around them are still imported. If the file turns out
+    not to be UTF-8 CSV part way through, the rows before that are imported and
+    result.failed says where it went wrong.
+    """
+    importer = IMPORTERS[kind]()
+    result = ImportResult(kind, max_errors=max_errors)
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames or []
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFormatError(f'not a UTF-8 CSV file: {e}')
+    missing = [name for name in importer.required if name not in fieldnames]
+    if missing:
+        raise ImportFormatError(f"missing column(s): {', '.join(missing)}")
+
+    batch = []
+    try:
+        for row in reader:
+            result.rows += 1
+            try:
+                batch.append((reader.line_num, importer.validate(row)))
+            except ValueError as e:
+                result.error(reader.line_num, str(e))
+            if len(batch) >= batch_size:
+                result.inserted += importer.insert(batch, result)
+                db.session.commit()
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        result.failed = f'stopped after line {reader.line_num}, the rest is not UTF-8 CSV: {e}'
+    if batch:
+        result.inserted += importer.insert(batch, result)
+        db.session.commit()
+    # clashes with existing rows are only found when a batch is inserted
+    result.errors.sort()
+    return result
+
+
+# Files bigger than MAX_CONTENT_LENGTH are uploaded in pieces, each appended to a part file
+# in UPLOAD_FOLDER, then imported straight from disk. Together the part files may take up
+# to IMPORT_UPLOADS_MAX_BYTES, and the prune_uploads job deletes those left behind.
+UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+
+def upload_path(folder, upload_id):
+    if not UPLOAD_ID.fullmatch(upload_id):
+        raise ValueError('invalid upload id')
+    return os.path.join(folder, f'import-{upload_id}.csv.part')
+
+
+def uploads_size(folder):
+    """Bytes taken up by the part files in folder"""
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.name.endswith('.part'))
+
+
+def start_upload(folder, max_bytes=None):
+    os.makedirs(folder, exist_ok=True)
+    if max_bytes is not None and uploads_size(folder) >= max_bytes:
+        raise UploadsFull()
+    upload_id = uuid.uuid4().hex
+    open(upload_path(folder, upload_id), 'wb').close()
+    return upload_id
+
+
+def append_chunk(folder, upload_id, offset, stream, length=0, max_bytes=None):
+    """Append one chunk of length bytes sent for byte offset, returning (accepted, size of the file now)
+
+    A chunk is only written if offset is where the file currently ends. If the client
+    retries a chunk that did arrive, it is refused with the real size, and the client
+    carries on from there.
+    """
+    path = upload_path(folder, upload_id)
+    size = os.path.getsize(path)
+    if offset != size:
+        return False, size
+    if max_bytes is not None and uploads_size(folder) + length > max_bytes:
+        raise UploadsFull()
+    with open(path, 'ab') as f:
+        shutil.copyfileobj(stream, f)
+    return True, os.path.getsize(path)
+
+
+def import_upload(folder, upload_id, kind, batch_size=1000, max_errors=100):
+    """Import a finished upload straight from disk, then delete it"""
+    path = upload_path(folder, upload_id)
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return import_csv(kind, f, batch_size, max_errors)
+    finally:
+        # prune_uploads may have got to it first, if it sat unfinished for long enough
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def prune_uploads(folder, max_age):
+    """Delete part files not written to for max_age seconds, returning how many"""
+    if not os.path.isdir(folder):
+        return 0
+    cutoff = time.time() - max_age
+    deleted = 0
+    for entry in os.scandir(folder):
+        if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+    return deleted
@@ -0,0 +1,143 @@
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from app.models import Job
+
+job_log = logging.getLogger('app.jobs')
+
+# Registered tasks by name. A job names one and is run by calling it with the job's args,
+# inside an app context. Tasks commit their own work; raising marks the attempt failed.
+TASKS = {}
+
+
+def task(name):
+    """Register a task under the name jobs are queued with"""
+    def register(fn):
+        TASKS[name] = fn
+        return fn
+    return register
+
+
+def enqueue(name, args=None, priority=0, delay=0, max_attempts=None):
+    """Queue a run of a registered task in the current transaction, returning the Job"""
+    if name not in TASKS:
+        raise ValueError(f"Unknown task: {name}")
+    return Job.enqueue(name, args, priority=priority, run_at=datetime.utcnow() + timedelta(seconds=delay),
+                       max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'])
+
+
+def schedule_recurring(schedule):
+    """Queue the first run of each recurring task in {name: seconds between runs}, if none is pending"""
+    for name, every in schedule.items():
+        if name not in TASKS:
+            raise ValueError(f"Unknown task: {name}")
+        Job.schedule(name, every, max_attempts=current_app.config['JOB_MAX_ATTEMPTS'])
+    db.session.commit()
+
+
+@task('materialize_slots')
+def materialize_slots(weeks=None):
+    from app.models import Appointment
+    config = current_app.config
+    created = Appointment.materialize_slots(weeks or config['SLOT_HORIZON_WEEKS'], slot_minutes=config['SLOT_MINUTES'])
+    job_log.info('Created %d slots', created)
+
+
+@task('refresh_priorities')
+def refresh_priorities():
+    from app.models import CounsellingWaitlist
+    refreshed = CounsellingWaitlist.refresh_priorities()
+    job_log.info('Refreshed the priority of %d referrals', refreshed)
+
+
+@task('prune_jobs')
+def prune_jobs(days=None):
+    days = days or current_app.config['JOB_RETENTION_DAYS']
+    deleted = Job.prune(datetime.utcnow() - timedelta(days=days))
+    job_log.info('Deleted %d finished jobs', deleted)
+
+
+@task('prune_uploads')
+def prune_uploads(hours=None):
+    from app import importer
+    config = current_app.config
+    deleted = importer.prune_uploads(config['UPLOAD_FOLDER'], (hours or config['IMPORT_UPLOAD_MAX_AGE_HOURS']) * 60 * 60)
+    job_log.info('Deleted %d abandoned uploads', deleted)
+
+
+class JobWorker:
+    """Runs queued jobs on a pool of threads until stopped
+
+    The loop claims a due job whenever a thread is free, and otherwise sleeps for
+    poll_interval. Any number of workers, in any number of processes, can share the
+    queue. With burst it stops instead once nothing is due and its jobs are done, for
+    running from cron or tests.
+    """
+
+    def __init__(self, app, threads, poll_interval, burst=False):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.stopping = threading.Event()
+
+    def stop(self):
+        """Stop claiming jobs; run() returns once the running ones finish"""
+        self.stopping.set()
+
+    def run(self):
+        """Work through the queue, returning the number of jobs run"""
+        config = self.app.config
+        running = set()
+        count = 0
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='job') as pool:
+            while not self.stopping.is_set():
+                if len(running) >= self.threads:
+                    _, running = wait(running, return_when=FIRST_COMPLETED)
+                    continue
+                with self.app.app_context():
+                    try:
+                        job = Job.claim(config['JOB_LEASE'])
+                    except sa.exc.OperationalError:
+                        # another worker was writing; try again on the next poll
+                        db.session.rollback()
+                        job = None
+                if job is not None:
+                    running.add(pool.submit(self.execute, job))
+                    count += 1
+                elif self.burst and not running:
+                    break
+                elif self.burst:
+                    _, running = wait(running, return_when=FIRST_COMPLETED)
+                else:
+                    self.stopping.wait(self.poll_interval)
+        return count
+
+    def execute(self, job):
+        """Run one claimed job and record how it went"""
+        config = self.app.config
+        with self.app.app_context():
+            error = None
+            try:
+                TASKS[job.name](**job.args)
+            except Exception:
+                db.session.rollback()
+                job_log.exception('Job %d (%s) failed on attempt %d of %d',
+                                  job.id, job.name, job.attempts, job.max_attempts)
+                error = traceback.format_exc(limit=5)[-2000:]
+            try:
+                if error is None:
+                    Job.finish(job)
+                else:
+                    Job.fail(job, error, config['JOB_BACKOFF_BASE'], config['JOB_BACKOFF_MAX'])
+            except sa.exc.SQLAlchemyError:
+                # the job stays running until JOB_LEASE runs out, then is claimed again
+                db.session.rollback()
+                job_log.exception('Could not record the result of job %d (%s)', job.id, job.name)
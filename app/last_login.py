@@ -0,0 +1,105 @@
+import atexit
+import logging
+import threading
+
+import sqlalchemy as sa
+
+last_login_log = logging.getLogger('app.last_login')
+
+users = sa.table('users', sa.column('id', sa.Integer), sa.column('last_login', sa.DateTime))
+
+
+class LastLoginBuffer:
+    """Collects last-login timestamps and writes them behind the login requests
+
+    Logins only touch a dict. A daemon thread writes everything pending with one
+    executemany UPDATE every flush_interval seconds, or sooner once flush_size users are
+    waiting. Repeat logins by one user collapse into a single row. If a flush fails, its
+    rows go back into the buffer for the next try, unless the user has logged in again
+    since.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.engine = None
+        self.configure(None, 5, 200, 5)
+
+    def configure(self, engine, flush_interval, flush_size, shutdown_timeout):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.shutdown_timeout = shutdown_timeout
+
+    def record(self, user_id, when):
+        with self.lock:
+            self.pending[user_id] = when
+            full = len(self.pending) >= self.flush_size
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='last-login-writer', daemon=True)
+                self.thread.start()
+        if full:
+            self.wake.set()
+
+    def flush(self):
+        """Write every pending timestamp now, returning how many rows were written"""
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return 0
+
+        statement = sa.update(users).where(users.c.id == sa.bindparam('user_id')) \
+            .values(last_login=sa.bindparam('login_at'))
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(statement, [dict(user_id=uid, login_at=when) for uid, when in batch.items()])
+        except sa.exc.SQLAlchemyError:
+            last_login_log.exception('Could not write %d last-login timestamps, will retry', len(batch))
+            with self.lock:
+                for uid, when in batch.items():
+                    self.pending.setdefault(uid, when)
+            return 0
+        return len(batch)
+
+    def _run(self):
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+        # logins recorded during the last write, if shutdown gave up waiting for it
+        self.flush()
+
+    def shutdown(self):
+        """Stop the writer thread and flush what's left, waiting at most shutdown_timeout"""
+        self.stopping = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(self.shutdown_timeout)
+            if self.thread.is_alive():
+                # still stuck in a write; leave the rest to it rather than race it here. It
+                # flushes once more as it stops, if the process lives that long
+                last_login_log.warning('Last-login writer still busy after %ss, abandoning the final flush '
+                                       'of %d timestamps', self.shutdown_timeout, len(self.pending))
+                return
+            self.thread = None
+        if self.engine is not None:
+            self.flush()
+        self.stopping = False
+
+
+last_logins = LastLoginBuffer()
+atexit.register(last_logins.shutdown)
+
+
+def init_last_login(app, db):
+    """Point the last-login buffer at the app's database and LAST_LOGIN_* settings"""
+    with app.app_context():
+        last_logins.configure(
+            db.engine,
+            app.config['LAST_LOGIN_FLUSH_INTERVAL'],
+            app.config['LAST_LOGIN_FLUSH_SIZE'],
+            app.config['LAST_LOGIN_SHUTDOWN_TIMEOUT'],
+        )
@@ -0,0 +1,145 @@
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+
+import sqlalchemy as sa
+from flask import Response, g, has_request_context, request
+
+# Upper bounds (in seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_log = logging.getLogger('app.slow_queries')
+
+
+class Histogram:
+    """Cumulative histogram in the shape Prometheus expects"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process store of per-endpoint request and SQL metrics
+
+    Each worker process keeps its own numbers, the way a Prometheus client would.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.requests = {}
+        self.queries = {}
+        self.query_seconds = {}
+
+    def record_request(self, endpoint, method, status, seconds, queries, query_seconds):
+        with self.lock:
+            key = (endpoint, method)
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(seconds)
+            status_key = (endpoint, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self.queries[endpoint] = self.queries.get(endpoint, 0) + queries
+            self.query_seconds[endpoint] = self.query_seconds.get(endpoint, 0.0) + query_seconds
+
+    def render(self):
+        """Return everything recorded so far in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines.append('# HELP http_request_duration_seconds Time spent handling requests, by endpoint.')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            lines.append('# HELP http_requests_total Requests handled, by endpoint and status code.')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            lines.append('# HELP db_queries_total SQL statements executed while handling requests, by endpoint.')
+            lines.append('# TYPE db_queries_total counter')
+            for endpoint, count in sorted(self.queries.items()):
+                lines.append(f'db_queries_total{{endpoint="{endpoint}"}} {count}')
+
+            lines.append('# HELP db_query_seconds_total Time spent executing SQL while handling requests, by endpoint.')
+            lines.append('# TYPE db_query_seconds_total counter')
+            for endpoint, seconds in sorted(self.query_seconds.items()):
+                lines.append(f'db_query_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def init_metrics(app, db):
+    """Time every request and SQL statement, and serve the results at /metrics"""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.query_seconds = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' in g:
+            metrics.record_request(
+                request.endpoint or 'unmatched',
+                request.method,
+                response.status_code,
+                time.perf_counter() - g.request_started,
+                g.query_count,
+                g.query_seconds,
+            )
+        return response
+
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint
+            g.query_count = g.get('query_count', 0) + 1
+            g.query_seconds = g.get('query_seconds', 0.0) + elapsed
+
+        # slow statements are logged, but only a sample of them so a slow page can't flood the log
+        if elapsed * 1000 >= app.config['SLOW_QUERY_THRESHOLD_MS'] \
+                and random.random() < app.config['SLOW_QUERY_SAMPLE_RATE']:
+            slow_query_log.warning(
+                'Slow query (%.1fms, endpoint %s): %s %r',
+                elapsed * 1000, endpoint, ' '.join(statement.split()), parameters if not executemany else '[executemany]'
+            )
+
+    def discard_query_timer(exception_context):
+        if exception_context.connection is not None:
+            started = exception_context.connection.info.get('query_started')
+            if started:
+                started.pop()
+
+    with app.app_context():
+        sa.event.listen(db.engine, 'before_cursor_execute', start_query_timer)
+        sa.event.listen(db.engine, 'after_cursor_execute', record_query)
+        sa.event.listen(db.engine, 'handle_error', discard_query_timer)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
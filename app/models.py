@@ -1,15 +1,20 @@
+import math
 from typing import Optional
 import sqlalchemy as sa
 import sqlalchemy.orm as so
+from flask import current_app
 from flask_login import UserMixin
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login
+from app.passwords import hasher
+from app.last_login import last_logins
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from enum import Enum
 
+# day zero for CounsellingWaitlist.priority_key
+EPOCH = datetime(1970, 1, 1)
 
 # Define user roles as an enumeration for type safety and consistency
 class UserRole(Enum):
@@ -36,16 +41,27 @@ class User(UserMixin, db.Model):
     # Password handling methods - Future proofing
     def set_password(self, password):
         """Hash and set the user's password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
         """Verify the user's password"""
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def upgrade_password_hash(self, password):
+        """Re-hash a just-verified password if the hashing parameters have changed"""
+        if hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+            db.session.commit()
 
     def update_last_login(self):
-        """Update the user's last login timestamp"""
-        self.last_login = datetime.now(timezone.utc)
-        db.session.commit()
+        """Record the user's last login timestamp
+
+        The timestamp is written behind the request in a batch (see app/last_login.py), so
+        logging in doesn't wait on a write transaction.
+        """
+        now = datetime.now(timezone.utc)
+        so.attributes.set_committed_value(self, 'last_login', now)
+        last_logins.record(self.id, now)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -111,13 +127,370 @@ class WellbeingLog(db.Model):
     symptoms = db.Column(db.String(255), nullable=True)
     date_logged = db.Column(db.DateTime, default=datetime.utcnow)
     alert_flag = db.Column(db.Boolean, default=False) 
+    # which alert rules fired for this log, see app/alert_rules.py
+    alert_reason = db.Column(db.String(255), nullable=True)
+    # id the mobile app gave a log it queued offline, so a retried sync doesn't add it twice
+    client_ref = db.Column(db.String(64), nullable=True)
 
     # Relationship with Student model
     student = db.relationship('Student', backref='logs', lazy=True)
 
+    # The alerts feed walks (alert_flag, date_logged, id) newest first, so this index
+    # lets each page be a single range scan however much alert history there is.
+    __table_args__ = (
+        db.Index('ix_wellbeing_logs_alert_feed', 'alert_flag', 'date_logged', 'id'),
+        db.Index('ix_wellbeing_logs_user_date', 'user_id', 'date_logged'),
+        db.UniqueConstraint('user_id', 'client_ref', name='uq_wellbeing_logs_user_client_ref'),
+    )
+
     def __repr__(self):
         return f'<WellbeingLog {self.id} - User {self.user_id}>'
 
+    @staticmethod
+    def encode_cursor(log):
+        """Build the opaque 'before' cursor pointing just after the given log"""
+        return f"{log.date_logged.isoformat()}_{log.id}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Parse a cursor from encode_cursor, returning None if it is malformed"""
+        try:
+            logged, log_id = cursor.rsplit('_', 1)
+            return datetime.fromisoformat(logged), int(log_id)
+        except (AttributeError, ValueError):
+            return None
+
+    @classmethod
+    def alerts_page(cls, before=None, per_page=25, start=None, end=None, user_id=None):
+        """Return one page of flagged logs, newest first, plus the cursor for the next page
+
+        Uses keyset pagination on (date_logged, id) rather than OFFSET, so the cost of
+        a page does not grow with the amount of alert history behind it.
+        """
+        query = sa.select(cls).where(cls.alert_flag.is_(True))
+        if start is not None:
+            query = query.where(cls.date_logged >= start)
+        if end is not None:
+            query = query.where(cls.date_logged < end)
+        if user_id is not None:
+            query = query.where(cls.user_id == user_id)
+        if before is not None:
+            query = query.where(sa.tuple_(cls.date_logged, cls.id) < sa.tuple_(*before))
+        query = query.order_by(cls.date_logged.desc(), cls.id.desc()).limit(per_page + 1)
+
+        alerts = db.session.scalars(query).all()
+        next_cursor = None
+        if len(alerts) > per_page:
+            alerts = alerts[:per_page]
+            next_cursor = cls.encode_cursor(alerts[-1])
+        return alerts, next_cursor
+
+    @classmethod
+    def logs_page(cls, user_id, before=None, per_page=50):
+        """Return one page of a student's logs, newest first, plus the cursor for the next page"""
+        query = sa.select(cls).where(cls.user_id == user_id)
+        if before is not None:
+            query = query.where(sa.tuple_(cls.date_logged, cls.id) < sa.tuple_(*before))
+        logs = db.session.scalars(
+            query.order_by(cls.date_logged.desc(), cls.id.desc()).limit(per_page + 1)
+        ).all()
+        next_cursor = None
+        if len(logs) > per_page:
+            logs = logs[:per_page]
+            next_cursor = cls.encode_cursor(logs[-1])
+        return logs, next_cursor
+
+    @classmethod
+    def sync(cls, user_id, entries):
+        """Add a batch of logs a student queued offline, returning (log, created) for each entry
+
+        Each entry is a dict of client_ref, mood, symptoms and date_logged. Entries whose
+        client_ref was already synced, by an earlier batch or earlier in this one, map to
+        the existing log instead of adding another. The new logs are flushed together,
+        oldest first, so the alert rules and rollups see them in the order they were made.
+        The caller commits.
+        """
+        refs = [entry['client_ref'] for entry in entries]
+        synced = {log.client_ref: log for log in db.session.scalars(
+            sa.select(cls).where(cls.user_id == user_id, cls.client_ref.in_(refs)))}
+        results = []
+        new_logs = []
+        for entry in entries:
+            log = synced.get(entry['client_ref'])
+            if log is not None:
+                results.append((log, False))
+                continue
+            log = synced[entry['client_ref']] = cls(user_id=user_id, **entry)
+            new_logs.append(log)
+            results.append((log, True))
+        db.session.add_all(sorted(new_logs, key=lambda log: log.date_logged))
+        db.session.flush()
+        return results
+
+# Mood Rollup model holding pre-aggregated mood statistics per student
+# One row per student per day, week (starting Monday) and month, kept up to date as logs are inserted
+class MoodRollup(db.Model):
+    __tablename__ = 'mood_rollups'
+    PERIODS = ('day', 'week', 'month')
+
+    user_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    log_count = db.Column(db.Integer, nullable=False, default=0)
+    mood_sum = db.Column(db.Integer, nullable=False, default=0)
+    mood_min = db.Column(db.Integer, nullable=False)
+    mood_max = db.Column(db.Integer, nullable=False)
+    alert_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MoodRollup User {self.user_id} {self.period} {self.period_start}>'
+
+    @staticmethod
+    def period_start_for(period, when):
+        """Return the first day of the day/week/month period containing when"""
+        day = when.date() if isinstance(when, datetime) else when
+        if period == 'week':
+            return day - timedelta(days=day.weekday())
+        if period == 'month':
+            return day.replace(day=1)
+        return day
+
+    @classmethod
+    def apply(cls, connection, log):
+        """Fold one newly inserted log into its day, week and month rollups
+
+        A single upsert per period, so the cost of a new log is constant however
+        long the student's history is.
+        """
+        table = cls.__table__
+        logged = log.date_logged or datetime.utcnow()
+        alerts = 1 if log.alert_flag else 0
+        for period in cls.PERIODS:
+            insert = _upsert(connection, table).values(
+                user_id=log.user_id,
+                period=period,
+                period_start=cls.period_start_for(period, logged),
+                log_count=1,
+                mood_sum=log.mood,
+                mood_min=log.mood,
+                mood_max=log.mood,
+                alert_count=alerts,
+            )
+            connection.execute(insert.on_conflict_do_update(
+                index_elements=['user_id', 'period', 'period_start'],
+                set_={
+                    'log_count': table.c.log_count + 1,
+                    'mood_sum': table.c.mood_sum + log.mood,
+                    'mood_min': sa.case((table.c.mood_min > log.mood, log.mood), else_=table.c.mood_min),
+                    'mood_max': sa.case((table.c.mood_max < log.mood, log.mood), else_=table.c.mood_max),
+                    'alert_count': table.c.alert_count + alerts,
+                },
+            ))
+
+    @classmethod
+    def rebuild(cls, user_id=None):
+        """Recompute rollups from wellbeing_logs with set-based INSERT ... SELECT
+
+        For backfilling after bulk loads that bypass the ORM, or repairing drift.
+        """
+        delete = sa.delete(cls)
+        if user_id is not None:
+            delete = delete.where(cls.user_id == user_id)
+        db.session.execute(delete)
+
+        columns = ['user_id', 'period', 'period_start', 'log_count', 'mood_sum', 'mood_min', 'mood_max', 'alert_count']
+        dialect_name = db.session.get_bind().dialect.name
+
+        # days are aggregated from the logs themselves...
+        day_start = _period_start_sql(dialect_name, 'day', WellbeingLog.date_logged)
+        days = (
+            sa.select(
+                WellbeingLog.user_id,
+                sa.literal('day'),
+                day_start,
+                sa.func.count(),
+                sa.func.sum(WellbeingLog.mood),
+                sa.func.min(WellbeingLog.mood),
+                sa.func.max(WellbeingLog.mood),
+                sa.func.sum(sa.case((WellbeingLog.alert_flag.is_(True), 1), else_=0)),
+            )
+            .group_by(WellbeingLog.user_id, day_start)
+        )
+        if user_id is not None:
+            days = days.where(WellbeingLog.user_id == user_id)
+        db.session.execute(sa.insert(cls).from_select(columns, days))
+
+        # ...and weeks and months from the far smaller set of day rows
+        day_rows = sa.select(cls).where(cls.period == 'day')
+        if user_id is not None:
+            day_rows = day_rows.where(cls.user_id == user_id)
+        day_rows = day_rows.subquery()
+        for period in ('week', 'month'):
+            period_start = _period_start_sql(dialect_name, period, day_rows.c.period_start)
+            db.session.execute(sa.insert(cls).from_select(columns, (
+                sa.select(
+                    day_rows.c.user_id,
+                    sa.literal(period),
+                    period_start,
+                    sa.func.sum(day_rows.c.log_count),
+                    sa.func.sum(day_rows.c.mood_sum),
+                    sa.func.min(day_rows.c.mood_min),
+                    sa.func.max(day_rows.c.mood_max),
+                    sa.func.sum(day_rows.c.alert_count),
+                )
+                .group_by(day_rows.c.user_id, period_start)
+            )))
+        db.session.commit()
+
+    @classmethod
+    def series(cls, user_id, period='day', start=None, end=None, max_points=120):
+        """Return the student's rollups in [start, end) as chart points, oldest first
+
+        Long ranges are downsampled by merging runs of neighbouring buckets, so at most
+        max_points come back. Counts, sums, minimums and maximums merge exactly, so the
+        merged averages are true averages rather than averages of averages.
+        """
+        query = sa.select(cls).where(cls.user_id == user_id, cls.period == period)
+        if start is not None:
+            query = query.where(cls.period_start >= start)
+        if end is not None:
+            query = query.where(cls.period_start < end)
+        rollups = db.session.scalars(query.order_by(cls.period_start)).all()
+
+        group_size = max(1, -(-len(rollups) // max(1, max_points)))
+        points = []
+        for i in range(0, len(rollups), group_size):
+            group = rollups[i:i + group_size]
+            count = sum(r.log_count for r in group)
+            points.append({
+                'start': group[0].period_start.isoformat(),
+                'end': group[-1].period_start.isoformat(),
+                'count': count,
+                'min': min(r.mood_min for r in group),
+                'avg': round(sum(r.mood_sum for r in group) / count, 2),
+                'max': max(r.mood_max for r in group),
+                'alerts': sum(r.alert_count for r in group),
+            })
+        return points
+
+
+# Alert State model holding each student's rolling state for the alert rules
+# One compact row per student, updated as each log is inserted so no rule rescans the history
+class AlertState(db.Model):
+    __tablename__ = 'alert_states'
+    WINDOW_DAYS = 7
+
+    user_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    log_count = db.Column(db.Integer, nullable=False, default=0)
+    last_mood = db.Column(db.Integer, nullable=True)
+    decline_streak = db.Column(db.Integer, nullable=False, default=0)
+    baseline = db.Column(db.Float, nullable=True)
+    # per-day 'sum:count' mood totals for the WINDOW_DAYS days ending window_end, oldest first
+    window_end = db.Column(db.Date, nullable=True)
+    window = db.Column(db.String(100), nullable=True)
+
+    def __repr__(self):
+        return f'<AlertState User {self.user_id}>'
+
+    @classmethod
+    def load(cls, connection, user_id):
+        """Return the student's state, or a fresh one if they have none yet
+
+        Reads through the flush's connection, so it can be used from mapper events.
+        """
+        row = connection.execute(sa.select(cls.__table__).where(cls.user_id == user_id)).first()
+        if row is None:
+            return cls(user_id=user_id, log_count=0, decline_streak=0)
+        return cls(**row._mapping)
+
+    def save(self, connection):
+        table = self.__table__
+        values = {column.name: getattr(self, column.name) for column in table.columns}
+        connection.execute(_upsert(connection, table).values(**values).on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={name: value for name, value in values.items() if name != 'user_id'},
+        ))
+
+    @classmethod
+    def save_all(cls, connection, states):
+        """Upsert many states with one executemany, as save() does for one"""
+        table = cls.__table__
+        insert = _upsert(connection, table)
+        connection.execute(
+            insert.on_conflict_do_update(
+                index_elements=['user_id'],
+                set_={column.name: insert.excluded[column.name] for column in table.columns if column.name != 'user_id'},
+            ),
+            [{column.name: getattr(state, column.name) for column in table.columns} for state in states],
+        )
+
+    def observe(self, mood, day, baseline_alpha):
+        """Fold one new mood score into the state in constant time
+
+        The baseline is an exponentially weighted moving average. The value it had before
+        this mood is kept in previous_baseline, for rules that compare against it.
+        """
+        self.previous_baseline = self.baseline
+        self.previous_count = self.log_count or 0
+
+        self.decline_streak = (self.decline_streak or 0) + 1 \
+            if self.last_mood is not None and mood < self.last_mood else 0
+        self.last_mood = mood
+        self.baseline = mood if self.baseline is None \
+            else self.baseline + baseline_alpha * (mood - self.baseline)
+        self.log_count = self.previous_count + 1
+
+        days = self.window_days()
+        if self.window_end is None or (day - self.window_end).days >= self.WINDOW_DAYS:
+            days = [[0, 0] for _ in range(self.WINDOW_DAYS)]
+            self.window_end = day
+        elif day > self.window_end:
+            shift = (day - self.window_end).days
+            days = days[shift:] + [[0, 0] for _ in range(shift)]
+            self.window_end = day
+        slot = self.WINDOW_DAYS - 1 - (self.window_end - day).days
+        # a back-dated log older than the window only counts towards the baseline
+        if slot >= 0:
+            days[slot][0] += mood
+            days[slot][1] += 1
+        self.window = ','.join(f'{total}:{count}' for total, count in days)
+
+    def window_days(self):
+        if not self.window:
+            return [[0, 0] for _ in range(self.WINDOW_DAYS)]
+        return [[int(n) for n in day.split(':')] for day in self.window.split(',')]
+
+    def window_average(self):
+        """Return (average mood, number of logs) over the rolling window"""
+        days = self.window_days()
+        count = sum(c for _, c in days)
+        return (sum(t for t, _ in days) / count if count else None), count
+
+
+def _upsert(connection, table):
+    """Return an INSERT for the connection's dialect that supports on_conflict_do_update/nothing"""
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def _period_start_sql(dialect_name, period, column):
+    """SQL expression for the first day of the period containing column"""
+    if dialect_name == 'postgresql':
+        return sa.cast(sa.func.date_trunc(period, column), sa.Date)
+    if period == 'week':
+        return sa.func.date(column, 'weekday 0', '-6 days')
+    if period == 'month':
+        return sa.func.date(column, 'start of month')
+    return sa.func.date(column)
+
+
+@sa.event.listens_for(WellbeingLog, 'after_insert')
+def roll_up_wellbeing_log(mapper, connection, log):
+    MoodRollup.apply(connection, log)
+
 # Appointment model for scheduling counselling sessions
 # Links students with counsellors and tracks appointment status
 class Appointment(db.Model):
@@ -134,9 +507,170 @@ class Appointment(db.Model):
     # Relationships with Student and Counsellor models
     student = db.relationship('Student', backref= 'appointments')
     counsellor = db.relationship('Counsellor', backref='appointments')
+
+    # The booking calendar reads open slots by status within a start_time window. A counsellor
+    # has at most one slot starting at any time, which lets materialize_slots skip existing slots
+    __table_args__ = (
+        db.Index('ix_appointments_status_start', 'status', 'start_time'),
+        db.UniqueConstraint('counsellor_id', 'start_time', name='uq_appointments_counsellor_start'),
+    )
+
     def __repr__(self):
         return f'<Appointment {self.id}, Student {self.student_id}, Staff {self.staff_id}>'
 
+    @classmethod
+    def materialize_slots(cls, weeks, now=None, slot_minutes=30):
+        """Create slots from every counsellor's weekly availability for the next weeks
+
+        Safe to run as often as you like, and from several workers at once: all the slots
+        in the horizon go to one executemany of insert_if_free, which skips those that would
+        overlap a slot the counsellor added by hand, and ON CONFLICT DO NOTHING on
+        uq_appointments_counsellor_start skips those that already exist, even if another run
+        inserted them after the overlap check read. Returns the number of slots created.
+        """
+        now = now or datetime.now()
+        slot = timedelta(minutes=slot_minutes)
+        days = [now.date() + timedelta(days=n) for n in range(7 * weeks)]
+        rows = []
+        for availability in db.session.scalars(sa.select(CounsellorAvailability)):
+            for day in days:
+                if day.strftime('%A') != availability.day_of_week:
+                    continue
+                start = datetime.combine(day, availability.start_time)
+                end = datetime.combine(day, availability.end_time)
+                while start + slot <= end:
+                    if start > now:
+                        rows.append(dict(counsellor_id=availability.counsellor_id, student_id=None,
+                                         day=availability.day_of_week, start_time=start, end_time=start + slot,
+                                         reason=None, status='Available'))
+                    start += slot
+        if not rows:
+            return 0
+
+        created = db.session.execute(cls.insert_if_free(skip_duplicates=True), rows).rowcount
+        db.session.commit()
+        return created
+
+    SLOT_COLUMNS = ('counsellor_id', 'student_id', 'day', 'start_time', 'end_time', 'reason', 'status')
+
+    @classmethod
+    def insert_if_free(cls, skip_duplicates=False):
+        """INSERT of one slot (bound by SLOT_COLUMNS) that inserts nothing if it would overlap
+
+        Every writer of slots goes through this, so a counsellor's slots never overlap and
+        find_overlap's one-row test holds. The check and the insert are a single
+        INSERT ... SELECT ... WHERE NOT EXISTS, so SQLite runs them under one write lock and
+        two requests can't both pass the check. Run with a list of rows, each row is also
+        checked against those inserted before it. With skip_duplicates a slot starting at the
+        same time as an existing one is skipped by the unique constraint rather than raising,
+        for databases that don't serialise writers the way SQLite does.
+        """
+        table = cls.__table__
+        start = sa.bindparam('start_time', type_=table.c.start_time.type)
+        end = sa.bindparam('end_time', type_=table.c.end_time.type)
+        previous = (
+            sa.select(table.c.end_time)
+            .where(table.c.counsellor_id == sa.bindparam('counsellor_id', type_=table.c.counsellor_id.type),
+                   table.c.start_time < end)
+            .order_by(table.c.start_time.desc())
+            .limit(1)
+            .subquery()
+        )
+        clash = sa.exists().where(previous.c.end_time > start)
+        values = sa.select(*(sa.bindparam(name, type_=table.c[name].type) for name in cls.SLOT_COLUMNS))
+        if not skip_duplicates:
+            return sa.insert(table).from_select(cls.SLOT_COLUMNS, values.where(~clash))
+        # SQLite needs the WHERE for ON CONFLICT to follow an INSERT ... SELECT, which ~clash provides
+        return _upsert(db.session.connection(), table).from_select(cls.SLOT_COLUMNS, values.where(~clash)) \
+            .on_conflict_do_nothing(index_elements=['counsellor_id', 'start_time'])
+
+    @classmethod
+    def add_slot(cls, counsellor_id, start, end):
+        """Add an open slot unless it overlaps one of the counsellor's, returning it or None. Commits."""
+        slot_id = db.session.scalar(
+            cls.insert_if_free().returning(cls.__table__.c.id),
+            dict(counsellor_id=counsellor_id, student_id=None, day=start.strftime('%A'), start_time=start,
+                 end_time=end, reason=None, status='Available'),
+        )
+        db.session.commit()
+        return db.session.get(cls, slot_id) if slot_id is not None else None
+
+    @classmethod
+    def find_overlap(cls, counsellor_id, start, end):
+        """Return the counsellor's slot overlapping [start, end), or None
+
+        A counsellor's slots don't overlap one another (see insert_if_free), so the only
+        candidate is the last one starting before end. That is a one-row, backwards range
+        scan of the (counsellor_id, start_time) index, however many slots there are.
+        """
+        previous = db.session.scalar(
+            sa.select(cls)
+            .where(cls.counsellor_id == counsellor_id, cls.start_time < end)
+            .order_by(cls.start_time.desc())
+            .limit(1)
+        )
+        return previous if previous is not None and previous.end_time > start else None
+
+    @classmethod
+    def book(cls, appointment_id, student_id, reason):
+        """Book the slot for the student if it is still free, returning whether it was
+
+        A single conditional UPDATE, so when several students race for the same slot
+        exactly one of them gets it and the rest see a clean False.
+        """
+        result = db.session.execute(
+            sa.update(cls)
+            .where(cls.id == appointment_id, cls.student_id.is_(None))
+            .values(student_id=student_id, reason=reason, status='Booked')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    @classmethod
+    def available_calendar(cls, start, end):
+        """Return the open slots starting in [start, end) grouped by day then counsellor
+
+        The counsellor is loaded in the same joined query as the slots, so rendering the
+        calendar does not lazy-load a Counsellor for every slot.
+        """
+        query = (
+            sa.select(cls)
+            .join(cls.counsellor)
+            .options(so.contains_eager(cls.counsellor))
+            .where(cls.status == 'Available', cls.start_time >= start, cls.start_time < end)
+            .order_by(cls.start_time, Counsellor.username)
+        )
+
+        days = {}
+        for slot in db.session.scalars(query):
+            counsellors = days.setdefault(slot.start_time.date(), {})
+            counsellors.setdefault(slot.counsellor, []).append(slot)
+
+        return [
+            CalendarDay(
+                day=day,
+                counsellors=[
+                    CounsellorSlots(counsellor=counsellor, slots=slots)
+                    for counsellor, slots in sorted(counsellors.items(), key=lambda item: item[0].username)
+                ],
+            )
+            for day, counsellors in days.items()
+        ]
+
+
+# Read models for the booking calendar, built by Appointment.available_calendar
+@dataclass
+class CounsellorSlots:
+    counsellor: Counsellor
+    slots: list
+
+
+@dataclass
+class CalendarDay:
+    day: date
+    counsellors: list
+
 # Counsellor Availability model for managing counsellor schedules
 # Tracks when counsellors are available for appointments
 class CounsellorAvailability(db.Model):
@@ -153,26 +687,18 @@ class CounsellorAvailability(db.Model):
     def __repr__(self):
         return f"<CounsellorAvailability {self.counsellor.username}, {self.day_of_week} {self.start_time}-{self.end_time}>"
 
+# Loads a user row as its concrete subclass (Student, Counsellor, ...) in one query,
+# joining every subclass table instead of fetching the base row and then the subclass
+user_with_subclasses = so.with_polymorphic(User, '*')
+
 # User loader for Flask-Login
 # Loads the appropriate user type based on the user's type field
 @login.user_loader
 def load_user(id):
     try:
-        # First get the base user to determine the type
-        user = db.session.get(User, int(id))
-        if user is None:
-            return None
-        
-        # Then load the specific subclass based on type
-        if user.type == 'student':
-            return db.session.get(Student, int(id))
-        elif user.type == 'counsellor':
-            return db.session.get(Counsellor, int(id))
-        elif user.type == 'wellbeing_staff':
-            return db.session.get(WellbeingStaff, int(id))
-        elif user.type == 'admin':
-            return db.session.get(Admin, int(id))
-        return user
+        return db.session.scalar(
+            sa.select(user_with_subclasses).where(user_with_subclasses.id == int(id))
+        )
     except Exception as e:
         print(f"Error loading user: {e}")
         return None
@@ -185,6 +711,12 @@ class CounsellingWaitlist(db.Model):
     student_name = db.Column(db.String(50), nullable=False)
     referral_info = db.Column(db.Text, nullable=False)
     referral_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # days of extra waiting the student's recent alerts and mood are worth, see triage_days_for
+    triage_days = db.Column(db.Integer, nullable=False, default=0)
+    # triage_days minus the referral date as a day number. Sorting by it descending is the
+    # same as sorting by triage_days plus days waited, but it doesn't change as time passes,
+    # so it can be stored and indexed
+    priority_key = db.Column(db.Float, nullable=False, default=0)
 
     # Relationship with Student model
     student = db.relationship(
@@ -194,9 +726,134 @@ class CounsellingWaitlist(db.Model):
         lazy=True
     )
 
+    __table_args__ = (
+        db.Index('ix_counselling_waitlist_priority', 'priority_key', 'student_id'),
+    )
+
     def __repr__(self):
         return (f"student_id = {self.student_id}, student_name = {self.student_name}, referral_info = {self.referral_info[:20]}, referral_date = {self.referral_date}")
 
+    @property
+    def days_waiting(self):
+        return (datetime.utcnow() - self.referral_date).days
+
+    @classmethod
+    def by_priority(cls):
+        """Select the waitlist most urgent first; an index range scan, for db.paginate"""
+        return sa.select(cls).order_by(cls.priority_key.desc(), cls.student_id)
+
+    @staticmethod
+    def triage_days_for(recent_alerts, mood_average, settings):
+        """Days of extra waiting that recent alerts and a low rolling mood are worth"""
+        days = min(recent_alerts, settings['max_alerts']) * settings['days_per_alert']
+        if mood_average is not None and mood_average < settings['low_mood_below']:
+            days += settings['low_mood_days']
+        return days
+
+    @staticmethod
+    def priority_key_for(triage_days, referral_date):
+        return triage_days - (referral_date - EPOCH).total_seconds() / 86400
+
+    @classmethod
+    def reprioritise(cls, connection, user_id):
+        """Recompute the priority of the student's referral, if they have one
+
+        Used as each of their wellbeing logs is inserted. Costs a few primary key and
+        index lookups, however long the waitlist is.
+        """
+        referral = connection.execute(
+            sa.select(cls.student_id, cls.referral_date)
+            .join(Student.__table__, Student.__table__.c.student_id == cls.student_id)
+            .where(Student.__table__.c.id == user_id)
+        ).first()
+        if referral is None:
+            return
+        settings = current_app.config['WAITLIST_TRIAGE']
+        alerts, averages = cls._triage_signals(connection, settings, user_id)
+        days = cls.triage_days_for(alerts.get(user_id, 0), averages.get(user_id), settings)
+        connection.execute(
+            sa.update(cls.__table__).where(cls.student_id == referral.student_id)
+            .values(triage_days=days, priority_key=cls.priority_key_for(days, referral.referral_date))
+        )
+        # Core on the flush connection, so the session events don't see this change
+        TableVersion.bump(connection, {cls.__tablename__})
+
+    @classmethod
+    def refresh_priorities(cls):
+        """Recompute every referral's priority in a few set-based statements
+
+        Run after bulk loads that bypass the ORM, and now and then so that alerts age out
+        of the recent window.
+        """
+        settings = current_app.config['WAITLIST_TRIAGE']
+        students = Student.__table__
+        referrals = db.session.execute(
+            sa.select(cls.student_id, cls.referral_date, students.c.id)
+            .join(students, students.c.student_id == cls.student_id)
+        ).all()
+        alerts, averages = cls._triage_signals(db.session.connection(), settings)
+        updates = []
+        for student_id, referral_date, user_id in referrals:
+            days = cls.triage_days_for(alerts.get(user_id, 0), averages.get(user_id), settings)
+            updates.append(dict(b_student_id=student_id, b_triage_days=days,
+                                b_priority_key=cls.priority_key_for(days, referral_date)))
+        if updates:
+            db.session.execute(
+                sa.update(cls.__table__).where(cls.student_id == sa.bindparam('b_student_id'))
+                .values(triage_days=sa.bindparam('b_triage_days'), priority_key=sa.bindparam('b_priority_key')),
+                updates,
+            )
+        db.session.commit()
+        return len(updates)
+
+    @staticmethod
+    def _triage_signals(connection, settings, user_id=None):
+        """Return ({user_id: recent alert count}, {user_id: rolling mood average})
+
+        Alerts are counted from the day rollups and the mood average comes from the alert
+        rule state, so neither reads the logs themselves. Covers just user_id if given,
+        otherwise everyone on the waitlist.
+        """
+        today = datetime.utcnow().date()
+        if user_id is not None:
+            on_waitlist = [user_id]
+        else:
+            on_waitlist = sa.select(Student.__table__.c.id).join(
+                CounsellingWaitlist.__table__, CounsellingWaitlist.student_id == Student.__table__.c.student_id)
+
+        alerts = dict(connection.execute(
+            sa.select(MoodRollup.user_id, sa.func.sum(MoodRollup.alert_count))
+            .where(MoodRollup.user_id.in_(on_waitlist), MoodRollup.period == 'day',
+                   MoodRollup.period_start > today - timedelta(days=settings['recent_days']))
+            .group_by(MoodRollup.user_id)
+        ).all())
+
+        averages = {}
+        states = connection.execute(
+            sa.select(AlertState.__table__)
+            .where(AlertState.user_id.in_(on_waitlist),
+                   AlertState.window_end > today - timedelta(days=AlertState.WINDOW_DAYS))
+        )
+        for row in states:
+            averages[row.user_id] = AlertState(**row._mapping).window_average()[0]
+        return alerts, averages
+
+@sa.event.listens_for(WellbeingLog, 'after_insert')
+def reprioritise_waitlist(mapper, connection, log):
+    CounsellingWaitlist.reprioritise(connection, log.user_id)
+
+
+@sa.event.listens_for(CounsellingWaitlist, 'before_insert')
+def prioritise_new_referral(mapper, connection, referral):
+    if referral.referral_date is None:
+        referral.referral_date = datetime.utcnow()
+    settings = current_app.config['WAITLIST_TRIAGE']
+    user_id = connection.scalar(
+        sa.select(Student.__table__.c.id).where(Student.__table__.c.student_id == referral.student_id))
+    alerts, averages = CounsellingWaitlist._triage_signals(connection, settings, user_id)
+    referral.triage_days = CounsellingWaitlist.triage_days_for(alerts.get(user_id, 0), averages.get(user_id), settings)
+    referral.priority_key = CounsellingWaitlist.priority_key_for(referral.triage_days, referral.referral_date)
+
 # Approved Referrals model for tracking approved counselling requests
 # Records referrals that have been approved by wellbeing staff
 class ApprovedReferrals(db.Model):
@@ -213,3 +870,294 @@ class ApprovedReferrals(db.Model):
     def __repr__(self):
         return f"ApprovedReferral(student_id={self.student_id}, student_name={self.student_name})"
 
+    @classmethod
+    def approve_many(cls, student_ids=None, referred_before=None, top=None):
+        """Move the chosen waitlist referrals here with one INSERT ... SELECT and one DELETE
+
+        Referrals are chosen by student ID, referral date and/or the top N by priority,
+        combined with AND. At least one criterion is required, so nothing approves the
+        whole waitlist by accident. Both statements run in one transaction. Students who
+        were already approved are only removed from the waitlist.
+        """
+        if student_ids is None and referred_before is None and top is None:
+            raise ValueError('approve_many needs student_ids, referred_before or top')
+
+        waitlist = CounsellingWaitlist
+        chosen = sa.select(waitlist.student_id)
+        if student_ids is not None:
+            chosen = chosen.where(waitlist.student_id.in_(student_ids))
+        if referred_before is not None:
+            chosen = chosen.where(waitlist.referral_date < referred_before)
+        if top is not None:
+            chosen = chosen.order_by(waitlist.priority_key.desc(), waitlist.student_id).limit(top)
+
+        # the INSERT takes the write lock, so the DELETE sees the same chosen rows
+        approved = db.session.execute(sa.insert(cls).from_select(
+            ['student_id', 'student_name', 'referral_info', 'referral_date', 'approved_date'],
+            sa.select(waitlist.student_id, waitlist.student_name, waitlist.referral_info,
+                      waitlist.referral_date, sa.literal(datetime.utcnow(), sa.DateTime))
+            .where(waitlist.student_id.in_(chosen),
+                   ~sa.exists().where(cls.student_id == waitlist.student_id)),
+        )).rowcount
+        removed = db.session.execute(
+            sa.delete(waitlist).where(waitlist.student_id.in_(chosen)),
+            execution_options={'synchronize_session': False},
+        ).rowcount
+        db.session.commit()
+        return BulkApproval(approved=approved, already_approved=removed - approved)
+
+
+@dataclass
+class BulkApproval:
+    approved: int
+    already_approved: int
+
+
+
+# Table Version model counting the changes made to the tables behind the cacheable pages
+# Bumped in the same transaction as each change, see app/conditional_get.py
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    modified_at = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def bump(cls, connection, names):
+        """Count a change to each of the named tables, on the connection making the change"""
+        if not names:
+            return
+        table = cls.__table__
+        now = datetime.utcnow().replace(microsecond=0)
+        insert = _upsert(connection, table)
+        connection.execute(
+            insert.on_conflict_do_update(
+                index_elements=[table.c.name],
+                set_=dict(version=table.c.version + 1, modified_at=now),
+            ),
+            [dict(name=name, version=1, modified_at=now) for name in sorted(names)],
+        )
+
+    @classmethod
+    def read(cls, names):
+        """Return {name: (version, modified_at)} for those of the named tables that have changed"""
+        rows = db.session.execute(sa.select(cls.name, cls.version, cls.modified_at).where(cls.name.in_(names)))
+        return {name: (version, modified_at) for name, version, modified_at in rows}
+
+
+# Job model for work done outside requests, queued here and run by `flask jobs worker`
+# See app/jobs.py for the tasks a job can name and the worker that runs them
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    # the task to run, a key of app.jobs.TASKS, and its keyword arguments
+    name = db.Column(db.String(64), nullable=False)
+    args = db.Column(db.JSON, nullable=False, default=dict)
+    # higher runs first among the jobs that are due
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    # queued, running, done or failed
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    # not run before this time; pushed back after each failed attempt
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    # seconds between runs of a recurring job; each run queues the next when it ends
+    every = db.Column(db.Integer, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_jobs_ready', 'status', 'priority', 'run_at'),
+        db.Index('ix_jobs_finished', 'finished_at'),
+        # at most one pending run of each recurring task, however many workers schedule it
+        db.Index('uq_jobs_recurring', 'name', unique=True,
+                 sqlite_where=sa.text("every IS NOT NULL AND status IN ('queued', 'running')"),
+                 postgresql_where=sa.text("every IS NOT NULL AND status IN ('queued', 'running')")),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+    @classmethod
+    def enqueue(cls, name, args=None, priority=0, run_at=None, max_attempts=5):
+        """Queue a job in the current transaction, so it is only run if the caller commits"""
+        job = cls(name=name, args=args or {}, priority=priority, run_at=run_at or datetime.utcnow(),
+                  max_attempts=max_attempts)
+        db.session.add(job)
+        return job
+
+    @classmethod
+    def schedule(cls, name, every, args=None, priority=0, max_attempts=5, run_at=None):
+        """Queue the first run of a recurring job, unless a run of it is already pending"""
+        now = datetime.utcnow()
+        insert = _upsert(db.session.connection(), cls.__table__).on_conflict_do_nothing()
+        db.session.execute(insert, dict(name=name, args=args or {}, priority=priority, status='queued',
+                                        run_at=run_at or now, attempts=0, max_attempts=max_attempts,
+                                        every=every, created_at=now))
+
+    @classmethod
+    def _ready(cls, now, lease):
+        """Due queued jobs, and running jobs whose worker has held them past the lease"""
+        return sa.or_(
+            sa.and_(cls.status == 'queued', cls.run_at <= now),
+            sa.and_(cls.status == 'running', cls.started_at < now - timedelta(seconds=lease)),
+        )
+
+    @classmethod
+    def claim(cls, lease):
+        """Take the most urgent due job for this worker, returning a ClaimedJob or None
+
+        A single UPDATE picks the job and marks it running, and SQLite lets one writer in
+        at a time, so however many workers poll, each job is handed to one of them. A job
+        still running after lease seconds is taken to belong to a worker that died, and is
+        claimed again. Commits.
+        """
+        table = cls.__table__
+        now = datetime.utcnow()
+        ready = cls._ready(now, lease)
+        candidate = (sa.select(cls.id).where(ready)
+                     .order_by(cls.priority.desc(), cls.run_at, cls.id).limit(1).scalar_subquery())
+        row = db.session.execute(
+            sa.update(table)
+            .where(table.c.id == candidate, ready)
+            .values(status='running', started_at=now, finished_at=None, attempts=table.c.attempts + 1)
+            .returning(table.c.id, table.c.name, table.c.args, table.c.attempts, table.c.max_attempts,
+                       table.c.every, table.c.run_at, table.c.priority)
+        ).first()
+        db.session.commit()
+        return ClaimedJob(*row, started_at=now) if row else None
+
+    @classmethod
+    def _release(cls, job, **values):
+        """Update the job if this worker still holds it, returning whether it did"""
+        table = cls.__table__
+        return db.session.execute(
+            sa.update(table)
+            .where(table.c.id == job.id, table.c.status == 'running', table.c.started_at == job.started_at)
+            .values(**values)
+        ).rowcount == 1
+
+    @classmethod
+    def finish(cls, job):
+        """Record a successful run, queueing the next run of a recurring job. Commits."""
+        now = datetime.utcnow()
+        if cls._release(job, status='done', finished_at=now, last_error=None):
+            cls._schedule_next(job, now)
+        db.session.commit()
+
+    @classmethod
+    def fail(cls, job, error, backoff_base, backoff_max):
+        """Record a failed run, retrying after an exponential backoff until max_attempts. Commits."""
+        now = datetime.utcnow()
+        if job.attempts >= job.max_attempts:
+            if cls._release(job, status='failed', finished_at=now, last_error=error):
+                cls._schedule_next(job, now)
+        else:
+            delay = min(backoff_base * 2 ** (job.attempts - 1), backoff_max)
+            cls._release(job, status='queued', run_at=now + timedelta(seconds=delay), last_error=error)
+        db.session.commit()
+
+    @classmethod
+    def _schedule_next(cls, job, now):
+        if job.every:
+            # a run that was missed while no worker was up is made once, not once per interval
+            run_at = max(job.run_at + timedelta(seconds=job.every), now)
+            cls.schedule(job.name, job.every, args=job.args, priority=job.priority,
+                         max_attempts=job.max_attempts, run_at=run_at)
+
+    @classmethod
+    def prune(cls, before):
+        """Delete jobs that finished before the given time, returning how many. Commits."""
+        deleted = db.session.execute(
+            sa.delete(cls.__table__).where(cls.status.in_(('done', 'failed')), cls.finished_at < before)
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    @classmethod
+    def stats(cls, since, sample=1000):
+        """Queue depth and latency for the admin page
+
+        Wait is how long a job sat due before a worker took it, and run is how long it then
+        took, over the last sample jobs finished since the given time.
+        """
+        now = datetime.utcnow()
+        tasks = {}
+
+        def task_stats(name):
+            if name not in tasks:
+                tasks[name] = TaskStats(name)
+            return tasks[name]
+
+        for name, status, count in db.session.execute(
+                sa.select(cls.name, cls.status, sa.func.count()).group_by(cls.name, cls.status)):
+            setattr(task_stats(name), status, count)
+        for name, count, oldest in db.session.execute(
+                sa.select(cls.name, sa.func.count(), sa.func.min(cls.run_at))
+                .where(cls.status == 'queued', cls.run_at <= now).group_by(cls.name)):
+            stats = task_stats(name)
+            stats.ready = count
+            stats.oldest_ready = (now - oldest).total_seconds()
+
+        finished = db.session.execute(
+            sa.select(cls.name, cls.run_at, cls.started_at, cls.finished_at)
+            .where(cls.status == 'done', cls.finished_at >= since)
+            .order_by(cls.finished_at.desc()).limit(sample)
+        ).all()
+        waits, runs = {}, {}
+        for name, run_at, started_at, finished_at in finished:
+            waits.setdefault(name, []).append(max((started_at - run_at).total_seconds(), 0))
+            runs.setdefault(name, []).append((finished_at - started_at).total_seconds())
+        for name in waits:
+            task_stats(name).observe(waits[name], runs[name])
+
+        failures = db.session.scalars(
+            sa.select(cls).where(cls.status == 'failed').order_by(cls.finished_at.desc()).limit(10)
+        ).all()
+        return QueueStats(tasks=sorted(tasks.values(), key=lambda stats: stats.name), failures=failures)
+
+
+@dataclass
+class ClaimedJob:
+    id: int
+    name: str
+    args: dict
+    attempts: int
+    max_attempts: int
+    every: Optional[int]
+    run_at: datetime
+    priority: int
+    started_at: datetime
+
+
+@dataclass
+class TaskStats:
+    name: str
+    queued: int = 0
+    running: int = 0
+    done: int = 0
+    failed: int = 0
+    # queued jobs that are due now, and how long the oldest of them has been due
+    ready: int = 0
+    oldest_ready: Optional[float] = None
+    runs: int = 0
+    wait_avg: Optional[float] = None
+    wait_p95: Optional[float] = None
+    run_avg: Optional[float] = None
+
+    def observe(self, waits, runs):
+        self.runs = len(waits)
+        self.wait_avg = sum(waits) / len(waits)
+        self.wait_p95 = sorted(waits)[math.ceil(0.95 * len(waits)) - 1]
+        self.run_avg = sum(runs) / len(runs)
+
+
+@dataclass
+class QueueStats:
+    tasks: list
+    failures: list
+
+    def total(self, field):
+        return sum(getattr(stats, field) for stats in self.tasks)
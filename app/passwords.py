@@ -0,0 +1,110 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Workers are started by a fork server (or spawned where there is none) rather than forked
+# from the app: a fork of a process with request threads running can copy a lock some
+# thread holds, and the worker then deadlocks on it.
+POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when the worker pool can't check a password in time, so the login can be retried"""
+
+
+class PasswordHasher:
+    """Hashes and checks passwords in a bounded process pool
+
+    Password hashing is deliberately slow and CPU-bound. Running it in worker processes keeps
+    a burst of logins from holding every request thread. The bounded queue means an
+    overloaded server turns logins away quickly instead of letting them pile up. With
+    workers set to 0 the work runs inline, which is what the tests use.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:260000', workers=0, max_pending=64, timeout=10):
+        self.lock = threading.Lock()
+        self.pool = None
+        self.configure(method, workers, max_pending, timeout)
+
+    def configure(self, method, workers, max_pending, timeout):
+        self.shutdown()
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if pwhash was made with different parameters than the configured method
+
+        werkzeug stores the method and work factor in front of the salt, e.g.
+        'pbkdf2:sha256:260000$salt$hash'.
+        """
+        return not pwhash or pwhash.split('$', 1)[0] != self.method
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        # wait a moment for a free slot, but don't queue without limit behind a burst
+        slots = self.slots
+        if not slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy('Too many password checks waiting')
+        try:
+            future = self._pool().submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self.shutdown()
+            raise PasswordHasherBusy('The password worker pool failed')
+        # the slot stays taken until the work is done or cancelled, even if this caller gives up
+        # waiting for it, so the pool's backlog never grows past max_pending
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy('Timed out waiting for a password check')
+        except BrokenProcessPool:
+            # a worker died; start a new pool for the next caller
+            self.shutdown()
+            raise PasswordHasherBusy('The password worker pool failed')
+
+    def _pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=POOL_CONTEXT)
+            return self.pool
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+
+
+hasher = PasswordHasher()
+# the pool lives as long as the process, not an app context, so it is stopped on the way out
+atexit.register(hasher.shutdown)
+
+
+def init_passwords(app):
+    """Set up the password hasher from the PASSWORD_* settings"""
+    hasher.configure(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['PASSWORD_POOL_WORKERS'],
+        app.config['PASSWORD_POOL_MAX_PENDING'],
+        app.config['PASSWORD_POOL_TIMEOUT'],
+    )
@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+from functools import wraps
+from typing import Optional
+
+from flask import g, session
+from flask_login import current_user
+from werkzeug.local import LocalProxy
+
+from app import login
+
+
+# The few facts about the logged-in user that role checks and most views need.
+# It is kept in the (signed) session at login, so checking "is this a student?"
+# or reading the student's id never has to load the user from the database.
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    role: str
+    student_id: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, role=user.type, student_id=getattr(user, 'student_id', None))
+
+    def has_role(self, *roles):
+        return self.role in roles
+
+
+def remember_principal(user):
+    """Cache the principal for a user who has just logged in"""
+    principal = Principal.from_user(user)
+    session['principal'] = {'id': principal.id, 'role': principal.role, 'student_id': principal.student_id}
+    g.principal = principal
+    return principal
+
+
+def forget_principal():
+    """Drop the cached principal, e.g. on logout"""
+    session.pop('principal', None)
+    g.pop('principal', None)
+
+
+def get_principal():
+    """Return the Principal for this request, or None if nobody is logged in
+
+    Read once per request from the session. Only falls back to loading the user
+    when the session has no principal yet, such as a login restored from a
+    remember-me cookie.
+    """
+    if 'principal' in g:
+        return g.principal
+
+    principal = None
+    cached = session.get('principal')
+    if cached and str(cached['id']) == str(session.get('_user_id')):
+        principal = Principal(**cached)
+    elif current_user.is_authenticated:
+        principal = remember_principal(current_user)
+    g.principal = principal
+    return principal
+
+
+# Proxy for the current request's principal, used in views the way current_user is
+current_principal = LocalProxy(get_principal)
+
+
+def principal_required(view):
+    """Like login_required, but checks the cached principal instead of loading the user"""
+    @wraps(view)
+    def wrapped_view(*args, **kwargs):
+        if get_principal() is None:
+            return login.unauthorized()
+        return view(*args, **kwargs)
+    return wrapped_view
+
+
+# Stands in for Flask-Login's context processor (disabled in app/__init__.py), which
+# loads the user for every template rendered. Passing the lazy proxy instead means only
+# templates that actually read current_user, such as the account page, pay for the query.
+def inject_principal():
+    return dict(principal=get_principal(), current_user=current_user)
+
+
+def init_principal(app):
+    app.context_processor(inject_principal)
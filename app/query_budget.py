@@ -0,0 +1,157 @@
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import sqlalchemy as sa
+from flask import g, request
+
+query_debug_log = logging.getLogger('app.query_debug')
+
+# Code under the project root (views, models, tests...) counts as the origin of a query;
+# library frames (SQLAlchemy, Flask, Jinja) in between are skipped
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_active = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a tracked block issues more statements than its budget, or an N+1 pattern"""
+
+
+@dataclass
+class RecordedQuery:
+    statement: str
+    parameters: object
+    origin: Optional[str]
+    template: Optional[str]
+
+
+class QueryTracker:
+    """Collects the statements issued while it is active, and where they came from"""
+
+    def __init__(self, n_plus_one_threshold=3):
+        self.queries = []
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    def __len__(self):
+        return len(self.queries)
+
+    def record(self, statement, parameters):
+        origin, template = _find_origin(sys._getframe(2))
+        self.queries.append(RecordedQuery(statement, parameters, origin, template))
+
+    def n_plus_one(self):
+        """Return (statement, count, origins) for each statement repeated past the threshold
+
+        The same SQL text run over and over, usually with a different id each time, is what a
+        relationship lazy-loading inside a loop looks like.
+        """
+        groups = {}
+        for query in self.queries:
+            groups.setdefault(query.statement, []).append(query)
+        return [
+            (statement, len(queries), sorted({_describe(q) for q in queries}))
+            for statement, queries in groups.items()
+            if len(queries) >= self.n_plus_one_threshold
+        ]
+
+    def report(self, budget=None):
+        lines = [f'{len(self.queries)} queries' + (f' (budget {budget})' if budget is not None else '')]
+        for statement, count, origins in self.n_plus_one():
+            lines.append(f'  N+1: {count}x {" ".join(statement.split())[:200]}')
+            lines.extend(f'    from {origin}' for origin in origins)
+        return '\n'.join(lines)
+
+
+def _find_origin(frame):
+    """Return the innermost project code frame and Jinja template line behind a query"""
+    origin = template = None
+    while frame is not None and (origin is None or template is None):
+        jinja_template = frame.f_globals.get('__jinja_template__')
+        if jinja_template is not None and template is None:
+            template = f'{jinja_template.name}:{jinja_template.get_corresponding_lineno(frame.f_lineno)}'
+        elif origin is None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if filename.startswith(PROJECT_ROOT) and filename != os.path.abspath(__file__):
+                origin = f'{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return origin, template
+
+
+def _describe(query):
+    return f'{query.origin} (template {query.template})' if query.template else str(query.origin)
+
+
+def _trackers():
+    if not hasattr(_active, 'trackers'):
+        _active.trackers = []
+    return _active.trackers
+
+
+@sa.event.listens_for(sa.engine.Engine, 'before_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    for tracker in _trackers():
+        tracker.record(statement, parameters)
+
+
+@contextmanager
+def track_queries(n_plus_one_threshold=3):
+    """Record every statement issued on this thread inside the block"""
+    tracker = QueryTracker(n_plus_one_threshold)
+    _trackers().append(tracker)
+    try:
+        yield tracker
+    finally:
+        _trackers().remove(tracker)
+
+
+@contextmanager
+def query_budget(max_queries, allow_n_plus_one=False, n_plus_one_threshold=3):
+    """Fail with QueryBudgetExceeded if the block issues more than max_queries statements
+
+    Also fails on an N+1 pattern unless allow_n_plus_one is set. For use in tests:
+
+        with query_budget(3):
+            client.get('/counsellor/appointments')
+    """
+    with track_queries(n_plus_one_threshold) as tracker:
+        yield tracker
+    if len(tracker) > max_queries or (tracker.n_plus_one() and not allow_n_plus_one):
+        raise QueryBudgetExceeded(tracker.report(max_queries))
+
+
+def init_query_debug(app):
+    """In QUERY_DEBUG mode, check each request against QUERY_BUDGETS and report N+1 patterns"""
+    if not app.config['QUERY_DEBUG']:
+        return
+
+    @app.before_request
+    def start_query_tracking():
+        g.query_tracker = QueryTracker(app.config['QUERY_N_PLUS_ONE_THRESHOLD'])
+        _trackers().append(g.query_tracker)
+
+    @app.after_request
+    def check_query_budget(response):
+        tracker = g.get('query_tracker')
+        if tracker is None:
+            return response
+
+        response.headers['X-Query-Count'] = str(len(tracker))
+        budget = app.config['QUERY_BUDGETS'].get(request.endpoint)
+        over_budget = budget is not None and len(tracker) > budget
+        if over_budget or tracker.n_plus_one():
+            report = f'{request.method} {request.path} ({request.endpoint}): {tracker.report(budget)}'
+            query_debug_log.warning(report)
+            if over_budget and app.config['QUERY_BUDGET_STRICT']:
+                raise QueryBudgetExceeded(report)
+        return response
+
+    @app.teardown_request
+    def stop_query_tracking(exc):
+        tracker = g.pop('query_tracker', None)
+        if tracker in _trackers():
+            _trackers().remove(tracker)
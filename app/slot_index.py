@@ -0,0 +1,158 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import User, Appointment
+
+
+@dataclass
+class IndexedSlot:
+    start_time: datetime
+    end_time: datetime
+    id: int
+    open: bool
+
+
+@dataclass
+class FreeCounsellor:
+    id: int
+    name: str
+    slots: list
+
+
+class CounsellorTimeline:
+    """One counsellor's slots, sorted by start time
+
+    A counsellor's slots never overlap, so sorting them by start also sorts them by end.
+    Any slot overlapping a new interval is therefore the last one starting before the
+    interval ends, found with a single bisect.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.slots = []
+
+    def add(self, slot):
+        position = bisect_right(self.starts, slot.start_time)
+        self.starts.insert(position, slot.start_time)
+        self.slots.insert(position, slot)
+
+    def overlapping(self, start, end):
+        """Return the slot overlapping [start, end), or None, in O(log n)"""
+        position = bisect_left(self.starts, end) - 1
+        if position >= 0 and self.slots[position].end_time > start:
+            return self.slots[position]
+        return None
+
+    def open_between(self, start, end):
+        """Return the open slots lying entirely inside [start, end)"""
+        position = bisect_left(self.starts, start)
+        found = []
+        while position < len(self.slots) and self.slots[position].start_time < end:
+            slot = self.slots[position]
+            if slot.open and slot.end_time <= end:
+                found.append(slot)
+            position += 1
+        return found
+
+
+class SlotIndex:
+    """In-memory mirror of the upcoming slots, by counsellor
+
+    Answers "which counsellors are free between these times" across every counsellor
+    without a query, and rejects overlapping new slots before they reach the database.
+    The database stays the source of truth. Changes made in this process are applied to
+    the mirror straight away, and it is reloaded every ttl seconds to pick up changes made
+    by other processes. A booking from a stale search result still goes through
+    Appointment.book, so it can never double-book.
+    """
+
+    def __init__(self, ttl=60):
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.timelines = {}
+        self.names = {}
+        self.by_id = {}
+        self.loaded_at = None
+
+    def configure(self, ttl):
+        self.ttl = ttl
+        self.invalidate()
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def _load(self):
+        # called with the lock held
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        timelines = {}
+        names = {}
+        by_id = {}
+        rows = db.session.execute(
+            sa.select(Appointment.id, Appointment.counsellor_id, User.username, Appointment.start_time,
+                      Appointment.end_time, Appointment.student_id.is_(None))
+            .join(User, User.id == Appointment.counsellor_id)
+            .where(Appointment.end_time > datetime.now())
+            .order_by(Appointment.counsellor_id, Appointment.start_time)
+        )
+        for slot_id, counsellor_id, name, start, end, is_open in rows:
+            slot = IndexedSlot(start, end, slot_id, bool(is_open))
+            timeline = timelines.setdefault(counsellor_id, CounsellorTimeline())
+            timeline.starts.append(start)
+            timeline.slots.append(slot)
+            names[counsellor_id] = name
+            by_id[slot_id] = slot
+        self.timelines, self.names, self.by_id = timelines, names, by_id
+        self.loaded_at = time.monotonic()
+
+    def overlapping(self, counsellor_id, start, end):
+        with self.lock:
+            self._load()
+            timeline = self.timelines.get(counsellor_id)
+            return timeline.overlapping(start, end) if timeline else None
+
+    def free_between(self, start, end):
+        """Return the counsellors with open slots inside [start, end), earliest first"""
+        with self.lock:
+            self._load()
+            free = []
+            for counsellor_id, timeline in self.timelines.items():
+                slots = timeline.open_between(start, end)
+                if slots:
+                    free.append(FreeCounsellor(counsellor_id, self.names[counsellor_id], slots))
+            free.sort(key=lambda counsellor: (counsellor.slots[0].start_time, counsellor.name))
+            return free
+
+    def added(self, appointment):
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            if appointment.counsellor_id not in self.names:
+                # a counsellor's first upcoming slot; reload to pick up their name too
+                self.loaded_at = None
+                return
+            slot = IndexedSlot(appointment.start_time, appointment.end_time, appointment.id,
+                               appointment.student_id is None)
+            self.timelines.setdefault(appointment.counsellor_id, CounsellorTimeline()).add(slot)
+            self.by_id[slot.id] = slot
+
+    def booked(self, appointment_id):
+        with self.lock:
+            slot = self.by_id.get(appointment_id)
+            if slot is not None:
+                slot.open = False
+
+
+slot_index = SlotIndex()
+
+
+def init_slot_index(app):
+    """Set how often the slot index is reloaded, from SLOT_INDEX_TTL"""
+    slot_index.configure(app.config['SLOT_INDEX_TTL'])
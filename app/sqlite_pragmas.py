@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the given PRAGMAs on every new connection the engine opens to a SQLite database
+
+    Pragmas such as busy_timeout and cache_size only last for one connection, so they
+    have to be set as each pooled connection is created rather than once at startup.
+    """
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @sa.event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
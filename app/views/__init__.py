@@ -0,0 +1,27 @@
+import importlib
+from datetime import datetime
+
+from flask import request
+
+
+def register_configured_blueprints(app):
+    """Import and register the blueprints named in the BLUEPRINTS setting
+
+    This is config-driven, not lazy: every listed blueprint is imported as the app is
+    built. Leaving one out of BLUEPRINTS keeps its module, and whatever it imports,
+    from being loaded at all.
+    """
+    for name in app.config['BLUEPRINTS']:
+        module = importlib.import_module(f'app.views.{name}')
+        app.register_blueprint(module.bp)
+
+
+def parse_date_arg(name):
+    """Read a YYYY-MM-DD query string argument, ignoring it if it is malformed"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, flash, redirect, render_template, url_for
+
+from app.models import Job
+from app.principal import current_principal, principal_required
+
+bp = Blueprint('admin', __name__)
+
+
+#For staff to check the background job queue is keeping up
+@bp.route("/admin/jobs")
+@principal_required
+def jobs():
+    if not current_principal.has_role('wellbeing_staff', 'admin'):
+        flash("Only wellbeing staff and admins can see the job queue.", "danger")
+        return redirect(url_for("main.home"))
+    hours = current_app.config["JOB_STATS_HOURS"]
+    stats = Job.stats(since=datetime.utcnow() - timedelta(hours=hours))
+    return render_template("jobs.html", title="Jobs", stats=stats, hours=hours)
@@ -0,0 +1,269 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import login_user, logout_user
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.alert_stream import alert_broker, alert_event
+from app.models import WellbeingLog, Appointment, CounsellingWaitlist, ApprovedReferrals, user_with_subclasses
+from app.passwords import PasswordHasherBusy
+from app.principal import current_principal, get_principal, remember_principal, forget_principal
+
+# JSON API for the mobile app. Clients sign in with POST /api/v1/login and keep the session
+# cookie, like the browser does. Lists are paged with an opaque ?cursor= from next_cursor.
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def _error(message, status):
+    return jsonify(error=message), status
+
+
+@bp.before_request
+def require_principal():
+    if request.endpoint != 'api.login' and get_principal() is None:
+        return _error('Sign in first.', 401)
+
+
+@bp.after_request
+def compress(response):
+    """Gzip JSON bodies over API_GZIP_MIN_BYTES for clients that accept it"""
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config['API_GZIP_MIN_BYTES']:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _limit():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def _encode_cursor(value, key):
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    return f'{value}_{key}'
+
+
+def _decode_cursor(parse):
+    """Parse ?cursor= from _encode_cursor, returning None if it is missing or malformed"""
+    try:
+        value, key = request.args['cursor'].rsplit('_', 1)
+        return parse(value), int(key)
+    except (KeyError, ValueError):
+        return None
+
+
+def _page(items, limit, cursor_of, serialize):
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = cursor_of(items[-1])
+    return jsonify(items=[serialize(item) for item in items], next_cursor=next_cursor)
+
+
+def _timestamp(moment):
+    return moment.isoformat() if moment else None
+
+
+def _log_json(log):
+    return {
+        'id': log.id,
+        'client_ref': log.client_ref,
+        'date_logged': _timestamp(log.date_logged),
+        'mood': log.mood,
+        'symptoms': log.symptoms,
+        'alert_flag': bool(log.alert_flag),
+        'alert_reason': log.alert_reason,
+    }
+
+
+def _appointment_json(appointment):
+    return {
+        'id': appointment.id,
+        'counsellor_id': appointment.counsellor_id,
+        'student_id': appointment.student_id,
+        'start_time': _timestamp(appointment.start_time),
+        'end_time': _timestamp(appointment.end_time),
+        'status': appointment.status,
+        'reason': appointment.reason,
+    }
+
+
+def _referral_json(referral, status):
+    return {
+        'student_id': referral.student_id,
+        'student_name': referral.student_name,
+        'referral_info': referral.referral_info,
+        'referral_date': _timestamp(referral.referral_date),
+        'status': status,
+    }
+
+
+@bp.route('/login', methods=['POST'])
+def login():
+    data = request.get_json(silent=True)
+    fields = ('username', 'password', 'type')
+    if not isinstance(data, dict) or not all(isinstance(data.get(name), str) for name in fields):
+        return _error('Send {"username", "password", "type"} as strings.', 400)
+    user = db.session.scalar(
+        sa.select(user_with_subclasses).where(user_with_subclasses.username == data['username'])
+    )
+    if user is None or user.type != data['type']:
+        return _error('Unknown user or user type.', 401)
+    try:
+        if not user.check_password(data['password']):
+            return _error('Invalid password.', 401)
+        user.upgrade_password_hash(data['password'])
+    except PasswordHasherBusy:
+        return _error('Sign-in is busy right now, please try again in a moment.', 503)
+    login_user(user, remember=bool(data.get('remember_me')))
+    principal = remember_principal(user)
+    user.update_last_login()
+    return jsonify(id=principal.id, role=principal.role, student_id=principal.student_id)
+
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    logout_user()
+    forget_principal()
+    return '', 204
+
+
+@bp.route('/wellbeing-logs')
+def wellbeing_logs():
+    """The student's own logs, newest first"""
+    if current_principal.role != 'student':
+        return _error('Only students have wellbeing logs.', 403)
+    logs, next_cursor = WellbeingLog.logs_page(current_principal.id, before=_decode_cursor(datetime.fromisoformat),
+                                               per_page=_limit())
+    return jsonify(items=[_log_json(log) for log in logs], next_cursor=next_cursor)
+
+
+def _sync_entry(item, now):
+    """Validate one queued log, returning (entry, None) or (None, error)"""
+    if not isinstance(item, dict):
+        return None, 'each log must be an object'
+    client_ref = item.get('client_ref')
+    if not isinstance(client_ref, str) or not 0 < len(client_ref) <= 64:
+        return None, 'client_ref must be a string of 1 to 64 characters'
+    mood = item.get('mood')
+    if isinstance(mood, bool) or not isinstance(mood, int) or not 1 <= mood <= 10:
+        return None, 'mood must be a whole number from 1 to 10'
+    symptoms = item.get('symptoms')
+    if symptoms is not None and (not isinstance(symptoms, str) or len(symptoms) > 255):
+        return None, 'symptoms must be text of at most 255 characters'
+    logged = item.get('date_logged')
+    if logged is None:
+        logged = now
+    else:
+        try:
+            logged = datetime.fromisoformat(logged)
+        except (TypeError, ValueError):
+            return None, 'date_logged must be an ISO 8601 date and time'
+        # stored as naive UTC, like the logs made on the website
+        if logged.tzinfo is not None:
+            logged = logged.astimezone(timezone.utc).replace(tzinfo=None)
+        if logged > now + timedelta(minutes=5):
+            return None, 'date_logged is in the future'
+    return dict(client_ref=client_ref, mood=mood, symptoms=symptoms or None, date_logged=logged), None
+
+
+@bp.route('/wellbeing-logs/sync', methods=['POST'])
+def sync_wellbeing_logs():
+    """Save logs the app queued offline, in one transaction, with a result for each
+
+    Send {"logs": [{"client_ref", "mood", "symptoms", "date_logged"}, ...]}. Each result is
+    "created", "duplicate" (that client_ref was already synced, so a retry is safe) or
+    "invalid" with the error; invalid logs don't stop the rest being saved.
+    """
+    if current_principal.role != 'student':
+        return _error('Only students can log their wellbeing.', 403)
+    items = (request.get_json(silent=True) or {}).get('logs')
+    if not isinstance(items, list):
+        return _error('Send {"logs": [...]}.', 400)
+    if len(items) > current_app.config['API_SYNC_MAX_LOGS']:
+        return _error(f"Send at most {current_app.config['API_SYNC_MAX_LOGS']} logs at a time.", 413)
+
+    now = datetime.utcnow()
+    results = [None] * len(items)
+    entries = []
+    positions = []
+    for position, item in enumerate(items):
+        entry, error = _sync_entry(item, now)
+        if error:
+            results[position] = {'index': position, 'status': 'invalid', 'error': error}
+        else:
+            entries.append(entry)
+            positions.append(position)
+
+    try:
+        synced = WellbeingLog.sync(current_principal.id, entries) if entries else []
+        for position, (log, created) in zip(positions, synced):
+            results[position] = {'index': position, 'status': 'created' if created else 'duplicate',
+                                 **_log_json(log)}
+        alerts = [(log.id, alert_event(log)) for log, created in synced if created and log.alert_flag]
+        db.session.commit()
+    except IntegrityError:
+        # another sync of the same logs got there first; retrying will report them as duplicates
+        db.session.rollback()
+        return _error('These logs are being synced by another request, try again.', 409)
+
+    # staff watching the alerts page hear about them once they are committed
+    for log_id, alert in alerts:
+        alert_broker.publish(log_id, alert)
+    return jsonify(results=results)
+
+
+@bp.route('/appointments')
+def appointments():
+    """A student's booked appointments, or a counsellor's slots, soonest first"""
+    if current_principal.role == 'student':
+        query = sa.select(Appointment).where(Appointment.student_id == current_principal.id)
+    elif current_principal.role == 'counsellor':
+        query = sa.select(Appointment).where(Appointment.counsellor_id == current_principal.id)
+    else:
+        return _error('Only students and counsellors have appointments.', 403)
+    if request.args.get('upcoming') == '1':
+        query = query.where(Appointment.end_time > datetime.now())
+    after = _decode_cursor(datetime.fromisoformat)
+    if after is not None:
+        query = query.where(sa.tuple_(Appointment.start_time, Appointment.id) > sa.tuple_(*after))
+    limit = _limit()
+    found = db.session.scalars(query.order_by(Appointment.start_time, Appointment.id).limit(limit + 1)).all()
+    return _page(found, limit, lambda appointment: _encode_cursor(appointment.start_time, appointment.id),
+                 _appointment_json)
+
+
+@bp.route('/referrals')
+def referrals():
+    """A student's own referral, or for wellbeing staff the waitlist most urgent first"""
+    if current_principal.role == 'student':
+        waiting = db.session.get(CounsellingWaitlist, current_principal.student_id)
+        approved = db.session.get(ApprovedReferrals, current_principal.student_id) if waiting is None else None
+        items = [_referral_json(waiting, 'waiting')] if waiting else []
+        items += [_referral_json(approved, 'approved')] if approved else []
+        return jsonify(items=items, next_cursor=None)
+    if current_principal.role != 'wellbeing_staff':
+        return _error('Only students and wellbeing staff can see referrals.', 403)
+
+    query = CounsellingWaitlist.by_priority()
+    after = _decode_cursor(float)
+    if after is not None:
+        priority, student_id = after
+        query = query.where(sa.or_(
+            CounsellingWaitlist.priority_key < priority,
+            sa.and_(CounsellingWaitlist.priority_key == priority, CounsellingWaitlist.student_id > student_id),
+        ))
+    limit = _limit()
+    found = db.session.scalars(query.limit(limit + 1)).all()
+    return _page(found, limit, lambda referral: _encode_cursor(referral.priority_key, referral.student_id),
+                 lambda referral: dict(_referral_json(referral, 'waiting'), triage_days=referral.triage_days))
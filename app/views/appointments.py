@@ -0,0 +1,181 @@
+from datetime import datetime, time, timedelta
+
+import sqlalchemy.orm as so
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
+
+from app import db
+from app.forms import AppointmentForm, AddSlotForm
+from app.fragment_cache import fragment_cache
+from app.models import Appointment, ApprovedReferrals
+from app.principal import current_principal, principal_required
+from app.slot_index import slot_index
+from app.views import parse_date_arg
+
+bp = Blueprint('appointments', __name__)
+
+
+@bp.route("/book/appointment", methods=["GET", "POST"])
+@principal_required
+def book_appointment():
+    #checks that user is a student
+    if current_principal.role != 'student':
+        flash("Only students can book appointments.", "danger")
+        return redirect(url_for('main.home'))
+    #checks if student has been approved for counselling, redirects if not
+    approved = ApprovedReferrals.query.filter_by(student_id=current_principal.student_id).first()
+    if not approved:
+        flash(
+            "You must be approved for counselling to book an appointment. Please complete a self-referral form or check the status of your referral.",
+            "danger")
+        return redirect(url_for("main.home"))
+
+    form=AppointmentForm()
+
+    # show one window of days at a time, starting today unless another window was asked for
+    today = datetime.combine(datetime.today(), time.min)
+    window_start = max(parse_date_arg("week") or today, today)
+    window_days = current_app.config["BOOKING_WINDOW_DAYS"]
+    window_end = window_start + timedelta(days=window_days)
+
+    # every student sees the same grid, so it is only rendered again each minute or when the slots change
+    grid_start = max(window_start, datetime.now().replace(second=0, microsecond=0))
+    slot_grid = fragment_cache.render(
+        "slot_grid", ("appointments",),
+        lambda: render_template("fragments/slot_grid.html",
+                                calendar=Appointment.available_calendar(grid_start, window_end)),
+        grid_start, window_end,
+    )
+    search = _free_time_search()
+    previous_week = None
+    if window_start > today:
+        previous_week = max(window_start - timedelta(days=window_days), today)
+
+    return render_template(
+        'book_appointment.html',
+        title="Book Appointment",
+        slot_grid=slot_grid,
+        window_start=window_start,
+        window_end=window_end - timedelta(days=1),
+        previous_week=previous_week,
+        next_week=window_end,
+        search=search,
+        form=form,
+    )
+
+
+def _free_time_search():
+    """Counsellors free on ?on= between ?from= and ?to= (HH:MM), from the in-memory slot index"""
+    day = parse_date_arg("on")
+    if day is None:
+        return None
+    try:
+        start = datetime.combine(day, datetime.strptime(request.args.get("from") or "00:00", "%H:%M").time())
+        end = datetime.combine(day, datetime.strptime(request.args.get("to") or "23:59", "%H:%M").time())
+    except ValueError:
+        return None
+    return {
+        "day": day,
+        "start": start,
+        "end": end,
+        "counsellors": slot_index.free_between(max(start, datetime.now()), end),
+    }
+
+
+@bp.route('/confirm_appointment/<int:appointment_id>', methods=['GET', 'POST'])
+@principal_required
+def confirm_appointment(appointment_id):
+    if current_principal.role != 'student':
+        flash("Only students can book appointments.", "danger")
+        return redirect(url_for('main.home'))
+
+    appointment = db.session.get(Appointment, appointment_id)
+    if appointment is None:
+        return abort(404)
+    form=AppointmentForm()
+    if appointment.student_id is not None:
+        flash('Sorry, this appointment has already been booked.', 'danger')
+        return redirect(url_for('.book_appointment'))
+
+    if request.method == 'POST':
+        reason = request.form.get('reason')
+
+        if not reason:
+            flash('Please provide a reason for your appointment.', 'warning')
+            return redirect(request.url)
+
+        # the slot may have been taken since it was read above, so the booking itself
+        # only succeeds if the slot is still free at the moment it is written
+        if not Appointment.book(appointment_id, current_principal.id, reason):
+            flash('Sorry, this appointment has already been booked.', 'danger')
+            return redirect(url_for('.book_appointment'))
+        slot_index.booked(appointment_id)
+
+        flash('Your appointment has been booked successfully!', 'success')
+        return redirect(url_for('.view_appointment'))
+
+    return render_template('confirm_appointment.html', title="Confirm Appointment", appointment=appointment, form=form)
+
+
+@bp.route('/view_appointment')
+@principal_required
+def view_appointment():
+    if current_principal.role != 'student':
+        flash("Only students can view their booked appointments.", "danger")
+        return redirect(url_for("main.home"))
+
+    appointments = (
+        Appointment.query.filter_by(student_id=current_principal.id)
+        .options(so.joinedload(Appointment.counsellor))
+        .order_by(Appointment.start_time.asc())
+        .all()
+    )
+
+    return render_template('view_appointment.html', title="View Appointment", appointments=appointments)
+
+
+@bp.route("/counsellor/appointments")
+@principal_required
+def counsellor_appointments():
+    if current_principal.role != 'counsellor':
+        flash("Only counsellors can view this page.", "danger")
+        return redirect(url_for("main.home"))
+
+    appointments = (
+        Appointment.query.filter_by(counsellor_id=current_principal.id)
+        .options(so.joinedload(Appointment.student))
+        .order_by(Appointment.start_time.asc())
+        .all()
+    )
+
+    return render_template('counsellor_appointments.html', title='View Appointments', appointments=appointments)
+
+
+@bp.route("/counsellor/add_slot", methods=["GET", "POST"])
+@principal_required
+def add_slot():
+    if current_principal.role != 'counsellor':
+        flash("Only counsellors can add slots.", "danger")
+        return redirect(url_for('main.home'))
+
+    form = AddSlotForm()
+
+    if form.validate_on_submit():
+        start, end = form.start_time.data, form.end_time.data
+        if end <= start:
+            flash("The slot must end after it starts.", "danger")
+            return render_template('add_slot.html', title='Add New Slot', form=form)
+        # the in-memory index turns most clashes away without a query; the insert itself
+        # checks the database too, as it also holds slots added by other processes
+        clash = slot_index.overlapping(current_principal.id, start, end)
+        new_slot = None if clash else Appointment.add_slot(current_principal.id, start, end)
+        if new_slot is None:
+            clash = clash or Appointment.find_overlap(current_principal.id, start, end)
+            flash(f"That overlaps your slot from {clash.start_time:%d %B %H:%M}." if clash
+                  else "That overlaps one of your slots.", "danger")
+            return render_template('add_slot.html', title='Add New Slot', form=form)
+        slot_index.added(new_slot)
+
+        flash("New slot added successfully!", "success")
+        return redirect(url_for('.counsellor_appointments'))
+
+    return render_template('add_slot.html', title='Add New Slot', form=form)
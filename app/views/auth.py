@@ -0,0 +1,77 @@
+from urllib.parse import urlsplit
+
+import sqlalchemy as sa
+from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask_login import login_user, logout_user
+
+from app import db
+from app.forms import LoginForm
+from app.models import user_with_subclasses
+from app.passwords import PasswordHasherBusy
+from app.principal import get_principal, remember_principal, forget_principal
+
+bp = Blueprint('auth', __name__)
+
+
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    if get_principal() is not None:
+        return redirect(url_for("main.home"))
+
+    form = LoginForm()
+    if form.validate_on_submit():
+        # Here you would typically integrate the university's authentication system
+        # Instead, we just check if the user exists and has the correct type
+        user = db.session.scalar(
+            sa.select(user_with_subclasses).where(user_with_subclasses.username == form.username.data)
+        )
+
+        if user is None:
+            flash("User not found. Please contact the system administrator.", "danger")
+            return redirect(url_for(".login"))
+
+        if user.type != form.type.data:
+            flash("Invalid user type selection.", "danger")
+            return redirect(url_for(".login"))
+
+        # In a real implementation, you would verify the user's credentials
+        # with the university's authentication system here
+        # This is where we would make the API call to the university's auth system
+        # with form.username.data and form.password.data
+
+        # For now, we'll just check if the password matches
+        try:
+            if not user.check_password(form.password.data):
+                flash("Invalid password.", "danger")
+                return redirect(url_for(".login"))
+            user.upgrade_password_hash(form.password.data)
+        except PasswordHasherBusy:
+            flash("Sign-in is busy right now, please try again in a moment.", "warning")
+            return render_template("generic_form.html", title="Sign In", form=form), 503
+
+        login_user(user, remember=form.remember_me.data)
+        remember_principal(user)
+        user.update_last_login()
+
+        next_page = request.args.get("next")
+        if not next_page or urlsplit(next_page).netloc != "":
+            next_page = url_for("main.home")
+        return redirect(next_page)
+
+    return render_template("generic_form.html", title="Sign In", form=form)
+
+
+@bp.route("/logout")
+def logout():
+    logout_user()
+    forget_principal()
+    return redirect(url_for("main.home"))
+
+# Debug route to reset database - go to the url /debug/reset-db to reset the database
+# DEV TOOL ONLY - DO NOT PUSH TO PRODUCTION
+# @bp.route("/debug/reset-db")
+# def debug_reset_db():
+#     from app.debug_utils import reset_db
+#     reset_db()
+#     flash("Database has been reset with test data.", "success")
+#     return redirect(url_for("main.home"))
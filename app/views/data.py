@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request, \
+    stream_with_context, url_for
+
+from app import db
+from app.exports import EXPORTS, FORMATS, stream_rows
+from app.importer import IMPORTERS, ImportFormatError, UploadsFull, start_upload, append_chunk, import_upload
+from app.principal import current_principal, principal_required
+from app.slot_index import slot_index
+from app.views import parse_date_arg
+
+bp = Blueprint('data', __name__)
+
+
+@bp.route("/export/<name>")
+@principal_required
+def export(name):
+    """Download a table as CSV or NDJSON (?format=ndjson), optionally between ?start= and ?end= dates"""
+    table = EXPORTS.get(name)
+    if table is None:
+        abort(404)
+    if not current_principal.has_role(*table.roles):
+        abort(403)
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        abort(400)
+
+    start = parse_date_arg("start")
+    end = parse_date_arg("end")
+    query = table.query(current_principal, start=start, end=end + timedelta(days=1) if end else None)
+    # rows are streamed from the cursor as the response is sent, so memory use doesn't grow with the table
+    return Response(
+        stream_with_context(stream_rows(db.session, query, fmt, current_app.config["EXPORT_BATCH_SIZE"])),
+        mimetype=FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={name}-{datetime.utcnow():%Y%m%d}.{fmt}"},
+    )
+
+
+#For staff to load students and counsellor timetables from CSV files
+@bp.route("/import")
+@principal_required
+def import_data():
+    if not current_principal.has_role('wellbeing_staff', 'admin'):
+        flash("Only wellbeing staff and admins can import data.", "danger")
+        return redirect(url_for("main.home"))
+    return render_template(
+        "import.html", title="Import", kinds=list(IMPORTERS), chunk_size=current_app.config["IMPORT_CHUNK_SIZE"]
+    )
+
+
+# Files are sent in IMPORT_CHUNK_SIZE pieces, each well under MAX_CONTENT_LENGTH: start an
+# upload, PUT each chunk at its byte offset, then import it
+@bp.route("/import/uploads", methods=["POST"])
+@principal_required
+def start_import_upload():
+    if not current_principal.has_role('wellbeing_staff', 'admin'):
+        abort(403)
+    try:
+        upload_id = start_upload(current_app.config["UPLOAD_FOLDER"], current_app.config["IMPORT_UPLOADS_MAX_BYTES"])
+    except UploadsFull:
+        return jsonify(error="Too many imports are being uploaded, try again later."), 507
+    return jsonify(upload_id=upload_id, chunk_size=current_app.config["IMPORT_CHUNK_SIZE"])
+
+
+@bp.route("/import/uploads/<upload_id>", methods=["PUT"])
+@principal_required
+def upload_import_chunk(upload_id):
+    if not current_principal.has_role('wellbeing_staff', 'admin'):
+        abort(403)
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        abort(400)
+    try:
+        accepted, size = append_chunk(current_app.config["UPLOAD_FOLDER"], upload_id, offset, request.stream,
+                                      request.content_length or 0, current_app.config["IMPORT_UPLOADS_MAX_BYTES"])
+    except (ValueError, FileNotFoundError):
+        abort(404)
+    except UploadsFull:
+        return jsonify(error="Too many imports are being uploaded, try again later."), 507
+    # 409 tells the client where the file really ends, so it can resume from there
+    return jsonify(size=size), 200 if accepted else 409
+
+
+@bp.route("/import/uploads/<upload_id>/<kind>", methods=["POST"])
+@principal_required
+def finish_import_upload(upload_id, kind):
+    if not current_principal.has_role('wellbeing_staff', 'admin'):
+        abort(403)
+    if kind not in IMPORTERS:
+        abort(404)
+    try:
+        result = import_upload(current_app.config["UPLOAD_FOLDER"], upload_id, kind,
+                               current_app.config["IMPORT_BATCH_SIZE"], current_app.config["IMPORT_MAX_ERRORS"])
+    except ImportFormatError as e:
+        return jsonify(error=str(e)), 400
+    except (ValueError, FileNotFoundError):
+        # a malformed upload id, or one that was never started or has been imported already
+        abort(404)
+    if kind == 'slots' and result.inserted:
+        slot_index.invalidate()
+    if result.failed:
+        # the rows before the unreadable part were imported, so say which
+        return jsonify(error=result.failed, **result.to_dict()), 400
+    return jsonify(result.to_dict())
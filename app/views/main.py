@@ -0,0 +1,42 @@
+from flask import Blueprint, render_template
+from flask_login import current_user, login_required
+
+bp = Blueprint('main', __name__)
+
+
+@bp.route("/")
+def home():
+    return render_template("home.html", title="Home")
+
+
+@bp.route("/account")
+@login_required
+def account():
+    return render_template("account.html", title="Account", user=current_user)
+
+
+# Error handlers
+# See: https://en.wikipedia.org/wiki/List_of_HTTP_status_codes
+
+
+# Error handler for 403 Forbidden
+@bp.app_errorhandler(403)
+def error_403(error):
+    return render_template("errors/403.html", title="Error"), 403
+
+
+# Handler for 404 Not Found
+@bp.app_errorhandler(404)
+def error_404(error):
+    return render_template("errors/404.html", title="Error"), 404
+
+
+@bp.app_errorhandler(413)
+def error_413(error):
+    return render_template("errors/413.html", title="Error"), 413
+
+
+# 500 Internal Server Error
+@bp.app_errorhandler(500)
+def error_500(error):
+    return render_template("errors/500.html", title="Error"), 500
@@ -0,0 +1,196 @@
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
+
+from app import db
+from app.forms import ChooseForm, ReferralForm
+from app.fragment_cache import fragment_cache
+from app.models import CounsellingWaitlist, ApprovedReferrals
+from app.principal import current_principal, principal_required
+
+bp = Blueprint('referrals', __name__)
+
+
+#Counselling self-referral form
+@bp.route("/referral_form", methods=["GET", "POST"])
+@principal_required
+def referral_form():
+    if current_principal.role != 'student':
+        flash(
+            "Only students have access to the the counselling self-referral form.",
+            "danger",
+        )
+        return redirect(url_for("main.home"))
+    #checking if referral already exists for this user in the database
+    existing_referral = CounsellingWaitlist.query.filter_by(student_id=current_principal.student_id).first()
+    if existing_referral:
+        flash("You have already submitted a counselling self-referral form.", "info")
+        return redirect(url_for(".view_referral"))
+    form = ReferralForm()
+    if form.validate_on_submit():
+        student_id = current_principal.student_id
+        student_name = form.referral_name.data
+        referral_info = form.referral_details.data
+        new_referral = CounsellingWaitlist(student_id=student_id, student_name=student_name, referral_info=referral_info)
+        db.session.add(new_referral)
+        db.session.commit()
+        #Above code adds new referral to the database using data submitted via the self-referral form.
+        flash(f"Counselling Self Referral Successfully Submitted")
+        return redirect(url_for("main.home"))
+    else:
+        if request.method == "POST":
+            flash(form.errors)
+    return render_template(
+        "referral_form.html", title="Counselling Self-Referral Form", form=form
+    )
+
+
+#For wellbeing staff to view the whole counselling waiting list and approve referrals
+@bp.route("/view_waitlist")
+@principal_required
+def view_waitlist():
+    if current_principal.role != 'wellbeing_staff':
+        flash(
+            "Only wellbeing-staff can view the counselling waiting list.",
+            "danger",
+        )
+        return redirect(url_for("main.home"))
+    # most urgent first, a page at a time
+    page = request.args.get("page", 1, type=int)
+    waitlist_table = fragment_cache.render(
+        "waitlist_table", ("counselling_waitlist",),
+        lambda: render_template("fragments/waitlist_table.html", referrals=db.paginate(
+            CounsellingWaitlist.by_priority(), page=page, per_page=current_app.config["WAITLIST_PER_PAGE"], error_out=False
+        )),
+        # days waiting are counted from today
+        page, datetime.utcnow().date(),
+    )
+    # the bulk form's CSRF token is per session, so it stays out of the shared cached table
+    return render_template('waitlist.html', title="Counselling Waitlist", waitlist_table=waitlist_table,
+                           bulk_form=ChooseForm())
+
+
+@bp.route('/approve_referral/<int:student_id>', methods=['POST'])
+@principal_required
+def approve_referral(student_id):
+    if current_principal.role != 'wellbeing_staff':
+        flash("Only wellbeing staff can approve referrals.", "danger")
+        return redirect(url_for('main.home'))
+
+    referral = db.session.get(CounsellingWaitlist, student_id)
+    if referral is None:
+        return abort(404)
+
+    # Move referral to ApprovedReferrals
+    approved_referral = ApprovedReferrals(
+        student_id=referral.student_id,
+        student_name=referral.student_name,
+        referral_info=referral.referral_info,
+        referral_date=referral.referral_date,
+        approved_date=datetime.utcnow()
+    )
+
+    db.session.add(approved_referral)
+    #delete referral from counselling waiting list
+    db.session.delete(referral)
+    db.session.commit()
+
+    flash(f"Referral for {referral.student_name}, ID: {referral.student_id} approved and moved to approved referrals.", "success")
+    return redirect(url_for('.view_waitlist'))
+
+
+#For wellbeing staff to approve many referrals at once, e.g. after a staff meeting
+@bp.route('/approve_referrals', methods=['POST'])
+@principal_required
+def approve_referrals():
+    if current_principal.role != 'wellbeing_staff':
+        flash("Only wellbeing staff can approve referrals.", "danger")
+        return redirect(url_for('main.home'))
+
+    if not ChooseForm().validate_on_submit():
+        flash("The form has expired, please try again.", "warning")
+        return redirect(url_for('.view_waitlist'))
+
+    # the ticked referrals, everything referred before a date, or given both, the ticked
+    # referrals that were referred before the date
+    student_ids = request.form.getlist('student_ids', type=int) or None
+    referred_before = None
+    if request.form.get('referred_before'):
+        try:
+            referred_before = datetime.strptime(request.form['referred_before'], "%Y-%m-%d")
+        except ValueError:
+            flash("Invalid referral date.", "danger")
+            return redirect(url_for('.view_waitlist'))
+    if student_ids is None and referred_before is None:
+        flash("Select referrals to approve, or a referral date.", "warning")
+        return redirect(url_for('.view_waitlist'))
+
+    result = ApprovedReferrals.approve_many(student_ids=student_ids, referred_before=referred_before)
+    message = f"{result.approved} referrals approved and moved to approved referrals."
+    if result.already_approved:
+        message += f" {result.already_approved} were already approved and have been removed from the waitlist."
+    flash(message, "success")
+    return redirect(url_for('.view_waitlist'))
+
+
+#For wellbeing staff to view approved referrals.
+@bp.route('/view_approved_referrals')
+@principal_required
+def approved_referrals():
+    if current_principal.role != 'wellbeing_staff':
+        flash("Only wellbeing staff can view approved referrals.", "danger")
+        return redirect(url_for('main.home'))
+
+    approved_table = fragment_cache.render(
+        "approved_referrals_table", ("approved_referrals",),
+        lambda: render_template("fragments/approved_referrals_table.html",
+                                approved_referrals=ApprovedReferrals.query.all()),
+    )
+    return render_template('approved_referrals.html', title="Approved Referrals", approved_table=approved_table)
+
+
+#For student users to view and edit/delete their own referral
+@bp.route("/view_referral")
+@principal_required
+def view_referral():
+    if current_principal.role != 'student':
+        flash(
+            "Only students can view this page.",
+            "danger",
+        )
+        return redirect(url_for("main.home"))
+    referral = CounsellingWaitlist.query.filter_by(student_id=current_principal.student_id).first()
+    if referral is None:
+        flash('No referral found for your account.', 'danger')
+        return redirect(url_for('main.home'))
+    return render_template('referral_detail.html', title='My Referral', referral=referral)
+
+
+@bp.route('/edit_referral/<int:student_id>', methods=['GET', 'POST'])
+@principal_required
+def edit_referral(student_id):
+    referral = db.session.get(CounsellingWaitlist, student_id)
+    if referral is None:
+        return abort(404)
+
+    if request.method == "POST":
+        # Update the referral_info from the form
+        new_info = request.form['referral_info']
+        referral.referral_info = new_info
+        db.session.commit()
+        flash("Referral information updated successfully!", "success")
+        return redirect(url_for('.view_referral', student_id=student_id))
+
+    return render_template('edit_referral.html', title="Edit Referral", referral=referral)
+
+
+@bp.route("/delete_referral/<int:student_id>", methods=["POST"])
+@principal_required
+def delete_referral(student_id):
+    referral = db.session.get(CounsellingWaitlist, student_id)
+    if referral is None:
+        return abort(404)
+    db.session.delete(referral)
+    db.session.commit()
+    flash("Referral deleted successfully!", "success")
+    return redirect(url_for('main.home'))
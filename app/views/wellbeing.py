@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+from flask import Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request, url_for
+
+from app import db
+from app.alert_stream import alert_broker, alert_event, AlertStreamFull
+from app.forms import WellbeingLogForm
+from app.models import WellbeingLog, MoodRollup
+from app.principal import current_principal, principal_required
+from app.views import parse_date_arg
+
+bp = Blueprint('wellbeing', __name__)
+
+
+@bp.route("/tracker", methods=["GET", "POST"])
+@principal_required
+def wellbeing_tracker():
+    # allow only students to access the tracker as they are the only ones
+    # who can log moods
+    if current_principal.role != 'student':
+        flash(
+            "Only students have access to the wellbeing tracker logs and form.",
+            "danger",
+        )
+        return redirect(url_for("main.home"))
+
+    form = WellbeingLogForm()
+
+    if form.validate_on_submit():
+        mood = form.mood.data
+        symptoms = form.symptoms.data
+
+        # the alert rules (app/alert_rules.py) flag the log as it is saved
+        new_log = WellbeingLog(
+            user_id=current_principal.id, mood=mood, symptoms=symptoms
+        )
+
+        db.session.add(new_log)
+        db.session.flush()
+        alert = alert_event(new_log) if new_log.alert_flag else None
+        db.session.commit()
+        # staff watching the alerts page hear about it once it is committed
+        if alert is not None:
+            alert_broker.publish(new_log.id, alert)
+
+        flash("Your wellbeing log has been saved.", "success")
+
+        return redirect(url_for(".wellbeing_tracker"))
+
+    # only the most recent entries are listed; the chart reads rollups from mood_series
+    logs = (
+        WellbeingLog.query.filter_by(user_id=current_principal.id)
+        .order_by(WellbeingLog.date_logged.desc(), WellbeingLog.id.desc())
+        .limit(current_app.config["TRACKER_RECENT_LOGS"])
+        .all()
+    )
+    return render_template(
+        "wellbeing_tracker.html", title="Wellbeing Tracker", form=form, logs=logs
+    )
+
+
+@bp.route("/tracker/series")
+@principal_required
+def mood_series():
+    """Mood time series for the tracker chart, as JSON"""
+    if current_principal.role != 'student':
+        abort(403)
+
+    period = request.args.get("period", "day")
+    if period not in MoodRollup.PERIODS:
+        abort(400)
+    start = parse_date_arg("start")
+    end = parse_date_arg("end")
+    max_points = current_app.config["MOOD_SERIES_MAX_POINTS"]
+    points = MoodRollup.series(
+        current_principal.id,
+        period=period,
+        start=start.date() if start else None,
+        # the end date is inclusive, so stop at the day after
+        end=(end + timedelta(days=1)).date() if end else None,
+        max_points=max(1, min(request.args.get("points", max_points, type=int), max_points)),
+    )
+    return jsonify(period=period, points=points)
+
+
+@bp.route("/alerts")
+@principal_required
+def view_alerts():
+    if not current_principal.has_role('counsellor', 'wellbeing_staff'):
+        flash(
+            "Access denied. Alerts are only available to wellbeing staff and counsellors.",
+            "danger",
+        )
+        return redirect(url_for("main.home"))
+
+    # filters come in on the query string so a filtered page can be bookmarked
+    start = parse_date_arg("start")
+    end = parse_date_arg("end")
+    student = request.args.get("student", type=int)
+    before = WellbeingLog.decode_cursor(request.args.get("before"))
+
+    alerts, next_cursor = WellbeingLog.alerts_page(
+        before=before,
+        per_page=current_app.config["ALERTS_PER_PAGE"],
+        start=start,
+        # the end date is inclusive, so stop at midnight the day after
+        end=end + timedelta(days=1) if end else None,
+        user_id=student,
+    )
+    filters = {
+        "start": request.args.get("start", ""),
+        "end": request.args.get("end", ""),
+        "student": request.args.get("student", ""),
+    }
+    return render_template(
+        "alerts.html",
+        title="Alerts",
+        alerts=alerts,
+        next_cursor=next_cursor,
+        filters=filters,
+        # new alerts are pushed to the first, unfiltered page
+        live=before is None and not any(filters.values()),
+    )
+
+
+@bp.route("/alerts/stream")
+@principal_required
+def alert_stream():
+    """Server-Sent Events stream of new alerts, for the alerts page"""
+    if not current_principal.has_role('counsellor', 'wellbeing_staff'):
+        abort(403)
+
+    # browsers send Last-Event-ID when they reconnect, so nothing is missed in between
+    # (the query string is for clients that can't set headers); anything but an integer is ignored
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get("last_event_id", type=int)
+    try:
+        subscriber = alert_broker.subscribe(last_event_id)
+    except AlertStreamFull:
+        abort(503)
+    return Response(
+        alert_broker.stream(subscriber, current_app.config["ALERT_STREAM_HEARTBEAT"]),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,78 @@
+"""Per-row versus set-based referral approval
+
+Seeds a scratch database with a waitlist of --referrals synthetic referrals twice. The
+first time it approves them one POST /approve_referral at a time, as staff did before.
+The second time it approves them all with one POST /approve_referrals. Reports the time
+and SQL statements for each:
+
+    python benchmarks/bulk_approve.py --referrals 500
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'unisupport-bench.sqlite'))
+
+import sqlalchemy as sa
+from app import create_app, db
+from app.models import CounsellingWaitlist, ApprovedReferrals
+from app.debug_utils import reset_db, seed_synthetic
+
+app = create_app()
+
+
+def prepare(referrals):
+    with app.app_context(), contextlib.redirect_stdout(sys.stderr):
+        reset_db()
+        seed_synthetic(students=referrals, referrals=referrals)
+        return db.session.scalars(sa.select(CounsellingWaitlist.student_id)).all()
+
+
+def logged_in_client():
+    client = app.test_client()
+    client.post('/login', data={'username': 'wellbeing1', 'password': 'password123', 'type': 'wellbeing_staff'})
+    return client
+
+
+def timed(fn, statements):
+    statements.clear()
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started, len(statements)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--referrals', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    statements = []
+    with app.app_context():
+        db.engine.echo = False
+        sa.event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+    student_ids = prepare(args.referrals)
+    client = logged_in_client()
+    per_row = timed(lambda: [client.post(f'/approve_referral/{sid}') for sid in student_ids], statements)
+
+    student_ids = prepare(args.referrals)
+    client = logged_in_client()
+    bulk = timed(lambda: client.post('/approve_referrals', data={'student_ids': [str(s) for s in student_ids]}),
+                 statements)
+
+    with app.app_context():
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(ApprovedReferrals)) == len(student_ids)
+
+    for name, (seconds, count) in (('per-row', per_row), ('bulk', bulk)):
+        print(f'{name:<8} {len(student_ids)} referrals in {seconds * 1000:>9.1f}ms  {count:>6} statements')
+    print(f'bulk is x{per_row[0] / bulk[0]:.1f} faster')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
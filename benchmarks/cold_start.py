@@ -0,0 +1,98 @@
+"""Import-time report for a worker's cold start
+
+Starts a fresh interpreter --runs times, builds the app the way a production worker does
+(wsgi.py, or importing the app package in trees from before the app factory) and reports
+the best wall time, the modules imported and the slowest imports from -X importtime. With
+--baseline it does the same for another git revision, for a before and after:
+
+    python benchmarks/cold_start.py --baseline HEAD~1
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# run in the child interpreter: build the app, then report what was loaded
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+if os.path.exists('wsgi.py'):
+    import wsgi
+else:
+    import app
+elapsed = time.perf_counter() - started
+watched = ['flask_migrate', 'alembic', 'app.debug_utils', 'app.views', 'app.cli']
+print(json.dumps({'seconds': elapsed, 'modules': len(sys.modules),
+                  'loaded': [name for name in watched if name in sys.modules]}))
+"""
+
+
+def measure(tree, runs):
+    env = dict(os.environ, APP_CONFIG='production', PYTHONDONTWRITEBYTECODE='1',
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.gettempdir(), 'unisupport-cold-start.sqlite'))
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=tree, env=env,
+                                capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or report['seconds'] < best['seconds']:
+            best = report
+            best['slowest'] = slowest_imports(result.stderr)
+    return best
+
+
+def slowest_imports(importtime, count=8):
+    """The project and package imports with the largest cumulative time, from -X importtime output"""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        # top-level imports only, not each of their submodules
+        if not name.startswith(' '):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def checkout(revision):
+    """Extract the tree at a git revision into a temporary directory"""
+    archive = subprocess.run(['git', 'archive', revision], cwd=ROOT, capture_output=True, check=True).stdout
+    target = tempfile.mkdtemp(prefix='unisupport-baseline-')
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return target
+
+
+def print_report(label, report):
+    print(f"{label:<10} {report['seconds'] * 1000:>8.1f}ms  {report['modules']:>5} modules  "
+          f"loaded: {', '.join(report['loaded']) or '-'}")
+    for microseconds, name in report['slowest']:
+        print(f"{'':<12}{microseconds / 1000:>8.1f}ms  {name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', help='git revision to compare against, e.g. HEAD~1')
+    args = parser.parse_args(argv)
+
+    current = measure(ROOT, args.runs)
+    if args.baseline:
+        before = measure(checkout(args.baseline), args.runs)
+        print_report(args.baseline, before)
+        print_report('current', current)
+        print(f"cold start x{before['seconds'] / current['seconds']:.2f} faster, "
+              f"{before['modules'] - current['modules']} fewer modules")
+    else:
+        print_report('current', current)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Login throughput with password hashing inline versus in the worker pool
+
+Simulates a burst of logins by driving POST /login from many threads while one more
+thread keeps requesting a cheap page (the home page). The burst runs once with hashing
+inline on the request threads (PASSWORD_POOL_WORKERS=0) and once per pool size given,
+and each run reports logins/s and the cheap page's p50/p95 latency:
+
+    python benchmarks/login_throughput.py --threads 16 --workers 2,4 --seconds 5
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'unisupport-bench.sqlite'))
+
+from app import create_app
+from app.debug_utils import reset_db
+from app.passwords import hasher
+
+app = create_app()
+
+LOGIN = {'username': 'student1', 'password': 'password123', 'type': 'student'}
+
+
+def burst(threads, seconds):
+    stop = time.perf_counter() + seconds
+    logins = []
+    page_timings = []
+    lock = threading.Lock()
+
+    def log_in():
+        client = app.test_client()
+        while time.perf_counter() < stop:
+            response = client.post('/login', data=LOGIN)
+            # a failed login also redirects, back to the login page
+            ok = response.status_code == 302 and not response.location.endswith('/login')
+            with lock:
+                logins.append('ok' if ok else response.status_code)
+            client.get('/logout')
+
+    def browse():
+        client = app.test_client()
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            client.get('/')
+            page_timings.append((time.perf_counter() - started) * 1000)
+
+    workers = [threading.Thread(target=log_in) for _ in range(threads)] + [threading.Thread(target=browse)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    percentiles = statistics.quantiles(page_timings, n=100, method='inclusive')
+    return {
+        'logins_per_s': logins.count('ok') / seconds,
+        'refused': logins.count(503),
+        'page_p50_ms': percentiles[49],
+        'page_p95_ms': percentiles[94],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--workers', default=f'{os.cpu_count() or 1}', help='comma separated pool sizes to try')
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context(), contextlib.redirect_stdout(sys.stderr):
+        reset_db()
+
+    for workers in [0] + [int(w) for w in args.workers.split(',') if w]:
+        hasher.configure(app.config['PASSWORD_HASH_METHOD'], workers,
+                         app.config['PASSWORD_POOL_MAX_PENDING'], app.config['PASSWORD_POOL_TIMEOUT'])
+        result = burst(args.threads, args.seconds)
+        label = 'inline' if workers == 0 else f'{workers} workers'
+        print(f"{label:<11} {result['logins_per_s']:>7.1f} logins/s  {result['refused']:>4} refused  "
+              f"home p50 {result['page_p50_ms']:>7.2f}ms  p95 {result['page_p95_ms']:>7.2f}ms")
+    hasher.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Route-level benchmarks across data scales
+
+Seeds a scratch database at each scale with seed_synthetic, then drives the real
+routes through the Flask test client and records p50/p95/p99 latency, SQL statements
+per request and peak Python memory per request. Results are written as JSON, so two
+runs (e.g. two commits) can be compared to catch regressions:
+
+    python benchmarks/routes.py --scales small,medium --out before.json
+    python benchmarks/routes.py --scales small,medium --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Point the app at a scratch database before it is imported, so the dev database is left alone
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'unisupport-bench.sqlite'))
+
+import sqlalchemy as sa
+from app import create_app, db
+from app.models import User, Student, ApprovedReferrals
+from app.debug_utils import reset_db, seed_synthetic
+
+app = create_app()
+
+SCALES = {
+    'small': dict(students=100, counsellors=5, weeks=1, logs_per_student=10, referrals=20),
+    'medium': dict(students=5000, counsellors=20, weeks=2, logs_per_student=20, referrals=500),
+    'large': dict(students=50000, counsellors=100, weeks=4, logs_per_student=30, referrals=2000),
+}
+
+# (name, method, path, username the route is exercised as)
+ROUTES = [
+    ('tracker', 'GET', '/tracker', 'student'),
+    ('alerts', 'GET', '/alerts', 'counsellor1'),
+    ('book_appointment', 'GET', '/book/appointment', 'student'),
+    ('view_waitlist', 'GET', '/view_waitlist', 'wellbeing1'),
+    ('view_approved_referrals', 'GET', '/view_approved_referrals', 'wellbeing1'),
+    ('counsellor_appointments', 'GET', '/counsellor/appointments', 'counsellor1'),
+    ('login', 'POST', '/login', None),
+]
+
+
+def prepare(scale):
+    """Reset the scratch database and seed it at the given scale
+
+    Returns the username of a synthetic student who has logs and is approved for booking.
+    """
+    with app.app_context(), contextlib.redirect_stdout(sys.stderr):
+        reset_db()
+        seed_synthetic(**SCALES[scale])
+        student = db.session.scalar(
+            sa.select(Student).where(Student.username.like('load_student%')).order_by(Student.id)
+        )
+        # the last few students are approved, so the approved list has rows without the
+        # benchmark student also sitting on the waitlist
+        approved = db.session.scalars(
+            sa.select(Student).where(Student.username.like('load_student%')).order_by(Student.id.desc()).limit(50)
+        ).all()
+        for s in [student] + approved:
+            db.session.add(ApprovedReferrals(student_id=s.student_id, student_name=s.username,
+                                             referral_info='Benchmark approval',
+                                             referral_date=datetime.utcnow()))
+        db.session.commit()
+        return student.username
+
+
+def login_as(client, username):
+    with app.app_context():
+        role = db.session.scalar(sa.select(User.type).where(User.username == username))
+    response = client.post('/login', data={'username': username, 'password': 'password123', 'type': role})
+    assert response.status_code == 302, f'could not log in as {username}'
+
+
+def run_route(method, path, username, student, repeat, warmup, statements):
+    """Time one route, returning its latency percentiles, SQL count and peak memory"""
+    username = student if username == 'student' else username
+
+    if username is None:
+        # the login route is measured from a fresh, logged-out client each time
+        def request():
+            client = app.test_client()
+            return client.post(path, data={'username': student, 'password': 'password123', 'type': 'student'})
+    else:
+        client = app.test_client()
+        login_as(client, username)
+
+        def request():
+            return client.open(path, method=method)
+
+    for _ in range(warmup):
+        request()
+
+    timings = []
+    counts = []
+    status = None
+    for _ in range(repeat):
+        statements.clear()
+        started = time.perf_counter()
+        response = request()
+        timings.append((time.perf_counter() - started) * 1000)
+        counts.append(len(statements))
+        status = response.status_code
+
+    # memory is measured in a separate pass, because tracing skews the timings
+    tracemalloc.start()
+    request()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'status': status,
+        'requests': repeat,
+        'p50_ms': round(percentiles[49], 3),
+        'p95_ms': round(percentiles[94], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': max(counts),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run(scales, repeat, warmup, routes):
+    app.config['WTF_CSRF_ENABLED'] = False
+    statements = []
+    results = {}
+    with app.app_context():
+        db.engine.echo = False
+        sa.event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    for scale in scales:
+        print(f'Seeding {scale} dataset...', file=sys.stderr)
+        student = prepare(scale)
+        results[scale] = {}
+        for name, method, path, username in ROUTES:
+            if routes and name not in routes:
+                continue
+            result = run_route(method, path, username, student, repeat, warmup, statements)
+            results[scale][name] = result
+            print(f"  {scale:<7} {name:<26} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                  f"p99 {result['p99_ms']:>8.2f}ms  {result['queries']:>4} queries  {result['peak_kib']:>9.1f} KiB",
+                  file=sys.stderr)
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, threshold):
+    """Print the change against a baseline run and return the regressions found"""
+    regressions = []
+    for scale, routes in results.items():
+        for name, result in routes.items():
+            before = baseline.get('results', {}).get(scale, {}).get(name)
+            if before is None:
+                continue
+            ratio = result['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1
+            flags = []
+            if ratio > threshold:
+                flags.append(f'p95 x{ratio:.2f}')
+            if result['queries'] > before['queries']:
+                flags.append(f"queries {before['queries']} -> {result['queries']}")
+            print(f"  {scale:<7} {name:<26} p95 {before['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f}ms  "
+                  f"{'REGRESSION: ' + ', '.join(flags) if flags else 'ok'}")
+            if flags:
+                regressions.append((scale, name, flags))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='small,medium', help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument('--routes', default='', help='comma separated route names to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per route before timing')
+    parser.add_argument('--out', help='write the JSON results here')
+    parser.add_argument('--compare', help='baseline JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='p95 slowdown ratio counted as a regression when comparing')
+    args = parser.parse_args(argv)
+
+    scales = [scale for scale in args.scales.split(',') if scale]
+    results = run(scales, args.repeat, args.warmup, [r for r in args.routes.split(',') if r])
+    output = {
+        'meta': {
+            'commit': current_commit(),
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Comparing with {baseline['meta'].get('commit') or args.compare}:")
+        if compare(baseline, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Read/write concurrency of the production SQLite profile against the old defaults
+
+Runs the same mixed workload against two scratch databases. One uses SQLAlchemy's
+default settings (rollback journal, no pragmas). The other uses ProductionConfig's
+SQLITE_PRAGMAS and engine options. Reader threads page through the alerts feed while
+writer threads insert wellbeing logs, and the script reports reads/s, writes/s and
+lock errors for each:
+
+    python benchmarks/sqlite_profile.py --readers 8 --writers 2 --seconds 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'unisupport-bench.sqlite'))
+
+import sqlalchemy as sa
+from config import ProductionConfig
+from app import db
+from app.models import WellbeingLog
+from app.sqlite_pragmas import apply_sqlite_pragmas
+
+logs = WellbeingLog.__table__
+
+
+def make_engine(path, tuned):
+    if os.path.exists(path):
+        os.remove(path)
+    url = 'sqlite:///' + path
+    if not tuned:
+        return sa.create_engine(url)
+    engine = sa.create_engine(url, **ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS)
+    apply_sqlite_pragmas(engine, ProductionConfig.SQLITE_PRAGMAS)
+    return engine
+
+
+def seed(engine, rows):
+    db.metadata.create_all(engine)
+    start = datetime.utcnow() - timedelta(days=rows)
+    with engine.begin() as conn:
+        conn.execute(sa.insert(logs), [
+            dict(user_id=i % 500 + 1, mood=i % 10 + 1, symptoms='Benchmark', alert_flag=i % 10 < 3,
+                 date_logged=start + timedelta(minutes=i))
+            for i in range(rows)
+        ])
+
+
+def workload(engine, readers, writers, seconds):
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+    alerts_page = (
+        sa.select(logs).where(logs.c.alert_flag.is_(True))
+        .order_by(logs.c.date_logged.desc(), logs.c.id.desc()).limit(25)
+    )
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        while time.perf_counter() < stop:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(alerts_page).all()
+                count('reads')
+            except sa.exc.OperationalError:
+                count('errors')
+
+    def writer():
+        while time.perf_counter() < stop:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(sa.insert(logs).values(user_id=1, mood=2, symptoms='Benchmark write',
+                                                        alert_flag=True, date_logged=datetime.utcnow()))
+                count('writes')
+            except sa.exc.OperationalError:
+                count('errors')
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {key: value / seconds if key != 'errors' else value for key, value in counts.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=50000, help='wellbeing logs to seed first')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, tuned in (('default', False), ('production', True)):
+        engine = make_engine(os.path.join(tempfile.gettempdir(), f'unisupport-sqlite-{name}.sqlite'), tuned)
+        seed(engine, args.rows)
+        results[name] = workload(engine, args.readers, args.writers, args.seconds)
+        engine.dispose()
+        print(f"{name:<11} {results[name]['reads']:>9.0f} reads/s  {results[name]['writes']:>7.0f} writes/s  "
+              f"{results[name]['errors']:>4} lock errors")
+
+    for key in ('reads', 'writes'):
+        if results['default'][key]:
+            print(f"{key}: x{results['production'][key] / results['default'][key]:.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
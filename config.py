@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 class Config:
@@ -7,6 +8,199 @@ class Config:
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'data', 'uploads')
     MAX_CONTENT_LENGTH = 1 * 1024 * 1024
 
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'app', 'data', 'data.sqlite')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        'sqlite:///' + os.path.join(basedir, 'app', 'data', 'data.sqlite')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    # PRAGMAs run on every new SQLite connection, see app/sqlite_pragmas.py
+    SQLITE_PRAGMAS = {}
+    # set SQLALCHEMY_ECHO=1 to log every statement; normally only sampled slow ones are logged
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO') == '1'
+    SLOW_QUERY_THRESHOLD_MS = 100
+    SLOW_QUERY_SAMPLE_RATE = 1.0
+
+    # set QUERY_DEBUG=1 to count each request's statements, report N+1 lazy loads and
+    # check the endpoint budgets below (raising instead of logging if QUERY_BUDGET_STRICT)
+    QUERY_DEBUG = os.environ.get('QUERY_DEBUG') == '1'
+    QUERY_BUDGET_STRICT = False
+    QUERY_N_PLUS_ONE_THRESHOLD = 3
+    # the parts of the site this app serves, see app/views/; all listed ones are imported as the
+    # app is built, and the others never are
+    BLUEPRINTS = ['main', 'auth', 'referrals', 'wellbeing', 'appointments', 'data', 'api', 'admin']
+
+    # the pages under CONDITIONAL_GET spend one more query reading their table versions
+    QUERY_BUDGETS = {
+        'wellbeing.wellbeing_tracker': 3,
+        'wellbeing.view_alerts': 3,
+        # and one more when the free-time search reloads the slot index
+        'appointments.book_appointment': 5,
+        'appointments.view_appointment': 2,
+        'appointments.counsellor_appointments': 3,
+        'referrals.view_waitlist': 3,
+        # approved_referrals reads its version for the fragment cache instead
+        'referrals.approved_referrals': 3,
+    }
+
+    # Pages answered with 304 Not Modified when none of their tables has changed since the
+    # browser's copy, see app/conditional_get.py. The ETag also turns over every
+    # CONDITIONAL_GET_WINDOW seconds, well inside the CSRF token lifetime
+    CONDITIONAL_GET = {
+        'appointments.book_appointment': ('appointments', 'approved_referrals'),
+        'appointments.counsellor_appointments': ('appointments',),
+        'referrals.view_waitlist': ('counselling_waitlist',),
+        'wellbeing.view_alerts': ('wellbeing_logs',),
+    }
+    CONDITIONAL_GET_WINDOW = 600
+
+    # Rendered page sections shared by every viewer, see app/fragment_cache.py. 'memory'
+    # keeps them in each process; 'sqlite' shares them between worker processes
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'memory')
+    FRAGMENT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'unisupport-fragments.sqlite')
+    FRAGMENT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+    # JSON API for the mobile app, see app/views/api.py. Lists return API_PAGE_SIZE items
+    # unless ?limit= asks for up to API_MAX_PAGE_SIZE; bodies of API_GZIP_MIN_BYTES or more
+    # are gzipped for clients that accept it
+    API_PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 200
+    API_SYNC_MAX_LOGS = 500
+    API_GZIP_MIN_BYTES = 1024
+
+    # Password hashes are made and checked in a pool of worker processes, see app/passwords.py.
+    # Changing the method (or its work factor) upgrades stored hashes as users next log in
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:260000'
+    # On one CPU the pool only adds overhead (benchmarks/login_throughput.py ran slower), so hash inline there
+    PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS',
+                                               os.cpu_count() if (os.cpu_count() or 1) > 1 else 0))
+    PASSWORD_POOL_MAX_PENDING = 64
+    PASSWORD_POOL_TIMEOUT = 10
+
+    # last-login timestamps are buffered and written in batches, see app/last_login.py
+    LAST_LOGIN_FLUSH_INTERVAL = 5
+    LAST_LOGIN_FLUSH_SIZE = 200
+    LAST_LOGIN_SHUTDOWN_TIMEOUT = 5
+
+    # Alert rules run, in order, on every new wellbeing log, see app/alert_rules.py for the
+    # rules available and their parameters. A log is flagged if any of them fires
+    ALERT_RULES = [
+        ('low_mood', {'threshold': 3}),
+        ('consecutive_decline', {'count': 3}),
+        ('rolling_average', {'below': 4, 'min_logs': 3}),
+        ('baseline_drop', {'points': 3, 'min_logs': 5}),
+    ]
+    # weight of the newest mood in each student's moving-average baseline
+    ALERT_BASELINE_ALPHA = 0.2
+
+    # live alerts pushed to /alerts/stream, see app/alert_stream.py
+    ALERT_STREAM_HEARTBEAT = 15
+    ALERT_STREAM_QUEUE_SIZE = 100
+    ALERT_STREAM_BACKLOG = 500
+    ALERT_STREAM_MAX_SUBSCRIBERS = 100
+
+    # The waitlist is ordered by days waited plus the extra days each warning sign is worth:
+    # every flagged log in the last recent_days (up to max_alerts), and a 7-day average mood
+    # below low_mood_below
+    WAITLIST_TRIAGE = {
+        'recent_days': 14,
+        'days_per_alert': 7,
+        'max_alerts': 3,
+        'low_mood_below': 4,
+        'low_mood_days': 14,
+    }
+    WAITLIST_PER_PAGE = 25
+
+    # rows fetched from the cursor per chunk of a streamed /export download
+    EXPORT_BATCH_SIZE = 1000
+
+    # CSV imports, see app/importer.py. Uploads arrive in chunks below MAX_CONTENT_LENGTH,
+    # so files of any size can be imported. Unfinished uploads in UPLOAD_FOLDER may take up
+    # IMPORT_UPLOADS_MAX_BYTES between them, and are deleted once left for IMPORT_UPLOAD_MAX_AGE_HOURS
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_CHUNK_SIZE = 512 * 1024
+    IMPORT_MAX_ERRORS = 100
+    IMPORT_UPLOADS_MAX_BYTES = 2 * 1024 * 1024 * 1024
+    IMPORT_UPLOAD_MAX_AGE_HOURS = 24
+
+    # `flask materialize-slots` keeps this many weeks of bookable slots ahead of today
+    SLOT_HORIZON_WEEKS = 4
+    SLOT_MINUTES = 30
+    # the booking page's free-time search reads an in-memory copy of upcoming slots,
+    # reloaded this often (seconds) to see slots added by other processes
+    SLOT_INDEX_TTL = 60
+
+    # Background jobs, see app/jobs.py. `flask jobs worker` runs JOB_WORKER_THREADS at once,
+    # looking for due jobs every JOB_POLL_INTERVAL seconds. A failed job is tried again after
+    # JOB_BACKOFF_BASE seconds, doubling each time up to JOB_BACKOFF_MAX, until it has had
+    # JOB_MAX_ATTEMPTS tries. One still running after JOB_LEASE seconds is taken to have lost
+    # its worker and is run again
+    JOB_WORKER_THREADS = 4
+    JOB_POLL_INTERVAL = 1.0
+    JOB_MAX_ATTEMPTS = 5
+    JOB_BACKOFF_BASE = 10
+    JOB_BACKOFF_MAX = 60 * 60
+    JOB_LEASE = 30 * 60
+    JOB_RETENTION_DAYS = 7
+    # recurring tasks the worker schedules as it starts, with the seconds between runs
+    JOB_SCHEDULE = {
+        'materialize_slots': 60 * 60,
+        # alerts age out of the waitlist's recent window a day at a time
+        'refresh_priorities': 60 * 60,
+        'prune_jobs': 24 * 60 * 60,
+        'prune_uploads': 60 * 60,
+    }
+    # the jobs page reports wait and run times of the jobs finished in this many hours
+    JOB_STATS_HOURS = 24
+
+    ALERTS_PER_PAGE = 25
+    BOOKING_WINDOW_DAYS = 7
+    TRACKER_RECENT_LOGS = 20
+    MOOD_SERIES_MAX_POINTS = 120
+
+
+class DevelopmentConfig(Config):
+    pass
+
+
+class TestConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    # a scratch database, so running the tests never touches app/data/data.sqlite
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(tempfile.gettempdir(), 'unisupport-test.sqlite')
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+    }
+    UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'unisupport-test-uploads')
+    # hash inline with a cheap work factor so the suite stays fast
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_POOL_WORKERS = 0
+
+
+class ProductionConfig(Config):
+    SQLALCHEMY_ECHO = False
+    # WAL lets readers carry on while a write is in progress. With WAL, synchronous=NORMAL
+    # skips an fsync per commit. The database stays consistent, but a power cut may lose the last commits
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 10,
+        'pool_recycle': 3600,
+        'connect_args': {'timeout': 5, 'check_same_thread': False},
+    }
+
+
+# Chosen with the APP_CONFIG environment variable, defaulting to development
+config = {
+    'development': DevelopmentConfig,
+    'test': TestConfig,
+    'production': ProductionConfig,
+}
@@ -1,6 +1,12 @@
-from app import app, db
+from app import create_app, db
+from app.cli import register_cli
 import os
 
+# the development entry point, also used by the flask CLI (FLASK_APP=run.py); production
+# servers load wsgi.py instead
+app = create_app()
+register_cli(app)
+
 if __name__ == '__main__':
     print("Starting Flask application...")
     app.run(debug=True)
@@ -0,0 +1,4 @@
+import os
+
+# Use the test profile (and its scratch database) before the app is first imported
+os.environ.setdefault('APP_CONFIG', 'test')
@@ -3,15 +3,44 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import pytest
-from app import app, db
-from app.models import User, WellbeingLog, Appointment, Counsellor, Student
-from datetime import datetime, timedelta
+import csv
+import gzip
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app, db
+from app.models import User, WellbeingLog, Appointment, Counsellor, Student, ApprovedReferrals, MoodRollup, \
+    CounsellingWaitlist, AlertState, WellbeingStaff, CounsellorAvailability, Job, load_user
+from app.debug_utils import reset_db, seed_synthetic
+from app.query_budget import query_budget, track_queries, QueryBudgetExceeded
+from app.last_login import last_logins, LastLoginBuffer
+from app.importer import import_csv, prune_uploads, ImportFormatError
+from app.alert_stream import AlertBroker, AlertStreamFull, alert_broker, init_alert_stream
+from app.slot_index import slot_index
+from app.fragment_cache import fragment_cache, MemoryBackend, SQLiteBackend
+from app.jobs import JobWorker, enqueue, schedule_recurring, task
+from app.passwords import PasswordHasher, PasswordHasherBusy, POOL_CONTEXT
+from werkzeug.security import generate_password_hash
+import sqlalchemy as sa
+from datetime import datetime, timedelta, time as dt_time
+
+app = create_app('test')
+
+
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
     app.config['WTF_CSRF_ENABLED'] = False
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
 
+    # table versions start again with the database, so fragments cached by earlier tests would match
+    fragment_cache.clear()
+
     with app.app_context():
         db.drop_all()
         db.create_all()
@@ -154,4 +183,1188 @@ def test_non_student_cannot_access_referral_form(client):
 
     # Check for access denial message
     assert response.status_code == 200
-    assert b"Only students have access to the the counselling self-referral form." in response.data
\ No newline at end of file
+    assert b"Only students have access to the the counselling self-referral form." in response.data
+
+#positive test case for the alerts feed only sending one page at a time, with a cursor for the next
+def test_alerts_feed_is_paginated(client):
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        base = datetime(2024, 1, 1, 9, 0)
+        for i in range(30):
+            db.session.add(WellbeingLog(user_id=student.id, mood=2, symptoms=f'Low day {i}',
+                                        date_logged=base + timedelta(hours=i), alert_flag=True))
+        db.session.commit()
+        per_page = app.config['ALERTS_PER_PAGE']
+
+    client.post('/login', data={
+        'username': 'counsellor1',
+        'password': 'password123',
+        'type': 'counsellor'
+    }, follow_redirects=True)
+
+    response = client.get('/alerts')
+    assert response.data.count(b'Low day') == per_page
+    assert b'Low day 29' in response.data
+    assert b'Older alerts' in response.data
+
+    with app.app_context():
+        _, cursor = WellbeingLog.alerts_page(per_page=per_page)
+    response = client.get('/alerts', query_string={'before': cursor})
+    assert response.data.count(b'Low day') == 30 - per_page
+    assert b'Low day 0' in response.data
+    assert b'Older alerts' not in response.data
+
+    # the date filter is inclusive of the end day
+    response = client.get('/alerts', query_string={'start': '2024-01-02', 'end': '2024-01-02'})
+    assert response.data.count(b'Low day') == 15
+
+
+#positive test case for the booking calendar grouping slots by day and showing one week at a time
+def test_book_appointment_calendar_window(client):
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        counsellor = Counsellor.query.filter_by(username='counsellor1').first()
+        db.session.add(ApprovedReferrals(student_id=student.student_id, student_name='Student One',
+                                         referral_info='Anxiety', referral_date=datetime.utcnow()))
+        later = datetime.now() + timedelta(days=10)
+        db.session.add(Appointment(counsellor_id=counsellor.id, start_time=later,
+                                   end_time=later + timedelta(minutes=30), status='Available'))
+        db.session.commit()
+
+        calendar = Appointment.available_calendar(datetime.now(), datetime.now() + timedelta(days=7))
+        assert len(calendar) == 1
+        assert calendar[0].counsellors[0].counsellor.username == 'counsellor1'
+        assert len(calendar[0].counsellors[0].slots) == 1
+
+    login(client)
+    response = client.get('/book/appointment')
+    assert response.data.count(b'btn btn-sm btn-success') == 1
+
+    next_week = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+    response = client.get('/book/appointment', query_string={'week': next_week})
+    assert response.data.count(b'btn btn-sm btn-success') == 1
+    assert b'Previous week' in response.data
+
+
+#positive test case for role checks being answered from the session principal rather than the users tables
+def test_principal_avoids_user_queries(client):
+    login(client)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/tracker')
+            assert response.status_code == 200
+            assert not [s for s in statements if 'FROM users' in s]
+
+            # a full load still resolves the concrete subclass in a single statement
+            statements.clear()
+            student = load_user(User.query.filter_by(username='student1').first().id)
+            assert isinstance(student, Student)
+            assert len(statements) == 2
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', record)
+
+
+#positive test case for the mood series endpoint serving rollups kept up to date on each new log
+def test_mood_series_rollups(client):
+    login(client)
+    for mood in (2, 6, 7):
+        client.post('/tracker', data={'mood': mood, 'symptoms': 'Tired today'})
+
+    response = client.get('/tracker/series?period=week')
+    points = response.get_json()['points']
+    assert len(points) == 1
+    assert points[0]['count'] == 3
+    assert (points[0]['min'], points[0]['avg'], points[0]['max']) == (2, 5, 7)
+    assert points[0]['alerts'] == 1
+
+    # the set-based rebuild agrees with the incrementally maintained rows
+    with app.app_context():
+        MoodRollup.rebuild()
+    assert client.get('/tracker/series?period=week').get_json()['points'] == points
+
+    # asking for no points, or fewer, still gets at least one
+    for asked in (0, -3):
+        assert client.get(f'/tracker/series?period=week&points={asked}').get_json()['points'] == points
+
+
+#positive test case for the synthetic load-test seeder producing the requested, repeatable volumes
+def test_seed_synthetic_sizes(client):
+    def seed():
+        reset_db()
+        seed_synthetic(students=20, counsellors=2, weeks=2, logs_per_student=5, referrals=3, seed=7)
+        return db.session.scalars(sa.select(WellbeingLog.mood).order_by(WellbeingLog.user_id, WellbeingLog.date_logged)).all()
+
+    with app.app_context():
+        moods = seed()
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(Student)) == 21
+        assert len(moods) == 100
+        assert all(1 <= mood <= 10 for mood in moods)
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(CounsellingWaitlist)) == 3
+        assert db.session.scalar(sa.select(sa.func.sum(MoodRollup.log_count)).where(MoodRollup.period == 'month')) == 100
+
+        # the same seed gives the same data
+        assert seed() == moods
+
+        # the bulk-loaded logs were run through the alert rules, as if they had been logged one by one
+        assert db.session.scalar(sa.select(sa.func.sum(AlertState.log_count))) == 100
+        synthetic = db.session.scalars(
+            sa.select(WellbeingLog).join(User, User.id == WellbeingLog.user_id)
+            .where(User.username.like('load_student%')).order_by(WellbeingLog.user_id, WellbeingLog.date_logged)
+        ).all()
+        replay = Student(username='replay', email='replay@example.com', type='student', student_id='replay')
+        db.session.add(replay)
+        db.session.flush()
+        replayed = []
+        for i, log in enumerate(synthetic):
+            if i and synthetic[i - 1].user_id != log.user_id:
+                # start each synthetic student's history afresh
+                db.session.execute(sa.delete(AlertState).where(AlertState.user_id == replay.id))
+            live = WellbeingLog(user_id=replay.id, mood=log.mood, date_logged=log.date_logged)
+            db.session.add(live)
+            db.session.flush()
+            replayed.append((live.alert_flag, live.alert_reason))
+        assert [(bool(log.alert_flag), log.alert_reason) for log in synthetic] == replayed
+        assert len(synthetic) == 100 and any(flag for flag, _ in replayed)
+        db.session.rollback()
+
+
+#positive test case for request and SQL metrics being exposed in Prometheus format
+def test_metrics_endpoint(client, caplog):
+    login(client)
+    client.get('/tracker')
+
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+    try:
+        with caplog.at_level('WARNING', logger='app.slow_queries'):
+            client.get('/view_appointment')
+    finally:
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = 100
+    assert any('Slow query' in record.message and 'view_appointment' in record.message for record in caplog.records)
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_bucket{endpoint="wellbeing.wellbeing_tracker",method="GET",le="+Inf"}' in body
+    assert 'http_requests_total{endpoint="wellbeing.wellbeing_tracker",method="GET",status="200"}' in body
+    assert 'db_queries_total{endpoint="wellbeing.wellbeing_tracker"}' in body
+
+
+#negative test case for the query budget catching a relationship lazy-loaded in a loop (N+1)
+def test_query_budget_detects_n_plus_one(client):
+    with app.app_context():
+        for i in range(3):
+            student = Student(username=f'extra{i}', email=f'extra{i}@example.com', student_id=f'9000{i}')
+            db.session.add(student)
+            db.session.flush()
+            db.session.add(WellbeingLog(user_id=student.id, mood=5, symptoms='Fine'))
+        db.session.commit()
+        db.session.expunge_all()
+
+        logs = WellbeingLog.query.all()
+        with pytest.raises(QueryBudgetExceeded) as excinfo:
+            with query_budget(10):
+                [log.student.username for log in logs]
+        assert 'N+1: 3x' in str(excinfo.value)
+        assert 'test_features.py' in str(excinfo.value)
+
+
+#positive test case for appointment pages loading their related users eagerly, within budget
+def test_appointment_pages_within_query_budget(client):
+    with app.app_context():
+        counsellor = Counsellor.query.filter_by(username='counsellor1').first()
+        for i in range(3):
+            student = Student(username=f'booked{i}', email=f'booked{i}@example.com', student_id=f'8000{i}')
+            db.session.add(student)
+            db.session.flush()
+            start = datetime.now() + timedelta(days=2, hours=i)
+            db.session.add(Appointment(student_id=student.id, counsellor_id=counsellor.id, start_time=start,
+                                       end_time=start + timedelta(minutes=30), status='Booked', reason='Talk'))
+        db.session.commit()
+        budget = app.config['QUERY_BUDGETS']['appointments.counsellor_appointments']
+
+    client.post('/login', data={
+        'username': 'counsellor1',
+        'password': 'password123',
+        'type': 'counsellor'
+    }, follow_redirects=True)
+    with query_budget(budget):
+        response = client.get('/counsellor/appointments')
+    assert response.data.count(b'booked') == 3
+
+
+#negative test case for concurrent bookings: hundreds of racing requests never double-book a slot
+def test_concurrent_booking_never_double_books(client):
+    slot_count, students_per_slot = 20, 10
+    with app.app_context():
+        counsellor = Counsellor.query.filter_by(username='counsellor1').first()
+        student_ids = []
+        for i in range(students_per_slot):
+            student = Student(username=f'racer{i}', email=f'racer{i}@example.com', student_id=f'7000{i}')
+            db.session.add(student)
+            db.session.flush()
+            student_ids.append(student.id)
+        slot_ids = []
+        for i in range(slot_count):
+            start = datetime.now() + timedelta(days=3, minutes=30 * i)
+            slot = Appointment(counsellor_id=counsellor.id, start_time=start,
+                               end_time=start + timedelta(minutes=30), status='Available')
+            db.session.add(slot)
+            db.session.flush()
+            slot_ids.append(slot.id)
+        db.session.commit()
+
+    def attempt(slot_id, student_id):
+        with app.app_context():
+            return slot_id, Appointment.book(slot_id, student_id, 'Race')
+
+    attempts = [(slot_id, student_id) for student_id in student_ids for slot_id in slot_ids]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda args: attempt(*args), attempts))
+    elapsed = time.perf_counter() - started
+
+    winners = Counter(slot_id for slot_id, booked in results if booked)
+    assert len(attempts) == 200
+    assert set(winners) == set(slot_ids)
+    assert max(winners.values()) == 1
+    print(f"\n{len(attempts)} concurrent booking attempts, {len(winners)} bookings, "
+          f"{len(attempts) / elapsed:.0f} attempts/s")
+
+    with app.app_context():
+        booked = Appointment.query.filter(Appointment.id.in_(slot_ids), Appointment.status == 'Booked').count()
+        assert booked == slot_count
+
+
+#positive test case for the production SQLite profile: each new connection gets the PRAGMAs
+def test_production_sqlite_pragmas(tmp_path):
+    from config import ProductionConfig
+    from app.sqlite_pragmas import apply_sqlite_pragmas
+
+    engine = sa.create_engine('sqlite:///' + str(tmp_path / 'prod.sqlite'), **ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS)
+    apply_sqlite_pragmas(engine, ProductionConfig.SQLITE_PRAGMAS)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+    engine.dispose()
+
+
+#positive test case for password hashing: an old-style hash is upgraded on a successful login
+def test_login_upgrades_password_hash(client):
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        student.password_hash = generate_password_hash('password123', 'pbkdf2:sha256:500')
+        db.session.commit()
+
+    response = login(client)
+    assert b'Invalid password' not in response.data
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        assert student.password_hash.startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+        assert student.check_password('password123')
+
+
+#negative test case for the password pool: hashing runs in worker processes and a full queue is refused
+def test_password_pool_bounds_pending_work():
+    pool = PasswordHasher('pbkdf2:sha256:1000', workers=1, max_pending=1, timeout=0.1)
+    try:
+        pwhash = pool.hash('secret')
+        assert pool.verify(pwhash, 'secret') and not pool.verify(pwhash, 'wrong')
+        assert not pool.needs_rehash(pwhash)
+        assert pool.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:2000'))
+        # workers aren't forked from this multi-threaded process
+        assert POOL_CONTEXT.get_start_method() != 'fork'
+
+        pool.slots.acquire()
+        with pytest.raises(PasswordHasherBusy):
+            pool.verify(pwhash, 'secret')
+        pool.slots.release()
+    finally:
+        pool.shutdown()
+
+    # a check that outlasts the timeout is a 503-able PasswordHasherBusy, not a 500
+    slow = PasswordHasher('pbkdf2:sha256:500000', workers=1, max_pending=1, timeout=0.01)
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            slow.hash('secret')
+    finally:
+        slow.shutdown()
+
+
+#positive test case for last-login write-behind: logins are buffered, then written in one batch
+def test_last_login_is_written_behind(client):
+    # stop the writer thread, so only the explicit flush below writes anything
+    last_logins.shutdown()
+    interval = last_logins.flush_interval
+    last_logins.flush_interval = 3600
+    # the shutdown flushed logins left over from earlier tests, whose user ids are reused here
+    with app.app_context():
+        db.session.execute(sa.update(User).values(last_login=None))
+        db.session.commit()
+    try:
+        with track_queries() as tracker:
+            login(client)
+        assert not any(q.statement.lstrip().upper().startswith('UPDATE USERS') for q in tracker.queries)
+        with app.app_context():
+            assert db.session.scalar(sa.select(User.last_login).where(User.username == 'student1')) is None
+
+        client.get('/logout')
+        login(client)
+        assert last_logins.flush() == 1
+        with app.app_context():
+            assert db.session.scalar(sa.select(User.last_login).where(User.username == 'student1')) is not None
+    finally:
+        last_logins.shutdown()
+        last_logins.flush_interval = interval
+
+
+#negative test case for last-login shutdown: a writer stuck past the timeout is left to finish, not raced
+def test_last_login_shutdown_leaves_a_busy_writer(caplog):
+    release = threading.Event()
+    writes = []
+
+    class SlowEngine:
+        @contextmanager
+        def begin(self):
+            release.wait(5)
+            yield SimpleNamespace(execute=lambda statement, rows: writes.append(rows))
+
+    buffer = LastLoginBuffer()
+    buffer.configure(SlowEngine(), flush_interval=0.01, flush_size=100, shutdown_timeout=0.05)
+    buffer.record(1, datetime(2024, 3, 1))
+    time.sleep(0.05)
+    buffer.record(2, datetime(2024, 3, 1))
+    buffer.shutdown()
+    assert buffer.stopping and buffer.thread.is_alive() and 'abandoning the final flush' in caplog.text
+    release.set()
+    buffer.thread.join(5)
+    assert not buffer.thread.is_alive()
+    # the writer flushed what was left on its way out
+    assert sorted(row['user_id'] for rows in writes for row in rows) == [1, 2]
+
+
+#positive test case for the alert rules: stateful rules fire from the per-student state, not the history
+def test_alert_rules_use_rolling_state(client):
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        base = datetime(2024, 3, 1, 9, 0)
+        moods = [8, 8, 8, 8, 8, 8, 7, 6, 4]
+        for i, mood in enumerate(moods):
+            db.session.add(WellbeingLog(user_id=student.id, mood=mood, date_logged=base + timedelta(days=i)))
+            db.session.commit()
+        logs = WellbeingLog.query.filter_by(user_id=student.id).order_by(WellbeingLog.date_logged).all()
+        # the third decline in a row (7, 6, 4) fires, and 4 is also over 3 points under the baseline
+        assert [log.alert_flag for log in logs] == [False] * 8 + [True]
+        assert 'fell 3 times' in logs[-1].alert_reason and 'usual' in logs[-1].alert_reason
+
+        state = db.session.get(AlertState, student.id)
+        assert state.log_count == len(moods) and state.decline_streak == 3
+        assert state.window_average() == (sum(moods[-7:]) / 7, 7)
+
+        # one read and one write of the state per insert, however long the history
+        with track_queries() as tracker:
+            db.session.add(WellbeingLog(user_id=student.id, mood=5, date_logged=base + timedelta(days=20)))
+            db.session.commit()
+        assert sum('alert_states' in q.statement for q in tracker.queries) == 2
+        state = db.session.get(AlertState, student.id)
+        assert state.window_average() == (5, 1)
+
+
+#positive test case for the alert stream: a flagged log reaches staff, and reconnecting resumes after Last-Event-ID
+def test_alert_stream_pushes_new_alerts(client):
+    # start from an empty backlog, since log ids are reused by each test's fresh database
+    init_alert_stream(app)
+    login(client)
+    client.post('/tracker', data={'mood': 2, 'symptoms': 'Struggling'}, follow_redirects=True)
+    assert client.get('/alerts/stream').status_code == 403
+    client.get('/logout')
+
+    client.post('/login', data={'username': 'counsellor1', 'password': 'password123', 'type': 'counsellor'})
+    with app.app_context():
+        log = WellbeingLog.query.filter_by(symptoms='Struggling').first()
+    response = client.get('/alerts/stream', headers={'Last-Event-ID': str(log.id - 1)})
+    assert response.mimetype == 'text/event-stream'
+    chunks = (chunk.decode() for chunk in response.response)
+    assert next(chunks).startswith('retry:')
+    event = next(chunks)
+    assert f'id: {log.id}\nevent: alert\n' in event and 'Struggling' in event
+    response.close()
+    assert not alert_broker.subscribers
+
+    # clients that can't set headers resume from the query string; junk ids start afresh
+    response = client.get(f'/alerts/stream?last_event_id={log.id - 1}', headers={'Last-Event-ID': 'junk'})
+    chunks = (chunk.decode() for chunk in response.response)
+    next(chunks)
+    assert f'id: {log.id}\n' in next(chunks)
+    response.close()
+    for last_event_id in ('0', 'soon'):
+        response = client.get(f'/alerts/stream?last_event_id={last_event_id}')
+        assert response.status_code == 200
+        response.close()
+    assert not alert_broker.subscribers
+
+
+#negative test case for the alert broker: a slow subscriber is dropped without holding up the others
+def test_alert_broker_drops_slow_subscribers():
+    broker = AlertBroker(queue_size=2, backlog=3, max_subscribers=2)
+    slow, fast = broker.subscribe(), broker.subscribe()
+    with pytest.raises(AlertStreamFull):
+        broker.subscribe()
+
+    for event_id in (1, 2, 3):
+        broker.publish(event_id, {'id': event_id})
+        if event_id < 3:
+            assert fast.queue.get_nowait()[0] == event_id
+    assert slow.closed and not fast.closed
+
+    # resuming replays what the backlog still has, or asks for a reload once it has moved on
+    assert [m[0] for m in list(broker.subscribe(last_event_id=1).queue.queue)] == [2, 3]
+    broker.publish(4, {'id': 4})
+    broker.unsubscribe(fast)
+    assert list(broker.subscribe(last_event_id=0).queue.queue)[0][1] == 'reload'
+
+
+#negative test case for the alert broker: alerts committed out of id order are still replayed on resume
+def test_alert_broker_orders_backlog_by_id():
+    broker = AlertBroker(queue_size=10, backlog=3, max_subscribers=2)
+    for event_id in (41, 43, 42):
+        broker.publish(event_id, {'id': event_id})
+    assert [m[0] for m in broker.backlog] == [41, 42, 43]
+    # a client that last saw 41 gets 42 as well as 43
+    assert [m[0] for m in list(broker.subscribe(last_event_id=41).queue.queue)] == [42, 43]
+
+    broker.publish(45, {'id': 45})
+    assert broker.evicted_through == 41 and [m[0] for m in broker.backlog] == [42, 43, 45]
+    # 40 is older than the whole backlog, so it is counted as evicted, not kept
+    broker.publish(40, {'id': 40})
+    assert broker.evicted_through == 41 and [m[0] for m in broker.backlog] == [42, 43, 45]
+    broker.publish(44, {'id': 44})
+    assert broker.evicted_through == 42 and [m[0] for m in broker.backlog] == [43, 44, 45]
+
+
+#positive test case for the waitlist: oldest referrals first, but recent alerts move a student up
+def test_waitlist_is_prioritised_and_paginated(client):
+    with app.app_context():
+        now = datetime.utcnow()
+        students = []
+        for i in range(30):
+            student = Student(username=f'waiting{i}', email=f'waiting{i}@example.com', student_id=f'5000{i}')
+            db.session.add(student)
+            students.append(student)
+        db.session.flush()
+        for i, student in enumerate(students):
+            # waiting0 has waited longest, waiting29 was referred today
+            db.session.add(CounsellingWaitlist(student_id=student.student_id, student_name=student.username,
+                                               referral_info='Referral', referral_date=now - timedelta(days=30 - i)))
+        db.session.commit()
+        # three flagged logs are worth 3 x 7 days and the low average another 14, so the newest
+        # referral jumps ahead of everyone
+        for mood in (2, 2, 2):
+            db.session.add(WellbeingLog(user_id=students[29].id, mood=mood))
+            db.session.commit()
+        ordered = db.session.scalars(CounsellingWaitlist.by_priority()).all()
+        assert ordered[0].student_name == 'waiting29' and ordered[0].triage_days == 3 * 7 + 14
+        assert [r.student_name for r in ordered[1:4]] == ['waiting0', 'waiting1', 'waiting2']
+
+        # a full refresh agrees with the incremental updates
+        keys = {r.student_id: r.priority_key for r in ordered}
+        CounsellingWaitlist.refresh_priorities()
+        assert {r.student_id: r.priority_key for r in CounsellingWaitlist.query.all()} == pytest.approx(keys)
+
+        staff = WellbeingStaff(username='staff1', email='staff1@example.com')
+        staff.set_password('password123')
+        db.session.add(staff)
+        db.session.commit()
+
+    client.post('/login', data={'username': 'staff1', 'password': 'password123', 'type': 'wellbeing_staff'})
+    with query_budget(app.config['QUERY_BUDGETS']['referrals.view_waitlist']):
+        response = client.get('/view_waitlist')
+    assert response.data.count(b'Approve</button>') == app.config['WAITLIST_PER_PAGE']
+    assert response.data.index(b'waiting29') < response.data.index(b'waiting0')
+    assert b'waiting28' not in response.data
+    assert b'waiting28' in client.get('/view_waitlist?page=2').data
+
+
+#positive test case for the waitlist: the recurring refresh lets alerts age out of a referral's priority
+def test_waitlist_priorities_age_out(client):
+    with app.app_context():
+        student = db.session.scalar(sa.select(Student).where(Student.username == 'student1'))
+        db.session.add(CounsellingWaitlist(student_id=student.student_id, student_name=student.username,
+                                           referral_info='Referral'))
+        db.session.commit()
+        for mood in (2, 2, 2):
+            db.session.add(WellbeingLog(user_id=student.id, mood=mood))
+            db.session.commit()
+        referral = db.session.get(CounsellingWaitlist, student.student_id)
+        assert referral.triage_days == 3 * 7 + 14
+        key = referral.priority_key
+
+        # three weeks on, the alerts and the low week are no longer recent
+        weeks_ago = datetime.utcnow().date() - timedelta(days=21)
+        db.session.execute(sa.update(MoodRollup).where(MoodRollup.period == 'day').values(period_start=weeks_ago))
+        db.session.execute(sa.update(AlertState).values(window_end=weeks_ago))
+        db.session.commit()
+        assert 'refresh_priorities' in app.config['JOB_SCHEDULE']
+        enqueue('refresh_priorities')
+        db.session.commit()
+        assert JobWorker(app, threads=1, poll_interval=0.01, burst=True).run() == 1
+        db.session.expire_all()
+        referral = db.session.get(CounsellingWaitlist, student.student_id)
+        assert referral.triage_days == 0 and referral.priority_key == pytest.approx(key - 3 * 7 - 14)
+
+
+#positive test case for bulk approval: a selection or a filter moves in a fixed number of statements
+def test_bulk_approve_referrals(client):
+    with app.app_context():
+        now = datetime.utcnow()
+        for i in range(40):
+            student = Student(username=f'bulk{i}', email=f'bulk{i}@example.com', student_id=f'6000{i}')
+            db.session.add(student)
+            db.session.flush()
+            db.session.add(CounsellingWaitlist(student_id=student.student_id, student_name=student.username,
+                                               referral_info='Referral', referral_date=now - timedelta(days=40 - i)))
+        db.session.add(ApprovedReferrals(student_id=60000, student_name='bulk0', referral_info='Earlier',
+                                         referral_date=now - timedelta(days=50)))
+        staff = WellbeingStaff(username='staff1', email='staff1@example.com')
+        staff.set_password('password123')
+        db.session.add(staff)
+        db.session.commit()
+
+        with pytest.raises(ValueError):
+            ApprovedReferrals.approve_many()
+
+    client.post('/login', data={'username': 'staff1', 'password': 'password123', 'type': 'wellbeing_staff'})
+    response = client.post('/approve_referrals', data={'student_ids': ['60001', '60002']}, follow_redirects=True)
+    assert b'2 referrals approved' in response.data
+
+    # the 20 oldest remaining referrals (bulk0 was approved before) move in the same few statements
+    with track_queries() as tracker:
+        response = client.post('/approve_referrals',
+                               data={'referred_before': (now - timedelta(days=17)).strftime('%Y-%m-%d')},
+                               follow_redirects=True)
+    assert b'20 referrals approved' in response.data and b'1 were already approved' in response.data
+    statements = [q.statement.lstrip() for q in tracker.queries]
+    assert sum(s.startswith(('INSERT', 'DELETE')) and 'table_versions' not in s for s in statements) == 2
+    # plus one counting the change to both tables, for conditional GETs
+    assert sum(s.startswith('INSERT INTO table_versions') for s in statements) == 1
+
+    with app.app_context():
+        assert CounsellingWaitlist.query.count() == 17
+        assert ApprovedReferrals.query.count() == 23
+        assert db.session.get(ApprovedReferrals, 60000).referral_info == 'Earlier'
+
+    # given both, only the ticked referrals from before the date: bulk23 was referred 17 days
+    # ago, bulk24 16 and bulk25 15
+    response = client.post('/approve_referrals', data={'student_ids': ['600023', '600024', '600025'],
+                                                       'referred_before': (now - timedelta(days=15)).strftime('%Y-%m-%d')},
+                           follow_redirects=True)
+    assert b'2 referrals approved' in response.data
+    with app.app_context():
+        assert db.session.get(CounsellingWaitlist, 600025) is not None
+
+    # with CSRF protection on, as outside the tests, a post without the page's token does nothing
+    app.config['WTF_CSRF_ENABLED'] = True
+    try:
+        assert b'name="csrf_token"' in client.get('/view_waitlist').data
+        response = client.post('/approve_referrals', data={'student_ids': ['600025']}, follow_redirects=True)
+        assert b'The form has expired' in response.data
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        assert CounsellingWaitlist.query.count() == 15
+
+
+#positive test case for exports: rows stream out in batches as CSV or NDJSON, within the date range
+def test_streaming_exports(client):
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        base = datetime(2024, 5, 1, 12, 0)
+        db.session.execute(sa.insert(WellbeingLog), [
+            dict(user_id=student.id, mood=5 + i % 5, symptoms=f'Entry, "{i}"', date_logged=base + timedelta(hours=i),
+                 alert_flag=i % 10 == 0)
+            for i in range(48)
+        ])
+        db.session.commit()
+
+    login(client)
+    assert client.get('/export/wellbeing_logs').status_code == 403
+    client.get('/logout')
+    client.post('/login', data={'username': 'counsellor1', 'password': 'password123', 'type': 'counsellor'})
+    assert client.get('/export/nothing').status_code == 404
+    assert client.get('/export/alerts?format=xml').status_code == 400
+
+    app.config['EXPORT_BATCH_SIZE'] = 10
+    try:
+        response = client.get('/export/wellbeing_logs?start=2024-05-02&end=2024-05-02')
+        assert response.is_streamed and response.mimetype == 'text/csv'
+        chunks = list(response.response)
+    finally:
+        app.config['EXPORT_BATCH_SIZE'] = 1000
+    assert len(chunks) == 3
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+    assert rows[0][:4] == ['id', 'user_id', 'date_logged', 'mood']
+    assert len(rows) == 1 + 24 and rows[1][2] == '2024-05-02T00:00:00' and rows[1][4] == 'Entry, "12"'
+
+    response = client.get('/export/alerts?format=ndjson')
+    alerts = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [a['symptoms'] for a in alerts] == ['Entry, "0"', 'Entry, "10"', 'Entry, "20"', 'Entry, "30"', 'Entry, "40"']
+
+
+#positive test case for imports: a file uploaded in chunks is imported in batches, with bad rows reported
+def test_chunked_student_import(client):
+    with app.app_context():
+        staff = WellbeingStaff(username='staff1', email='staff1@example.com')
+        staff.set_password('password123')
+        db.session.add(staff)
+        db.session.commit()
+    client.post('/login', data={'username': 'staff1', 'password': 'password123', 'type': 'wellbeing_staff'})
+
+    lines = ['username,email,student_id,course,year_of_study']
+    lines += [f'intake{i},intake{i}@example.com,8{i:05d},Nursing,1' for i in range(250)]
+    lines += ['student1,dup@example.com,899999,,', 'broken,not-an-email,899998,,', 'late,late@example.com,899997,,9']
+    data = ('\n'.join(lines) + '\n').encode()
+
+    upload = client.post('/import/uploads').get_json()
+    url = f"/import/uploads/{upload['upload_id']}"
+    chunk, offset = 1000, 0
+    while offset < len(data):
+        response = client.put(f'{url}?offset={offset}', data=data[offset:offset + chunk])
+        assert response.status_code == 200
+        offset = response.get_json()['size']
+    # a retried chunk is refused with the real size, so nothing is written twice
+    response = client.put(f'{url}?offset=0', data=data[:chunk])
+    assert response.status_code == 409 and response.get_json()['size'] == len(data)
+
+    app.config['IMPORT_BATCH_SIZE'] = 100
+    try:
+        with track_queries() as tracker:
+            result = client.post(f'{url}/students').get_json()
+    finally:
+        app.config['IMPORT_BATCH_SIZE'] = 1000
+    assert result['rows'] == 253 and result['inserted'] == 250 and result['error_count'] == 3
+    assert [e['line'] for e in result['errors']] == [252, 253, 254]
+    assert "username 'student1' already exists" in result['errors'][0]['message']
+    assert sum(q.statement.startswith('INSERT INTO users') for q in tracker.queries) == 3
+    assert not os.listdir(app.config['UPLOAD_FOLDER'])
+
+    with app.app_context():
+        assert Student.query.filter(Student.username.like('intake%')).count() == 250
+
+
+#negative test case for chunked imports: unreadable files, unknown uploads, a full upload folder and abandoned parts
+def test_import_upload_errors(client):
+    with app.app_context():
+        staff = WellbeingStaff(username='staff1', email='staff1@example.com')
+        staff.set_password('password123')
+        db.session.add(staff)
+        db.session.commit()
+    client.post('/login', data={'username': 'staff1', 'password': 'password123', 'type': 'wellbeing_staff'})
+    folder = app.config['UPLOAD_FOLDER']
+
+    def upload(data):
+        upload_id = client.post('/import/uploads').get_json()['upload_id']
+        assert client.put(f'/import/uploads/{upload_id}?offset=0', data=data).status_code == 200
+        return f'/import/uploads/{upload_id}'
+
+    # the file is decoded a block at a time, so the rows in the blocks before a
+    # non-UTF-8 byte are imported and counted in the 400
+    rows = ''.join(f'latin{i},latin{i}@example.com,7{i:05d}\n' for i in range(1000))
+    url = upload(b'username,email,student_id\n' + rows.encode() + b'caf\xe9,cafe@example.com,800000\n')
+    response = client.post(f'{url}/students')
+    assert response.status_code == 400
+    result = response.get_json()
+    assert 0 < result['inserted'] < 1000 and 'UTF-8' in result['failed']
+    assert client.post(f'{url}/students').status_code == 404
+    url = upload(b'username,email,student_id\ncaf\xe9,cafe@example.com,800000\n')
+    response = client.post(f'{url}/students')
+    assert response.status_code == 400 and 'UTF-8' in response.get_json()['error']
+    assert client.post('/import/uploads/not-an-id/students').status_code == 404
+
+    url = upload(b'username,email,student_id\n')
+    app.config['IMPORT_UPLOADS_MAX_BYTES'], limit = 10, app.config['IMPORT_UPLOADS_MAX_BYTES']
+    try:
+        assert client.post('/import/uploads').status_code == 507
+    finally:
+        app.config['IMPORT_UPLOADS_MAX_BYTES'] = limit
+
+    # an upload nobody finished is deleted by the prune job once it is old enough
+    assert prune_uploads(folder, 60 * 60) == 0
+    path = os.path.join(folder, os.listdir(folder)[0])
+    os.utime(path, (time.time() - 2 * 60 * 60,) * 2)
+    assert prune_uploads(folder, 60 * 60) == 1
+    assert not os.listdir(folder)
+    assert client.post(f'{url}/students').status_code == 404
+
+
+#negative test case for slot imports: unknown counsellors, bad times and existing slots are rejected
+def test_slot_import_validates_rows(client):
+    rows = [
+        'counsellor,start,end,duration',
+        'counsellor1,2030-01-07 09:00,,',
+        'counsellor1@example.com,2030-01-07 09:30,,45',
+        'counsellor1,2030-01-07 09:00,,',
+        'nobody,2030-01-07 11:00,,',
+        'counsellor1,2030-01-07 12:00,2030-01-07 11:00,',
+        'counsellor1,next tuesday,,',
+    ]
+    with app.app_context():
+        result = import_csv('slots', rows)
+        assert result.inserted == 2
+        assert [line for line, _ in result.errors] == [4, 5, 6, 7]
+        slot = Appointment.query.filter_by(start_time=datetime(2030, 1, 7, 9, 30)).one()
+        assert slot.end_time == datetime(2030, 1, 7, 10, 15) and slot.day == 'Monday' and slot.status == 'Available'
+        with pytest.raises(ImportFormatError):
+            import_csv('slots', ['counsellor,when'])
+
+
+#positive test case for slot materialisation: a rolling horizon, idempotent through the unique constraint
+def test_materialize_slots_is_idempotent(client):
+    with app.app_context():
+        counsellor = Counsellor.query.filter_by(username='counsellor1').first()
+        for day in ('Monday', 'Wednesday'):
+            db.session.add(CounsellorAvailability(counsellor_id=counsellor.id, day_of_week=day,
+                                                  start_time=dt_time(9, 0), end_time=dt_time(12, 15)))
+        db.session.commit()
+
+        # Monday 10:00, so only that day's 10:30, 11:00 and 11:30 slots are still ahead
+        now = datetime(2030, 1, 7, 10, 0)
+        assert Appointment.materialize_slots(weeks=2, now=now) == 3 + 6 + 6 + 6
+        with track_queries() as tracker:
+            assert Appointment.materialize_slots(weeks=2, now=now) == 0
+        assert sum(q.statement.startswith('INSERT') for q in tracker.queries) == 1
+
+        # extending the horizon only adds the new week
+        assert Appointment.materialize_slots(weeks=3, now=now) == 12
+        starts = db.session.scalars(sa.select(Appointment.start_time).where(Appointment.counsellor_id == counsellor.id,
+                                                                           Appointment.start_time >= now)).all()
+        assert len(starts) == len(set(starts)) == 33
+        assert min(starts) == datetime(2030, 1, 7, 10, 30)
+
+        with pytest.raises(sa.exc.IntegrityError):
+            db.session.add(Appointment(counsellor_id=counsellor.id, start_time=datetime(2030, 1, 9, 9, 0),
+                                       end_time=datetime(2030, 1, 9, 9, 30)))
+            db.session.commit()
+
+
+#negative test case for slot materialisation: runs racing each other never insert a slot twice
+def test_concurrent_materialize_slots_never_duplicates(client):
+    now = datetime(2030, 1, 7, 8, 0)
+    with app.app_context():
+        counsellor_id = Counsellor.query.filter_by(username='counsellor1').first().id
+        for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'):
+            db.session.add(CounsellorAvailability(counsellor_id=counsellor_id, day_of_week=day,
+                                                  start_time=dt_time(9, 0), end_time=dt_time(17, 0)))
+        db.session.commit()
+
+    def run(_):
+        with app.app_context():
+            with track_queries() as tracker:
+                created = Appointment.materialize_slots(weeks=4, now=now)
+            return created, [q.statement for q in tracker.queries if q.statement.startswith('INSERT')]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(run, range(8)))
+
+    # exact duplicates are left to the unique constraint, so a run that loses a race skips them
+    assert all('ON CONFLICT' in statement for _, statements in results for statement in statements)
+    assert sum(created for created, _ in results) == 4 * 5 * 16
+    with app.app_context():
+        starts = db.session.scalars(sa.select(Appointment.start_time)
+                                    .where(Appointment.counsellor_id == counsellor_id, Appointment.start_time >= now)
+                                    .order_by(Appointment.start_time)).all()
+    assert len(starts) == len(set(starts)) == 4 * 5 * 16
+    assert all(later - earlier >= timedelta(minutes=30) for earlier, later in zip(starts, starts[1:]))
+
+
+#negative test case for adding slots: overlapping a counsellor's existing slot is refused
+def test_add_slot_rejects_overlaps(client):
+    slot_index.invalidate()
+    client.post('/login', data={'username': 'counsellor1', 'password': 'password123', 'type': 'counsellor'})
+    day = (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d')
+
+    def add(start, end):
+        return client.post('/counsellor/add_slot', data={'start_time': f'{day} {start}', 'end_time': f'{day} {end}'},
+                           follow_redirects=True).data
+
+    assert b'New slot added successfully' in add('10:00', '11:00')
+    assert b'overlaps your slot' in add('10:30', '11:30')
+    assert b'overlaps your slot' in add('09:30', '10:01')
+    assert b'must end after it starts' in add('12:00', '12:00')
+    # touching end to start is not an overlap
+    assert b'New slot added successfully' in add('11:00', '11:30')
+    assert b'New slot added successfully' in add('09:30', '10:00')
+
+    with app.app_context():
+        slots = Appointment.query.filter(Appointment.start_time >= datetime.strptime(day, '%Y-%m-%d')).all()
+        assert len(slots) == 3
+        assert {slot.status for slot in slots} == {'Available'}
+        # the database check also catches slots the in-memory index hasn't seen
+        slot_index.invalidate()
+        start = datetime.strptime(f'{day} 10:15', '%Y-%m-%d %H:%M')
+        assert Appointment.find_overlap(slots[0].counsellor_id, start, start + timedelta(minutes=5)).start_time \
+            == datetime.strptime(f'{day} 10:00', '%Y-%m-%d %H:%M')
+
+
+#positive test case for the booking page's free-time search across counsellors
+def test_free_time_search(client):
+    slot_index.invalidate()
+    day = datetime.combine(datetime.now().date() + timedelta(days=2), dt_time.min)
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        db.session.add(ApprovedReferrals(student_id=student.student_id, student_name='Student One',
+                                         referral_info='Anxiety', referral_date=datetime.utcnow()))
+        first = Counsellor.query.filter_by(username='counsellor1').first()
+        second = Counsellor(username='counsellor2', email='counsellor2@example.com')
+        second.set_password('password123')
+        db.session.add(second)
+        db.session.flush()
+        for counsellor, hours in ((first, (9, 14, 15)), (second, (14, 16))):
+            for hour in hours:
+                start = day + timedelta(hours=hour)
+                db.session.add(Appointment(counsellor_id=counsellor.id, start_time=start, status='Available',
+                                           end_time=start + timedelta(minutes=30)))
+        db.session.commit()
+        taken = Appointment.query.filter_by(counsellor_id=first.id, start_time=day + timedelta(hours=15)).first().id
+
+    login(client)
+    client.post(f'/confirm_appointment/{taken}', data={'reason': 'Talk'})
+
+    response = client.get('/book/appointment', query_string={'on': day.strftime('%Y-%m-%d'), 'from': '14:00', 'to': '16:00'})
+    html = response.data.decode()
+    assert 'counsellor1' in html and 'counsellor2' in html
+    assert html.count('btn btn-sm btn-outline-success') == 2
+    assert f'/confirm_appointment/{taken}"' not in html
+
+    with app.app_context():
+        free = slot_index.free_between(day + timedelta(hours=14), day + timedelta(hours=16, minutes=30))
+        assert [(c.name, [s.start_time.hour for s in c.slots]) for c in free] == \
+            [('counsellor1', [14]), ('counsellor2', [14, 16])]
+
+    response = client.get('/book/appointment', query_string={'on': day.strftime('%Y-%m-%d'), 'from': '17:00', 'to': '18:00'})
+    assert b'No counsellor is free then' in response.data
+
+
+#positive test case for conditional GETs: an unchanged page is answered with 304 before the view runs
+def test_conditional_get_not_modified(client):
+    client.post('/login', data={'username': 'counsellor1', 'password': 'password123', 'type': 'counsellor'},
+                follow_redirects=True)
+    response = client.get('/counsellor/appointments')
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and response.headers['Cache-Control'] == 'private, no-cache'
+
+    with track_queries() as tracker:
+        response = client.get('/counsellor/appointments', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    assert [q.statement for q in tracker.queries if 'appointments' in q.statement] == []
+
+    # another page or query string has its own ETag
+    assert client.get('/counsellor/appointments?x=1', headers={'If-None-Match': etag}).status_code == 200
+
+    # a new slot changes the appointments table, and with it the ETag
+    day = (datetime.now() + timedelta(days=4)).strftime('%Y-%m-%d')
+    client.post('/counsellor/add_slot', data={'start_time': f'{day} 10:00', 'end_time': f'{day} 10:30'})
+    response = client.get('/counsellor/appointments', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and b'New slot added successfully' in response.data
+    # a page showing a flash message isn't given an ETag, as the message is shown once
+    assert 'ETag' not in response.headers
+    etag = client.get('/counsellor/appointments').headers['ETag']
+    assert client.get('/counsellor/appointments', headers={'If-None-Match': etag}).status_code == 304
+
+    # unrelated tables don't
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        db.session.add(WellbeingLog(user_id=student.id, mood=3, date_logged=datetime.now()))
+        db.session.commit()
+    assert client.get('/counsellor/appointments', headers={'If-None-Match': etag}).status_code == 304
+
+
+#negative test case for conditional GETs: an ETag from another user is never matched
+def test_conditional_get_is_per_principal(client):
+    login(client)
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        db.session.add(ApprovedReferrals(student_id=student.student_id, student_name='Student One',
+                                         referral_info='Anxiety', referral_date=datetime.utcnow()))
+        db.session.commit()
+    etag = client.get('/book/appointment').headers['ETag']
+    assert client.get('/book/appointment', headers={'If-None-Match': etag}).status_code == 304
+
+    client.get('/logout')
+    with app.app_context():
+        other = Student(username='student2', email='student2@example.com', student_id='54321')
+        other.set_password('password123')
+        db.session.add(other)
+        db.session.add(ApprovedReferrals(student_id='54321', student_name='Student Two',
+                                         referral_info='Stress', referral_date=datetime.utcnow()))
+        db.session.commit()
+    client.post('/login', data={'username': 'student2', 'password': 'password123', 'type': 'student'},
+                follow_redirects=True)
+    assert client.get('/book/appointment', headers={'If-None-Match': etag}).status_code == 200
+
+
+#positive test case for the fragment cache: many viewers cost one render, and a write renders it again
+def test_fragment_cache_shared_until_write(client):
+    with app.app_context():
+        for i in range(3):
+            db.session.add(CounsellingWaitlist(student_id=f'7000{i}', student_name=f'Waiting {i}',
+                                               referral_info='Stress', referral_date=datetime.utcnow()))
+        db.session.add(WellbeingStaff(username='staff1', email='staff1@example.com'))
+        db.session.add(WellbeingStaff(username='staff2', email='staff2@example.com'))
+        for staff in WellbeingStaff.query.all():
+            staff.set_password('password123')
+        db.session.commit()
+
+    def waitlist_queries(username):
+        viewer = app.test_client()
+        viewer.post('/login', data={'username': username, 'password': 'password123', 'type': 'wellbeing_staff'},
+                    follow_redirects=True)
+        with track_queries() as tracker:
+            response = viewer.get('/view_waitlist')
+        assert response.data.count(b'<td>Waiting ') == 3 - approved
+        return sum('FROM counselling_waitlist' in q.statement for q in tracker.queries)
+
+    approved = 0
+    assert waitlist_queries('staff1') > 0
+    assert waitlist_queries('staff2') == 0
+
+    client.post('/login', data={'username': 'staff1', 'password': 'password123', 'type': 'wellbeing_staff'})
+    client.post('/approve_referral/70001')
+    approved = 1
+    assert waitlist_queries('staff2') > 0
+    assert waitlist_queries('staff1') == 0
+
+
+#negative test case for the fragment cache backends: neither grows past its byte limit
+def test_fragment_cache_backends_are_bounded(tmp_path):
+    memory = MemoryBackend(max_bytes=10)
+    memory.set('a', 'x' * 4)
+    memory.set('b', 'y' * 4)
+    assert memory.get('a') == 'xxxx'
+    memory.set('c', 'z' * 4)
+    # 'b' was the least recently used
+    assert memory.get('b') is None and memory.get('a') == 'xxxx' and memory.size == 8
+    memory.set('huge', 'h' * 11)
+    assert memory.get('huge') is None
+
+    shared = SQLiteBackend(str(tmp_path / 'fragments.sqlite'), max_bytes=10)
+    shared.set('a', 'x' * 4)
+    time.sleep(0.01)
+    shared.set('b', 'y' * 4)
+    # another process sees the same fragments
+    assert SQLiteBackend(shared.path, max_bytes=10).get('a') == 'xxxx'
+    time.sleep(0.01)
+    shared.set('c', 'z' * 4)
+    assert shared.get('a') is None and shared.get('b') == 'yyyy' and shared.get('c') == 'zzzz'
+
+
+def api_login(client, username='student1', type='student'):
+    response = client.post('/api/v1/login', json={'username': username, 'password': 'password123', 'type': type})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+#negative test case for API sign-in: malformed bodies are 400s, wrong credentials 401s
+def test_api_login_rejects_bad_input(client):
+    good = {'username': 'student1', 'password': 'password123', 'type': 'student'}
+    for body in ([good], dict(good, username=['student1']), dict(good, password=123), dict(good, type=None),
+                 {'username': 'student1'}):
+        assert client.post('/api/v1/login', json=body).status_code == 400
+    assert client.post('/api/v1/login', data='not json').status_code == 400
+    assert client.post('/api/v1/login', json=dict(good, password='wrong')).status_code == 401
+    assert client.post('/api/v1/login', json=dict(good, type='counsellor')).status_code == 401
+    assert client.get('/api/v1/wellbeing-logs').status_code == 401
+
+
+#positive test case for the offline sync: one transaction, per-log results, alerts, and retries are safe
+def test_api_sync_wellbeing_logs(client):
+    assert client.get('/api/v1/wellbeing-logs').status_code == 401
+    api_login(client)
+    logs = [
+        {'client_ref': 'phone-1', 'mood': 7, 'date_logged': '2024-03-01T09:00:00+01:00'},
+        {'client_ref': 'phone-2', 'mood': 2, 'symptoms': 'Exams', 'date_logged': '2024-03-02T09:00:00'},
+        {'client_ref': 'phone-3', 'mood': 11},
+        {'client_ref': 'phone-1', 'mood': 7},
+        {'client_ref': 'phone-4', 'mood': True},
+    ]
+    response = client.post('/api/v1/wellbeing-logs/sync', json={'logs': logs})
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['created', 'created', 'invalid', 'duplicate', 'invalid']
+    assert results[0]['date_logged'] == '2024-03-01T08:00:00' and results[3]['id'] == results[0]['id']
+    assert 'mood' in results[2]['error']
+    # the alert rules still ran on each log
+    assert not results[0]['alert_flag'] and results[1]['alert_flag'] and results[1]['alert_reason']
+
+    # the phone didn't hear back and sends the same logs again
+    retry = client.post('/api/v1/wellbeing-logs/sync', json={'logs': logs[:2]}).get_json()['results']
+    assert [result['status'] for result in retry] == ['duplicate', 'duplicate']
+    assert [result['id'] for result in retry] == [results[0]['id'], results[1]['id']]
+    with app.app_context():
+        assert WellbeingLog.query.count() == 2
+
+    app.config['API_SYNC_MAX_LOGS'] = 1
+    try:
+        assert client.post('/api/v1/wellbeing-logs/sync', json={'logs': logs[:2]}).status_code == 413
+    finally:
+        app.config['API_SYNC_MAX_LOGS'] = 500
+    assert client.post('/api/v1/wellbeing-logs/sync', json={'logs': 'phone-1'}).status_code == 400
+
+
+#positive test case for the JSON API lists: cursors walk every item once, and large bodies are gzipped
+def test_api_cursor_pagination_and_gzip(client):
+    with app.app_context():
+        student = Student.query.filter_by(username='student1').first()
+        base = datetime(2024, 3, 1, 9, 0)
+        for i in range(40):
+            db.session.add(WellbeingLog(user_id=student.id, mood=6, symptoms='Fine', date_logged=base + timedelta(hours=i)))
+        db.session.commit()
+    api_login(client)
+
+    seen = []
+    cursor = None
+    while True:
+        response = client.get('/api/v1/wellbeing-logs', query_string={'limit': 15, 'cursor': cursor or ''})
+        assert response.headers.get('Content-Encoding') is None
+        page = response.get_json()
+        seen += [item['date_logged'] for item in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert len(seen) == 40 and seen == sorted(seen, reverse=True)
+
+    response = client.get('/api/v1/wellbeing-logs?limit=40', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in response.headers['Vary']
+    assert len(json.loads(gzip.decompress(response.data))['items']) == 40
+    small = client.get('/api/v1/wellbeing-logs?limit=1', headers={'Accept-Encoding': 'gzip'})
+    assert small.headers.get('Content-Encoding') is None and len(small.get_json()['items']) == 1
+
+    # counsellors page through their slots soonest first
+    client.post('/api/v1/logout')
+    api_login(client, 'counsellor1', 'counsellor')
+    with app.app_context():
+        counsellor = Counsellor.query.filter_by(username='counsellor1').first()
+        for hours in (3, 1):
+            start = datetime(2024, 3, 4, 9, 0) + timedelta(hours=hours)
+            db.session.add(Appointment(counsellor_id=counsellor.id, start_time=start, end_time=start + timedelta(hours=1),
+                                       status='Available', day=start.strftime('%A')))
+        db.session.commit()
+        expected = [a.id for a in Appointment.query.order_by(Appointment.start_time, Appointment.id)]
+    assert len(expected) == 3
+    first = client.get('/api/v1/appointments?limit=2').get_json()
+    rest = client.get('/api/v1/appointments', query_string={'limit': 2, 'cursor': first['next_cursor']}).get_json()
+    assert [a['id'] for a in first['items'] + rest['items']] == expected and rest['next_cursor'] is None
+    assert client.get('/api/v1/wellbeing-logs').status_code == 403
+
+
+job_calls = []
+
+
+@task('test_record')
+def record_task(label='recurring'):
+    job_calls.append(label)
+
+
+@task('test_flaky')
+def flaky_task(fail_times):
+    job_calls.append('flaky')
+    if job_calls.count('flaky') <= fail_times:
+        raise RuntimeError('flaky task failed')
+
+
+#positive test case for the job queue: priority order, retries with backoff, scheduled and recurring jobs
+def test_job_queue_runs_jobs(client):
+    job_calls.clear()
+    app.config['JOB_BACKOFF_BASE'] = 0
+    try:
+        with app.app_context():
+            enqueue('test_record', {'label': 'low'}, priority=0)
+            enqueue('test_record', {'label': 'high'}, priority=10)
+            later = enqueue('test_record', {'label': 'later'}, delay=3600)
+            flaky = enqueue('test_flaky', {'fail_times': 1}, max_attempts=3)
+            broken = enqueue('test_flaky', {'fail_times': 10}, priority=-1, max_attempts=2)
+            db.session.commit()
+            with pytest.raises(ValueError):
+                enqueue('no_such_task')
+            schedule_recurring({'test_record': 60})
+            # scheduling again, as each worker does when it starts, doesn't add a second pending run
+            schedule_recurring({'test_record': 60})
+            job_ids = (later.id, flaky.id, broken.id)
+
+        assert JobWorker(app, threads=1, poll_interval=0.01, burst=True).run() == 7
+        assert job_calls[:2] == ['high', 'low'] and 'later' not in job_calls
+        # the flaky job's two tries and the broken job's two
+        assert job_calls.count('flaky') == 4 and job_calls.count('recurring') == 1
+
+        with app.app_context():
+            later, flaky, broken = (db.session.get(Job, job_id) for job_id in job_ids)
+            assert later.status == 'queued' and later.attempts == 0
+            assert flaky.status == 'done' and flaky.attempts == 2
+            assert broken.status == 'failed' and broken.attempts == 2 and 'flaky task failed' in broken.last_error
+            # the recurring job ran once and queued its next run
+            recurring = Job.query.filter(Job.every.isnot(None)).order_by(Job.id).all()
+            assert [job.status for job in recurring] == ['done', 'queued']
+            assert recurring[1].run_at >= recurring[0].run_at + timedelta(seconds=60)
+
+            # a job whose worker died is claimed again once its lease is up
+            Job.query.filter_by(id=later.id).update({'status': 'running', 'started_at': datetime.utcnow() - timedelta(hours=1)})
+            db.session.commit()
+            assert Job.claim(lease=60).id == later.id
+            assert Job.claim(lease=60) is None
+    finally:
+        app.config['JOB_BACKOFF_BASE'] = 10
+
+
+#positive/negative test case for the jobs page: staff see depth and latency, students are turned away
+def test_jobs_page(client):
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.add(Job(name='materialize_slots', run_at=now - timedelta(seconds=5), status='queued'))
+        db.session.add(Job(name='materialize_slots', run_at=now - timedelta(minutes=1), status='done',
+                           started_at=now - timedelta(seconds=58), finished_at=now - timedelta(seconds=57)))
+        db.session.add(Job(name='prune_jobs', run_at=now, status='failed', attempts=5, finished_at=now,
+                           last_error='RuntimeError: disk full'))
+        db.session.add(WellbeingStaff(username='staff1', email='staff1@example.com'))
+        WellbeingStaff.query.first().set_password('password123')
+        db.session.commit()
+        stats = Job.stats(since=now - timedelta(hours=1))
+        slots = stats.tasks[0]
+        assert (slots.name, slots.ready, slots.runs, slots.wait_avg, slots.run_avg) == ('materialize_slots', 1, 1, 2, 1)
+        assert slots.oldest_ready >= 5 and stats.total('failed') == 1
+
+    login(client)
+    assert b'Background Jobs' not in client.get('/admin/jobs', follow_redirects=True).data
+    client.get('/logout')
+    client.post('/login', data={'username': 'staff1', 'password': 'password123', 'type': 'wellbeing_staff'})
+    page = client.get('/admin/jobs').data
+    assert b'1 due now' in page and b'materialize_slots' in page and b'disk full' in page
+
+
+#negative test case for slot writers: materialised and imported slots never overlap a counsellor's existing slots
+def test_slot_writers_skip_overlaps(client):
+    with app.app_context():
+        counsellor = Counsellor.query.filter_by(username='counsellor1').first()
+        db.session.add(CounsellorAvailability(counsellor_id=counsellor.id, day_of_week='Monday',
+                                              start_time=dt_time(10, 0), end_time=dt_time(11, 30)))
+        db.session.commit()
+        assert Appointment.add_slot(counsellor.id, datetime(2030, 1, 7, 10, 15), datetime(2030, 1, 7, 10, 45))
+        assert Appointment.add_slot(counsellor.id, datetime(2030, 1, 7, 10, 30), datetime(2030, 1, 7, 11, 0)) is None
+
+        # 10:00 and 10:30 would overlap the 10:15 slot; only 11:00 is free
+        assert Appointment.materialize_slots(weeks=1, now=datetime(2030, 1, 7, 9, 0)) == 1
+        slots = db.session.execute(sa.select(Appointment.start_time, Appointment.end_time)
+                                   .where(Appointment.counsellor_id == counsellor.id,
+                                          Appointment.start_time >= datetime(2030, 1, 7))
+                                   .order_by(Appointment.start_time)).all()
+        assert [start.strftime('%H:%M') for start, _ in slots] == ['10:15', '11:00']
+
+        result = import_csv('slots', [
+            'counsellor,start,end,duration',
+            'counsellor1,2030-01-07 09:50,,30',
+            'counsellor1,2030-01-07 09:00,,50',
+            'counsellor1,2030-01-07 09:30,,30',
+        ])
+        assert result.inserted == 1 and [line for line, _ in result.errors] == [2, 4]
+        assert '10:15' in result.errors[0][1]
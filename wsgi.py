@@ -0,0 +1,10 @@
+"""Entry point for production WSGI servers, e.g. gunicorn wsgi:app
+
+Builds just the web app: no CLI commands, Flask-Migrate or development seeding tools.
+Uses the production settings unless APP_CONFIG says otherwise.
+"""
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('APP_CONFIG', 'production'))